@@ -33,6 +33,70 @@ def create_app():
     login_manager.init_app(app)
     migrate.init_app(app, db)
 
+    #уведомления об изменениях между воркерами (LISTEN/NOTIFY на PostgreSQL) и живая HR статистика
+    from .utils.notifications import change_notifier
+    from .utils.live_stats import hr_stats_feed
+    change_notifier.init_app(app)
+    hr_stats_feed.init_app(app)
+
+    #шина сброса кэшей процессов поверх уведомлений об изменениях (PostgreSQL), Unix сокеты (INVALIDATION_TRANSPORT=socket) или локально
+    from .utils.invalidation import invalidation_bus
+    app.config['INVALIDATION_TRANSPORT'] = os.getenv(
+        'INVALIDATION_TRANSPORT',
+        'notifier' if (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('postgresql') else 'local'
+    ).lower()
+    app.config['INVALIDATION_TTL'] = int(os.getenv('INVALIDATION_TTL', 300))
+    if os.getenv('INVALIDATION_SOCKET_DIR'):
+        app.config['INVALIDATION_SOCKET_DIR'] = os.getenv('INVALIDATION_SOCKET_DIR')
+    invalidation_bus.init_app(app)
+
+    #кэш аналитики (TTL и размер берутся из ANALYTICS_CACHE_TTL / ANALYTICS_CACHE_MAXSIZE)
+    from .utils.cache import analytics_cache
+    app.config['ANALYTICS_CACHE_TTL'] = int(os.getenv('ANALYTICS_CACHE_TTL', 300))
+    app.config['ANALYTICS_CACHE_MAXSIZE'] = int(os.getenv('ANALYTICS_CACHE_MAXSIZE', 256))
+    analytics_cache.init_app(app)
+
+    #матрица оценок в памяти для аналитики (включается SCORE_MATRIX_ENABLED=true)
+    from .utils.score_matrix import score_matrix
+    app.config['SCORE_MATRIX_ENABLED'] = os.getenv('SCORE_MATRIX_ENABLED', 'False').lower() == 'true'
+    score_matrix.init_app(app)
+
+    #индекс похожести сотрудников поверх матрицы оценок
+    from .utils.similarity import similarity_index
+    similarity_index.init_app(app)
+
+    #кэш статистики дашборда по пользователям
+    from .utils.dashboard_stats import dashboard_stats
+    app.config['DASHBOARD_STATS_TTL'] = int(os.getenv('DASHBOARD_STATS_TTL', 60))
+    app.config['DASHBOARD_STATS_MAXSIZE'] = int(os.getenv('DASHBOARD_STATS_MAXSIZE', 1024))
+    dashboard_stats.init_app(app)
+
+    #запись истории оценок: слушатель ORM или триггеры PostgreSQL (режим по умолчанию для flask history-capture)
+    app.config['HISTORY_CAPTURE'] = os.getenv('HISTORY_CAPTURE', 'orm').lower()
+
+    #журнал истории: в транзакции изменения (sync) или фоновой записью пачками (async)
+    from .utils.journal import history_journal
+    app.config['HISTORY_JOURNAL'] = os.getenv('HISTORY_JOURNAL', 'sync').lower()
+    app.config['HISTORY_JOURNAL_MAXSIZE'] = int(os.getenv('HISTORY_JOURNAL_MAXSIZE', 10000))
+    app.config['HISTORY_JOURNAL_BATCH'] = int(os.getenv('HISTORY_JOURNAL_BATCH', 500))
+    if os.getenv('HISTORY_JOURNAL_FAILED_PATH'):
+        app.config['HISTORY_JOURNAL_FAILED_PATH'] = os.getenv('HISTORY_JOURNAL_FAILED_PATH')
+    history_journal.init_app(app)
+
+    #кэш компактных данных графиков навыков (ключи с версиями оценок и навыков)
+    from .utils.chart_data import chart_cache
+    app.config['CHART_CACHE_MAXSIZE'] = int(os.getenv('CHART_CACHE_MAXSIZE', 512))
+    chart_cache.init_app(app)
+
+    #префиксный индекс навыков для автодополнения
+    from .utils.skill_index import skill_index
+    skill_index.init_app(app)
+
+    #каталог навыков с числом оценок в памяти процесса (сброс через шину, запасной срок SKILL_CATALOG_TTL)
+    from .utils.skill_catalog import skill_catalog
+    app.config['SKILL_CATALOG_TTL'] = int(os.getenv('SKILL_CATALOG_TTL', 300))
+    skill_catalog.init_app(app)
+
     login_manager.login_view = 'auth.login'
     
     from .models import User
@@ -65,8 +129,33 @@ def create_app():
         db.session.rollback()
         return render_template('500.html'), 500
     
+    #служебные CLI команды
+    from .cli import register_commands
+    register_commands(app)
+
     with app.app_context():
         db.create_all()
 
+        #агрегаты HR аналитики строятся при первом запуске
+        from .utils.rollups import ensure_rollups
+        ensure_rollups()
+
+        #отдел на момент изменения в истории оценок (для динамики по отделам)
+        from .utils.trends import ensure_history_department
+        ensure_history_department()
+
+        #триграммные индексы поиска (PostgreSQL)
+        from .utils.search import ensure_search_indexes
+        try:
+            if ensure_search_indexes():
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Не удалось создать индексы pg_trgm: {e}")
+
+        #режим записи истории оценок - по триггерам, установленным в БД (flask history-capture)
+        from .utils.history import history_capture
+        history_capture.detect()
+
     return app
     
\ No newline at end of file
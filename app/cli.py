@@ -0,0 +1,53 @@
+# app/cli.py
+import click
+
+
+def register_commands(app):
+    """Регистрация служебных CLI команд (flask <команда>)"""
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Пересчитать агрегаты HR аналитики с нуля"""
+        from .utils.rollups import rebuild_rollups
+        count = rebuild_rollups()
+        click.echo(f'Агрегаты пересчитаны: {count} срезов')
+
+    @app.cli.command('backfill-trends')
+    def backfill_trends_command():
+        """Построить агрегаты динамики оценок по существующей истории"""
+        from .utils.trends import rebuild_trends
+        count = rebuild_trends()
+        click.echo(f'Агрегаты динамики построены: {count} интервалов')
+
+    @app.cli.command('create-search-indexes')
+    def create_search_indexes_command():
+        """Создать расширение pg_trgm и GIN индексы для поиска"""
+        from . import db
+        from .utils.search import ensure_search_indexes
+        if ensure_search_indexes():
+            db.session.commit()
+            click.echo('Индексы поиска созданы')
+        else:
+            click.echo('Индексы pg_trgm нужны только для PostgreSQL, используется поиск в памяти')
+
+    @app.cli.command('replay-history-journal')
+    def replay_history_journal_command():
+        """Дописать записи истории, которые журнал не смог записать"""
+        from .utils.journal import history_journal
+        count = history_journal.replay_failed()
+        click.echo(f'Записи журнала истории дописаны: {count}')
+
+    @app.cli.command('history-capture')
+    @click.argument('mode', required=False, type=click.Choice(['orm', 'trigger']))
+    def history_capture_command(mode):
+        """Установить (trigger) или удалить (orm) триггеры истории оценок PostgreSQL"""
+        from . import db
+        from .utils.history import history_capture
+        mode = mode or app.config['HISTORY_CAPTURE']
+        try:
+            history_capture.switch(mode)
+        except ValueError as e:
+            db.session.rollback()
+            raise click.ClickException(str(e))
+        db.session.commit()
+        click.echo(f'Режим записи истории оценок: {mode}. Перезапустите воркеры приложения')
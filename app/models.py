@@ -87,32 +87,96 @@ class AssessmentHistory(db.Model):
     changed_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
     changed_at = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.Column(db.Text)
+    department_id = db.Column(db.Integer)  # отдел сотрудника на момент изменения (для динамики по отделам)
 
     def __repr__(self):
         return f'<AssessmentHistory {self.id}: {self.field_changed} from {self.old_value} to {self.new_value}>'
 
+class AnalyticsRollup(db.Model):
+    """Агрегаты оценок для HR аналитики: глобально, по отделам, по ролям и по навыкам"""
+    __tablename__ = 'analytics_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # 'global', 'department', 'role' или 'skill'
+    scope_key = db.Column(db.String(100), nullable=False, default='')  # id отдела, название роли или id навыка
+    user_count = db.Column(db.Integer, nullable=False, default=0)
+    assessment_count = db.Column(db.Integer, nullable=False, default=0)
+    self_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    self_count = db.Column(db.Integer, nullable=False, default=0)
+    manager_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    manager_count = db.Column(db.Integer, nullable=False, default=0)
+    final_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    final_count = db.Column(db.Integer, nullable=False, default=0)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)  # самооценка без оценки руководителя
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'scope_key', name='unique_rollup_scope'),
+    )
+
+    @property
+    def avg_score(self):
+        """Средняя оценка: руководителя, а если ее нет - самооценка"""
+        if self.manager_count:
+            return self.manager_sum / self.manager_count
+        if self.self_count:
+            return self.self_sum / self.self_count
+        return 0
+
+    def __repr__(self):
+        return f'<AnalyticsRollup {self.scope}:{self.scope_key}>'
+
+class ScoreTrendBucket(db.Model):
+    """Агрегаты истории оценок по неделям и месяцам (для графиков динамики)"""
+    __tablename__ = 'score_trend_buckets'
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.String(10), nullable=False)  # 'week' или 'month'
+    bucket_start = db.Column(db.Date, nullable=False)  # понедельник недели или первое число месяца
+    skill_id = db.Column(db.Integer, nullable=False)
+    department_key = db.Column(db.String(20), nullable=False, default='')  # id отдела на момент изменения
+    field_changed = db.Column(db.String(50), nullable=False)  # 'self_score' или 'manager_score'
+    change_count = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+    delta_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    delta_count = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'bucket_start', 'skill_id', 'department_key', 'field_changed',
+                            name='unique_trend_bucket'),
+        db.Index('ix_trend_bucket_series', 'bucket', 'skill_id', 'bucket_start'),
+    )
+
+    def __repr__(self):
+        return f'<ScoreTrendBucket {self.bucket}:{self.bucket_start} skill={self.skill_id}>'
+
+class DataVersion(db.Model):
+    """Монотонный счетчик версии данных для каждой таблицы (для ETag/Last-Modified)"""
+    __tablename__ = 'data_versions'
+    entity = db.Column(db.String(50), primary_key=True)  # имя таблицы, например 'skill_assessments'
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<DataVersion {self.entity}: {self.version}>'
+
 @event.listens_for(SkillAssessment, 'after_update')
 def receive_after_update(mapper, connection, target):
     from app import db
-    self_score_history = get_history(target, 'self_score')
-    manager_score_history = get_history(target, 'manager_score')
-    if self_score_history.has_changes():
-        history = AssessmentHistory(
-            assessment_id=target.id,
-            field_changed='self_score',
-            old_value=self_score_history.deleted[0] if self_score_history.deleted else None,
-            new_value=self_score_history.added[0] if self_score_history.added else None,
-            changed_by=None,  #нужно получить ID текущего пользователя
-            notes='Изменение самооценки'
-        )
-        db.session.add(history)
-    if manager_score_history.has_changes():
-        history = AssessmentHistory(
-            assessment_id=target.id,
-            field_changed='manager_score',
-            old_value=manager_score_history.deleted[0] if manager_score_history.deleted else None,
-            new_value=manager_score_history.added[0] if manager_score_history.added else None,
-            changed_by=None,  #нужно получить ID текущего пользователя
-            notes='Изменение оценки руководителя'
-        )
-        db.session.add(history)
\ No newline at end of file
+    from sqlalchemy.orm import object_session
+    from app.utils.history import acting_user_id, history_trigger_enabled
+    from app.utils.journal import history_entry, record_history
+    #в режиме триггеров те же записи пишет триггер БД
+    if history_trigger_enabled():
+        return
+    entries = []
+    for field, notes in (('self_score', 'Изменение самооценки'), ('manager_score', 'Изменение оценки руководителя')):
+        history = get_history(target, field)
+        if history.has_changes():
+            entries.append(history_entry(
+                target.id, field,
+                history.deleted[0] if history.deleted else None,
+                history.added[0] if history.added else None,
+                changed_by=acting_user_id(),
+                notes=notes
+            ))
+    #сразу в транзакции или в очередь журнала
+    record_history(object_session(target) or db.session, entries, connection)
@@ -2,6 +2,8 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
 from .. import db
 from ..models import Skill
+from ..utils.skill_index import get_skill_index
+from ..utils.skill_catalog import get_skill_catalog
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
@@ -17,14 +19,17 @@ def assess_skill():
 @api.route('/skills', methods=['GET'])
 @login_required
 def get_skills():
-    """Получение всех навыков"""
-    skills = Skill.query.all()
-    return jsonify([{
-        "id": s.id,
-        "name": s.name,
-        "category": s.category,
-        "description": s.description
-    } for s in skills])
+    """Получение всех навыков (версия каталога - в ETag и X-Catalog-Version)"""
+    catalog = get_skill_catalog(with_counts=False)
+    response = jsonify([{
+        "id": s["id"],
+        "name": s["name"],
+        "category": s["category"],
+        "description": s["description"]
+    } for s in catalog.skills])
+    response.set_etag(catalog.etag)
+    response.headers['X-Catalog-Version'] = catalog.version
+    return response.make_conditional(request)
 
 @api.route('/skills', methods=['POST'])
 @login_required
@@ -131,9 +136,14 @@ def delete_skill(skill_id):
         return jsonify({"success": False, "message": f"Ошибка: {str(e)}"}), 500
 
 @api.route('/skills/search')
+@login_required
 def search_skills():
-    query = request.args.get('q', '')
-    return jsonify([{"id":1,"name":"Python"} if "Python".lower().startswith(query.lower()) else {}])
+    """Автодополнение навыков по началу названия, слова или категории"""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    if not query:
+        return jsonify([])
+    return jsonify(get_skill_index().search(query, limit))
 
 @api.route('/hr/stats')
 def hr_stats():
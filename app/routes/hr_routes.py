@@ -1,8 +1,27 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
 from ..models import *
 from .. import db
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, or_
+from ..utils.rollups import get_hr_summary
+from ..utils.cache import analytics_cache
+from ..utils.invalidation import invalidation_bus
+from ..utils.versioning import conditional_response
+from ..utils.live_stats import hr_stats_feed, snapshot_delta
+from ..utils.score_matrix import get_score_matrix
+from ..utils.helpers import encode_cursor, decode_cursor
+from ..utils.reports import (
+    final_score_expression, build_heatmap, build_distribution, build_cohort_comparison, build_team_coverage,
+    HEATMAP_DIMENSIONS, HEATMAP_GROUPINGS, MAX_COMPARE_USERS, MAX_COMPARE_DEPARTMENT
+)
+from ..utils.trends import get_trends, TREND_BUCKETS
+from ..utils.search import get_search_backend
+from ..utils.talent import parse_talent_query, evaluate_with_matrix, evaluate_with_sql
+from ..utils.similarity import similarity_index, similar_users_sql
+from sqlalchemy.orm import joinedload
+from datetime import datetime
+import json
+import queue
 
 bp = Blueprint('hr', __name__)
 
@@ -17,83 +36,17 @@ def hr_analytics():
         }), 403
     
     try:
-        total_users = User.query.count()
-        
-        avg_score_query = db.session.query(
-            func.coalesce(
-                func.avg(SkillAssessment.manager_score),
-                func.avg(SkillAssessment.self_score)
-            )
-        ).filter(
-            SkillAssessment.self_score.isnot(None)
-        ).first()
-        
-        avg_score = 0
-        if avg_score_query and avg_score_query[0]:
-            avg_score = float(avg_score_query[0])
-        
-        #общее кол-во навыков
-        total_skills = Skill.query.count()
-        
-        #кол-во оценненых навыков
-        assessed_skills = SkillAssessment.query.filter(
-            SkillAssessment.self_score.isnot(None)
-        ).count()
-        
-        stats = {
-            'total_users': total_users,
-            'avg_score': round(avg_score, 1),
-            'total_skills': total_skills,
-            'assessed_skills': assessed_skills
-        }
-        
-        roles_query = db.session.query(
-            User.role,
-            func.count(User.id).label('count')
-        ).group_by(User.role).all()
-        
-        roles_stats = []
-        for role, count in roles_query:
-            roles_stats.append({
-                'role': role,
-                'count': count
-            })
-        
-        #все отделы с количеством сотрудников и средней оценкой
-        dept_query = db.session.query(
-            Department.name.label('department_name'),
-            Department.id.label('department_id'),
-            func.count(User.id).label('user_count'),
-            func.coalesce(
-                func.avg(SkillAssessment.manager_score),
-                func.avg(SkillAssessment.self_score)
-            ).label('avg_score')
-        ).join(
-            User, Department.id == User.department_id, isouter=True
-        ).join(
-            SkillAssessment, User.id == SkillAssessment.user_id, isouter=True
-        ).group_by(
-            Department.id, Department.name
-        ).order_by(Department.name).all()
-        
-        departments_stats = []
-        for dept in dept_query:
-            avg_score_dept = 0
-            if dept.avg_score:
-                avg_score_dept = float(dept.avg_score)
-            
-            departments_stats.append({
-                'department': dept.department_name or 'Без отдела',
-                'count': dept.user_count or 0,
-                'avg_score': round(avg_score_dept, 1)
-            })
-        
+        #статистика читается из агрегатов analytics_rollups через кэш аналитики
+        stats, roles_stats, departments_stats = analytics_cache.get_or_compute(
+            'hr_summary', 'all', get_hr_summary
+        )
+
         if not departments_stats:
-            departments_stats.append({
+            departments_stats = [{
                 'department': 'Без отдела',
-                'count': total_users,
-                'avg_score': round(avg_score, 1)
-            })
+                'count': stats['total_users'],
+                'avg_score': stats['avg_score']
+            }]
 
         return render_template(
             'hr_analytics.html',
@@ -118,6 +71,7 @@ def hr_analytics():
 
 @bp.route('/api/hr/stats')
 @login_required
+@conditional_response('users', 'departments', 'skills', 'skill_assessments')
 def get_hr_stats():
     """API для получения статистики (используется в AJAX запросах)"""
     if current_user.role not in ['hr', 'admin']:
@@ -127,73 +81,13 @@ def get_hr_stats():
         }), 403
     
     try:
-        total_users = User.query.count()
-        
-        avg_score_query = db.session.query(
-            func.coalesce(
-                func.avg(SkillAssessment.manager_score),
-                func.avg(SkillAssessment.self_score)
-            )
-        ).filter(
-            SkillAssessment.self_score.isnot(None)
-        ).first()
-        
-        avg_score = 0
-        if avg_score_query and avg_score_query[0]:
-            avg_score = float(avg_score_query[0])
-        
-        total_skills = Skill.query.count()
-        assessed_skills = SkillAssessment.query.filter(
-            SkillAssessment.self_score.isnot(None)
-        ).count()
-        
-        roles_query = db.session.query(
-            User.role,
-            func.count(User.id).label('count')
-        ).group_by(User.role).all()
-        
-        roles_data = []
-        for role, count in roles_query:
-            roles_data.append({
-                'role': role,
-                'count': count
-            })
-        
-        dept_query = db.session.query(
-            Department.name.label('department_name'),
-            func.count(User.id).label('user_count'),
-            func.coalesce(
-                func.avg(SkillAssessment.manager_score),
-                func.avg(SkillAssessment.self_score)
-            ).label('avg_score')
-        ).join(
-            User, Department.id == User.department_id, isouter=True
-        ).join(
-            SkillAssessment, User.id == SkillAssessment.user_id, isouter=True
-        ).group_by(
-            Department.id, Department.name
-        ).order_by(Department.name).all()
-        
-        departments_data = []
-        for dept in dept_query:
-            avg_score_dept = 0
-            if dept.avg_score:
-                avg_score_dept = float(dept.avg_score)
-            
-            departments_data.append({
-                'department': dept.department_name or 'Без отдела',
-                'count': dept.user_count or 0,
-                'avg_score': round(avg_score_dept, 1)
-            })
-        
+        stats, roles_data, departments_data = analytics_cache.get_or_compute(
+            'hr_summary', 'all', get_hr_summary
+        )
+
         return jsonify({
             'success': True,
-            'stats': {
-                'total_users': total_users,
-                'avg_score': round(avg_score, 1),
-                'total_skills': total_skills,
-                'assessed_skills': assessed_skills
-            },
+            'stats': stats,
             'roles': roles_data,
             'departments': departments_data
         })
@@ -204,6 +98,182 @@ def get_hr_stats():
             'message': f'Ошибка при получении статистики: {str(e)}'
         }), 500
 
+@bp.route('/api/hr/stats/stream')
+@login_required
+def stream_hr_stats():
+    """SSE поток HR статистики: полный снимок при подключении, далее только изменения"""
+    if current_user.role not in ['hr', 'admin']:
+        return jsonify({
+            'success': False, 
+            'message': 'Доступ запрещен'
+        }), 403
+    
+    heartbeat = current_app.config.get('HR_STATS_STREAM_HEARTBEAT', 15)
+    updates, snapshot = hr_stats_feed.subscribe()
+    
+    #соединение с БД не должно висеть на все время жизни потока
+    db.session.close()
+    
+    def generate():
+        last_sent = snapshot
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            while True:
+                try:
+                    new_snapshot = updates.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                delta = snapshot_delta(last_sent, new_snapshot)
+                if delta:
+                    last_sent = new_snapshot
+                    yield f"event: delta\ndata: {json.dumps(delta, ensure_ascii=False)}\n\n"
+        finally:
+            hr_stats_feed.unsubscribe(updates)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  #nginx не должен буферизовать поток
+        }
+    )
+
+@bp.route('/api/heatmap')
+@login_required
+def get_heatmap():
+    """Тепловая карта средних оценок: отдел/роль/должность × категория/навык"""
+    if current_user.role not in ['hr', 'admin']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    dimension = request.args.get('dimension', 'department')
+    by = request.args.get('by', 'category')
+    
+    if dimension not in HEATMAP_DIMENSIONS:
+        return jsonify({'success': False, 'message': f'Измерение должно быть одним из: {", ".join(HEATMAP_DIMENSIONS)}'}), 400
+    if by not in HEATMAP_GROUPINGS:
+        return jsonify({'success': False, 'message': f'Группировка должна быть одной из: {", ".join(HEATMAP_GROUPINGS)}'}), 400
+    
+    try:
+        heatmap = analytics_cache.get_or_compute(
+            'heatmap', f'{dimension}:{by}', lambda: build_heatmap(dimension, by)
+        )
+        return jsonify({
+            'success': True,
+            'heatmap': heatmap
+        })
+    except Exception as e:
+        print(f"❌ Ошибка построения тепловой карты: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+@bp.route('/api/distribution')
+@login_required
+def get_distribution():
+    """Распределение оценок: гистограмма, медиана, перцентили и отклонение"""
+    if current_user.role not in ['hr', 'admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    skill_id = request.args.get('skill_id', type=int)
+    department_id = request.args.get('department_id', type=int)
+    
+    #руководитель видит только свой отдел
+    if current_user.role == 'manager':
+        if department_id is not None and department_id != current_user.department_id:
+            return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+        department_id = current_user.department_id
+    
+    try:
+        distribution = analytics_cache.get_or_compute(
+            'distribution', f'{skill_id}:{department_id}',
+            lambda: build_distribution(skill_id, department_id)
+        )
+        return jsonify({
+            'success': True,
+            'filters': {'skill_id': skill_id, 'department_id': department_id},
+            'distribution': distribution
+        })
+    except Exception as e:
+        print(f"❌ Ошибка расчета распределения: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+@bp.route('/api/team-coverage')
+@login_required
+def get_departments_coverage():
+    """Покрытие навыков и bus factor сразу по всем отделам (или по одному)"""
+    if current_user.role not in ['hr', 'admin']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    department_id = request.args.get('department_id', type=int)
+    try:
+        reports = analytics_cache.get_or_compute(
+            'team_coverage', department_id if department_id is not None else 'all',
+            lambda: build_team_coverage(department_id, get_score_matrix())
+        )
+        return jsonify({
+            'success': True,
+            'departments': reports
+        })
+    except Exception as e:
+        print(f"❌ Ошибка расчета покрытия навыков: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+@bp.route('/api/trends')
+@login_required
+@conditional_response('assessment_history')
+def get_score_trends():
+    """Динамика средних оценок по неделям или месяцам"""
+    if current_user.role not in ['hr', 'admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    bucket = request.args.get('bucket', 'month')
+    skill_id = request.args.get('skill_id', type=int)
+    department_id = request.args.get('department_id', type=int)
+    since = request.args.get('since')
+    
+    if bucket not in TREND_BUCKETS:
+        return jsonify({'success': False, 'message': f'Интервал должен быть одним из: {", ".join(TREND_BUCKETS)}'}), 400
+    
+    if since:
+        try:
+            since = datetime.strptime(since, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Дата since должна быть в формате ГГГГ-ММ-ДД'}), 400
+    
+    #руководитель видит только свой отдел
+    if current_user.role == 'manager':
+        if department_id is not None and department_id != current_user.department_id:
+            return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+        department_id = current_user.department_id
+    
+    try:
+        return jsonify({
+            'success': True,
+            'bucket': bucket,
+            'filters': {'skill_id': skill_id, 'department_id': department_id},
+            'series': get_trends(bucket, skill_id, department_id, since or None)
+        })
+    except Exception as e:
+        print(f"❌ Ошибка расчета динамики оценок: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+@bp.route('/api/hr/cache-stats')
+@login_required
+def get_cache_stats():
+    """Счетчики кэша аналитики (попадания, промахи, вытеснения) и доставки сбросов между процессами"""
+    if current_user.role not in ['hr', 'admin']:
+        return jsonify({
+            'success': False, 
+            'message': 'Доступ запрещен'
+        }), 403
+    
+    return jsonify({
+        'success': True,
+        'cache': analytics_cache.stats(),
+        'invalidation': invalidation_bus.stats()
+    })
+
 @bp.route('/api/hr/export')
 @login_required
 def export_hr_data():
@@ -238,22 +308,8 @@ def user_managment():
             'message': 'Доступ запрещен. Только HR и администраторы могут просматривать эту страницу.'
         }), 403
     
-    try:
-        #получаем все навыки сгруппированные по категориям для datalist
-        categories = {}
-        all_skills = Skill.query.order_by(Skill.category, Skill.name).all()
-        
-        for skill in all_skills:
-            category = skill.category
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(skill)
-        
-        return render_template('user_managment.html', categories=categories)
-        
-    except Exception as e:
-        print(f"❌ Ошибка в user_managment: {str(e)}")
-        return render_template('user_managment.html', categories={})
+    #подсказки навыков подгружаются через /api/skills/search, каталог целиком не нужен
+    return render_template('user_managment.html')
 
 
 @bp.route('/search-by-skills')
@@ -265,84 +321,103 @@ def search_by_skills():
     
     skill_name = request.args.get('skill', '').strip()
     min_score = request.args.get('min_score', 1, type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
     
     if not skill_name:
         return jsonify({'success': False, 'message': 'Не указан навык для поиска'}), 400
     
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, 2)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    
     try:
-        #поиск навыков по названию (точное совпадение или частичное)
-        skills = Skill.query.filter(
-            Skill.name.ilike(f'%{skill_name}%')
-        ).all()
+        #нечеткий поиск навыков по названию (подстрока или похожее написание)
+        skill_matches = get_search_backend().search_skills(skill_name, limit=20)
+        skill_ids = [skill_id for skill_id, _ in skill_matches]
 
-        if not skills:
+        if not skill_ids:
             return jsonify({
                 'success': False, 
                 'message': f'Навык "{skill_name}" не найден'
             }), 404
         
-        skill_ids = [s.id for s in skills]
-        
-        #поиск оценок по этим навыкам
-        assessments = SkillAssessment.query.filter(
-            SkillAssessment.skill_id.in_(skill_ids)
-        ).all()
-        
-        #фильтр по минимальному баллу (ПРАВИЛЬНЫЙ ФИЛЬТР)
-        filtered_assessments = []
-        for assessment in assessments:
-            if assessment.manager_score is not None:
-                final_score = assessment.manager_score
-            elif assessment.self_score is not None:
-                final_score = assessment.self_score
-            else:
-                continue  #нет оценок
-                
-            #фильтруем по минимальному баллу
-            if final_score >= min_score:
-                filtered_assessments.append(assessment)
-        
-        #собираем данные пользователей
-        users_data = []
-        user_ids_processed = set()
+        #итоговая оценка (руководителя, иначе самооценка) и фильтр по минимальному баллу - в SQL;
+        #если совпало несколько навыков, для сотрудника берется лучшая оценка
+        final_score = final_score_expression()
+        ranked = db.session.query(
+            SkillAssessment.user_id.label('user_id'),
+            SkillAssessment.self_score.label('self_score'),
+            SkillAssessment.manager_score.label('manager_score'),
+            final_score.label('final_score'),
+            func.row_number().over(
+                partition_by=SkillAssessment.user_id,
+                order_by=(final_score.desc(), SkillAssessment.skill_id)
+            ).label('rank')
+        ).filter(
+            SkillAssessment.skill_id.in_(skill_ids),
+            final_score >= min_score
+        ).subquery()
+        
+        matches = db.session.query(ranked).join(
+            User, User.id == ranked.c.user_id
+        ).filter(ranked.c.rank == 1)
+        
+        #проверка доступа для manager
+        if current_user.role == 'manager':
+            matches = matches.filter(User.department_id == current_user.department_id)
+        
+        total_found = matches.count() if include_total else None
+        
+        page = matches.with_entities(
+            User.id, User.full_name, User.login, User.role, User.position,
+            Department.name.label('department'),
+            ranked.c.self_score, ranked.c.manager_score, ranked.c.final_score
+        ).outerjoin(
+            Department, Department.id == User.department_id
+        )
         
-        for assessment in filtered_assessments:
-            user = User.query.get(assessment.user_id)
-            if not user or user.id in user_ids_processed:
-                continue
-                
-            #проверка доступа для manager
-            if current_user.role == 'manager':
-                if current_user.department_id != user.department_id:
-                    continue
-            
-            final_score = assessment.manager_score if assessment.manager_score is not None else assessment.self_score
-            
-            users_data.append({
-                'id': user.id,
-                'full_name': user.full_name,
-                'login': user.login,
-                'role': user.role,
-                'position': getattr(user, 'position', ''),
-                'department': user.department.name if user.department else '',
-                'self_score': assessment.self_score,
-                'manager_score': assessment.manager_score,
-                'final_score': final_score
-            })
-            user_ids_processed.add(user.id)
+        if after is not None:
+            page = page.filter(or_(
+                ranked.c.final_score < after[0],
+                and_(ranked.c.final_score == after[0], User.id > after[1])
+            ))
         
         #сортируем по убыванию финальной оценки
-        users_data.sort(key=lambda x: x['final_score'] or 0, reverse=True)
+        rows = page.order_by(ranked.c.final_score.desc(), User.id).limit(limit + 1).all()
+        
+        users_data = [{
+            'id': row.id,
+            'full_name': row.full_name,
+            'login': row.login,
+            'role': row.role,
+            'position': row.position or '',
+            'department': row.department or '',
+            'self_score': row.self_score,
+            'manager_score': row.manager_score,
+            'final_score': row.final_score
+        } for row in rows[:limit]]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = users_data[-1]
+            next_cursor = encode_cursor(last['final_score'], last['id'])
         
         return jsonify({
             'success': True,
             'skill': {
                 'name': skill_name,
-                'category': skills[0].category if skills else '',
+                'category': db.session.get(Skill, skill_ids[0]).category,
                 'min_score': min_score
             },
             'users': users_data,
-            'total_found': len(users_data),
+            'total_found': total_found,
+            'next_cursor': next_cursor,
+            'limit': limit,
             'minScore': min_score 
         })
         
@@ -350,10 +425,193 @@ def search_by_skills():
         print(f"Ошибка поиска по навыкам: {str(e)}")
         return jsonify({'success': False, 'message': f'Ошибка поиска: {str(e)}'}), 500
 
+@bp.route('/api/talent-query', methods=['POST'])
+@login_required
+def talent_query():
+    """Подбор сотрудников по булевому выражению над навыками"""
+    if current_user.role not in ['hr', 'admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    if 'query' not in data:
+        return jsonify({'success': False, 'message': 'Не указано выражение query'}), 400
+    
+    department_id = data.get('department_id')
+    role = data.get('role') or None
+    try:
+        limit = min(max(int(data.get('limit', 50)), 1), 500)
+        if department_id is not None:
+            department_id = int(department_id)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'limit и department_id должны быть числами'}), 400
+    
+    #руководитель ищет только в своем отделе
+    if current_user.role == 'manager':
+        if department_id is not None and department_id != current_user.department_id:
+            return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+        department_id = current_user.department_id
+    
+    try:
+        expression = parse_talent_query(data['query'])
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        matrix = get_score_matrix()
+        if matrix is not None:
+            total, matches = evaluate_with_matrix(matrix, expression, department_id, role, limit)
+        else:
+            total, matches = evaluate_with_sql(expression, department_id, role, limit)
+        
+        users = {
+            user.id: user for user in User.query.options(
+                joinedload(User.department)
+            ).filter(User.id.in_([user_id for user_id, _, _ in matches])).all()
+        } if matches else {}
+        
+        results = []
+        for user_id, total_score, scores in matches:
+            user = users.get(user_id)
+            if user is None:
+                continue
+            results.append({
+                'id': user.id,
+                'full_name': user.full_name,
+                'login': user.login,
+                'role': user.role,
+                'position': user.position or '',
+                'department': user.department.name if user.department else '',
+                'total_score': total_score,
+                'scores': {str(skill_id): score for skill_id, score in scores.items()}
+            })
+        
+        return jsonify({
+            'success': True,
+            'engine': 'bitmap' if matrix is not None else 'sql',
+            'total_found': total,
+            'users': results
+        })
+    except Exception as e:
+        print(f"❌ Ошибка подбора сотрудников: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+@bp.route('/api/users/<int:user_id>/similar')
+@login_required
+def similar_users(user_id):
+    """Сотрудники с наиболее похожим профилем навыков (косинусная близость оценок)"""
+    if current_user.role not in ['hr', 'admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    try:
+        k = min(max(int(request.args.get('k', 10)), 1), 100)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'k должен быть числом'}), 400
+    
+    user = User.query.options(joinedload(User.department)).get(user_id)
+    if not user:
+        return jsonify({'success': False, 'message': 'Пользователь не найден'}), 404
+    
+    #руководитель ищет похожих только среди сотрудников своего отдела
+    department_id = None
+    if current_user.role == 'manager':
+        if user.department_id != current_user.department_id:
+            return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+        department_id = current_user.department_id
+    
+    try:
+        matrix = get_score_matrix()
+        matches = similarity_index.similar(matrix, user_id, k, department_id) if matrix is not None else None
+        if matches is None:
+            matches = similar_users_sql(user_id, k, department_id)
+        
+        users = {
+            similar.id: similar for similar in User.query.options(
+                joinedload(User.department)
+            ).filter(User.id.in_([similar_id for similar_id, _, _ in matches])).all()
+        } if matches else {}
+        
+        results = []
+        for similar_id, similarity, common_skills in matches:
+            similar = users.get(similar_id)
+            if similar is None:
+                continue
+            results.append({
+                'id': similar.id,
+                'full_name': similar.full_name,
+                'department': similar.department.name if similar.department else '',
+                'position': similar.position or '',
+                'similarity': similarity,
+                'common_skills': common_skills
+            })
+        
+        return jsonify({
+            'success': True,
+            'engine': 'matrix' if matrix is not None else 'sql',
+            'user': {
+                'id': user.id,
+                'full_name': user.full_name,
+                'department': user.department.name if user.department else ''
+            },
+            'similar': results
+        })
+    except Exception as e:
+        print(f"❌ Ошибка поиска похожих сотрудников: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+@bp.route('/api/compare')
+@login_required
+def compare_cohort():
+    """Сравнение группы сотрудников (до 50 id или отдел): навыки × сотрудники"""
+    if current_user.role not in ['hr', 'admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    raw_ids = ','.join(request.args.getlist('user_ids'))
+    department_id = request.args.get('department_id', type=int)
+    
+    user_ids = None
+    if raw_ids:
+        try:
+            user_ids = list(dict.fromkeys(int(value) for value in raw_ids.split(',') if value.strip()))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'user_ids должны быть числами через запятую'}), 400
+        if len(user_ids) > MAX_COMPARE_USERS:
+            return jsonify({'success': False, 'message': f'Можно сравнить не более {MAX_COMPARE_USERS} сотрудников'}), 400
+    elif department_id is None:
+        return jsonify({'success': False, 'message': 'Укажите user_ids или department_id'}), 400
+    
+    #руководитель сравнивает только сотрудников своего отдела (ограничение в самом запросе)
+    scope_department_id = current_user.department_id if current_user.role == 'manager' else None
+    
+    try:
+        if user_ids is None:
+            size = db.session.query(func.count(User.id)).filter(User.department_id == department_id).scalar()
+            if size > MAX_COMPARE_DEPARTMENT:
+                return jsonify({
+                    'success': False,
+                    'message': f'В отделе больше {MAX_COMPARE_DEPARTMENT} сотрудников, укажите user_ids'
+                }), 400
+        
+        comparison = build_cohort_comparison(user_ids, department_id, scope_department_id)
+        if comparison is None:
+            return jsonify({'success': False, 'message': 'Сотрудники не найдены'}), 404
+        
+        if user_ids is not None:
+            missing = [user_id for user_id in user_ids if user_id not in set(comparison['users']['ids'])]
+            if missing:
+                return jsonify({
+                    'success': False,
+                    'message': f'Сотрудники не найдены или недоступны: {", ".join(map(str, missing))}'
+                }), 404
+        
+        return jsonify({'success': True, 'comparison': comparison})
+    except Exception as e:
+        print(f"❌ Ошибка сравнения сотрудников: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
 @bp.route('/compare-users')
 @login_required
 def compare_users():
-    """Сравнение навыков двух пользователей"""
+    """Сравнение навыков двух пользователей (старый формат поверх /api/compare)"""
     user1_id = request.args.get('user1', type=int)
     user2_id = request.args.get('user2', type=int)
 
@@ -363,44 +621,32 @@ def compare_users():
     if current_user.role == 'employee' and current_user.id not in [user1_id, user2_id]:
         return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
 
-    user1 = User.query.get_or_404(user1_id)
-    user2 = User.query.get_or_404(user2_id)
-
-    if current_user.role == 'manager':
-        if (current_user.department_id != user1.department_id or
-            current_user.department_id != user2.department_id):
+    scope_department_id = current_user.department_id if current_user.role == 'manager' else None
+    comparison = build_cohort_comparison([user1_id, user2_id], scope_department_id=scope_department_id)
+    if comparison is None or len(comparison['users']['ids']) < len({user1_id, user2_id}):
+        if current_user.role == 'manager':
             return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+        return jsonify({'success': False, 'message': 'Пользователь не найден'}), 404
 
-    assessments = SkillAssessment.query.filter(
-        SkillAssessment.user_id.in_([user1_id, user2_id])
-    ).all()
-
-    data = {}
-    for a in assessments:
-        score = a.manager_score if a.manager_score is not None else a.self_score
-        data.setdefault(a.skill_id, {})[a.user_id] = score
-
-    comparison = []
-    for skill in Skill.query.all():
-        s1 = data.get(skill.id, {}).get(user1_id)
-        s2 = data.get(skill.id, {}).get(user2_id)
-
-        diff = None
-        if s1 is not None and s2 is not None:
-            diff = s2 - s1
-
-        comparison.append({
-            'skill_name': skill.name,
+    column = {user_id: i for i, user_id in enumerate(comparison['users']['ids'])}
+    skills = comparison['skills']
+    rows = []
+    for i, scores in enumerate(comparison['scores']):
+        s1 = scores[column[user1_id]]
+        s2 = scores[column[user2_id]]
+        rows.append({
+            'skill_name': skills['names'][i],
+            'category': skills['categories'][i],
             'user1_score': s1,
             'user2_score': s2,
-            'difference': diff
+            'difference': s2 - s1 if s1 is not None and s2 is not None else None
         })
 
     return jsonify({
         'success': True,
-        'user1': user1.full_name,
-        'user2': user2.full_name,
-        'comparison': comparison
+        'user1': comparison['users']['names'][column[user1_id]],
+        'user2': comparison['users']['names'][column[user2_id]],
+        'comparison': rows
     })
 
 
@@ -419,29 +665,24 @@ def search_users():
         return jsonify({'success': False, 'message': 'Введите минимум 2 символа'}), 400
     
     try:
-        #начинаем запрос
-        users_query = User.query
-        
-        #фильтр по имени или логину
-        if search_query:
-            users_query = users_query.filter(
-                db.or_(
-                    User.full_name.ilike(f"%{search_query}%"),
-                    User.login.ilike(f"%{search_query}%")
-                )
-            )
-        
         #фильтр по отделу (если указан)
+        department_id = None
         if department_name:
             dept = Department.query.filter(
                 Department.name.ilike(f"%{department_name}%")
             ).first()
             
             if dept:
-                users_query = users_query.filter(User.department_id == dept.id)
+                department_id = dept.id
         
-        #ограничиваем результаты
-        users = users_query.limit(20).all()
+        #нечеткий поиск по имени или логину, результаты по убыванию похожести
+        matches = get_search_backend().search_users(search_query, limit=20, department_id=department_id)
+        found = {
+            user.id: user for user in User.query.options(
+                joinedload(User.department)
+            ).filter(User.id.in_([user_id for user_id, _ in matches])).all()
+        } if matches else {}
+        users = [found[user_id] for user_id, _ in matches if user_id in found]
         
         #формируем ответ
         users_data = []
@@ -470,6 +711,7 @@ def search_users():
 
 @bp.route('/api/departments')
 @login_required
+@conditional_response('departments')
 def get_departments():
     """Получение списка отделов"""
     if current_user.role not in ['hr', 'admin', 'manager']:
@@ -621,9 +863,8 @@ def manage_user(user_id):
     elif request.method == 'DELETE':
         #удаление пользователя
         try:
-            #удаляем все связанные оценки
-            SkillAssessment.query.filter_by(user_id=user.id).delete()
-            
+            #связанные оценки удаляются каскадом через ORM,
+            #чтобы агрегаты analytics_rollups учли каждую из них
             db.session.delete(user)
             db.session.commit()
             
@@ -638,6 +879,7 @@ def manage_user(user_id):
 
 @bp.route('/api/all-users')
 @login_required
+@conditional_response('users', 'departments')
 def get_all_users():
     """Получение списка всех пользователей"""
     if current_user.role not in ['hr', 'admin']:
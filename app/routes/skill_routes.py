@@ -2,6 +2,10 @@ from flask import render_template, request, jsonify, Blueprint, send_file
 from flask_login import login_required, current_user
 from .. import db
 from ..models import Skill, User, SkillAssessment, AssessmentHistory, Department
+from ..utils.versioning import conditional_response
+from ..utils.chart_data import parse_format, chart_response, skill_labels_body
+from ..utils.skill_catalog import get_skill_catalog
+from ..utils.skill_import import read_import_rows, validate_import_rows, diff_catalog, summarize_diff, apply_import
 from datetime import datetime
 import csv
 import io
@@ -18,38 +22,37 @@ def skill_management():
             'message': 'Доступ запрещен. Только для HR и администраторов.'
         }), 403
     
-    skills = Skill.query.order_by(Skill.category, Skill.name).all()
-    
-    #навыки по категориям
-    categories = {}
-    for skill in skills:
-        if skill.category not in categories:
-            categories[skill.category] = []
-        categories[skill.category].append(skill)
+    #навыки по категориям с числом оценок (из кэша каталога)
+    catalog = get_skill_catalog()
     
     return render_template('skill_management.html',
                           current_user=current_user,
-                          categories=categories)
+                          categories=catalog.categories)
 
 @bp.route('/api/skills', methods=['GET'])
 @login_required
 def get_skills():
-    """API для получения всех навыков"""
-    skills = Skill.query.order_by(Skill.category, Skill.name).all()
-    
-    skills_list = [{
-        'id': skill.id,
-        'name': skill.name,
-        'category': skill.category,
-        'description': skill.description,
-        'assessments_count': SkillAssessment.query.filter_by(skill_id=skill.id).count()
-    } for skill in skills]
+    """API для получения всех навыков (ETag - версия каталога, неизменившийся каталог отдается как 304)"""
+    catalog = get_skill_catalog()
     
-    return jsonify({
+    response = jsonify({
         'success': True,
-        'skills': skills_list,
-        'total': len(skills_list)
+        'skills': catalog.skills,
+        'total': len(catalog.skills),
+        'version': catalog.version
     })
+    response.set_etag(catalog.etag)
+    return response.make_conditional(request)
+
+@bp.route('/api/skills/labels', methods=['GET'])
+@login_required
+@conditional_response('skills')
+def get_skill_labels():
+    """Словарь навыков {id: [название, категория]} для компактных данных графиков (?format=msgpack)"""
+    fmt = parse_format(request.args.get('format'))
+    if fmt is None:
+        return jsonify({'success': False, 'message': 'Неподдерживаемый формат ответа'}), 406
+    return chart_response(skill_labels_body(fmt), fmt)
 
 @bp.route('/api/skills', methods=['POST'])
 @login_required
@@ -92,6 +95,59 @@ def create_skill():
         }
     })
 
+@bp.route('/api/skills/import', methods=['POST'])
+@login_required
+def import_skills():
+    """
+    Массовый импорт навыков из CSV или JSON (файл file, тело JSON или text/csv).
+    По умолчанию только разбор (новые / измененные / без изменений), ?apply=1 - запись.
+    """
+    if current_user.role not in ['hr', 'admin']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    apply = request.args.get('apply', '').lower() in ('1', 'true', 'yes')
+    
+    upload = request.files.get('file')
+    if upload:
+        content = upload.read().decode('utf-8-sig')
+        fmt = 'json' if (upload.filename or '').lower().endswith('.json') else 'csv'
+    elif request.is_json:
+        content, fmt = request.get_json(silent=True), 'json'
+    else:
+        content, fmt = request.get_data(as_text=True), 'csv'
+    
+    try:
+        rows, errors = validate_import_rows(read_import_rows(content, fmt))
+        diff = diff_catalog(db.session.connection(), rows)
+        result = summarize_diff(diff, errors)
+        
+        if not apply:
+            return jsonify({'success': True, 'dry_run': True, **result})
+        if errors:
+            return jsonify({
+                'success': False,
+                'dry_run': True,
+                'message': 'Импорт не выполнен: исправьте ошибки в строках',
+                **result
+            }), 400
+        
+        counts = apply_import(db.session, diff)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'dry_run': False,
+            'message': f"Создано навыков: {counts['created']}, обновлено: {counts['updated']}",
+            **counts,
+            **result
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Ошибка импорта навыков: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
 @bp.route('/api/skills/<int:skill_id>', methods=['PUT'])
 @login_required
 def update_skill(skill_id):
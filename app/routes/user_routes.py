@@ -2,8 +2,18 @@ from flask import render_template, request, jsonify, Blueprint, redirect, flash,
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash
 from .. import db
+from sqlalchemy import func, case, cast, Float, and_, or_
 from ..models import User, Department, Skill, SkillAssessment
 from ..forms import RegistrationForm
+from ..utils.versioning import conditional_response
+from ..utils.cache import analytics_cache
+from ..utils.reports import build_team_coverage
+from ..utils.score_matrix import get_score_matrix
+from ..utils.helpers import encode_cursor, decode_cursor
+from ..utils.dashboard_stats import get_dashboard_stats as load_dashboard_stats
+from ..utils.assessments import parse_assessment_batch, upsert_assessments
+from ..utils.journal import history_entry, record_history
+from ..utils.chart_data import parse_format, chart_response, skill_series_body
 
 bp = Blueprint('user', __name__)
 
@@ -15,31 +25,8 @@ def dashboard():
     if current_user.department_id:
         department = Department.query.get(current_user.department_id)
     
-    #статистика для дашборда
-    stats = {}
-    
-    if current_user.role == 'employee':
-        #для сотрудника оценка навыков
-        assessments = SkillAssessment.query.filter_by(user_id=current_user.id).all()
-        stats['assessed_skills'] = len(assessments)
-        stats['total_skills'] = Skill.query.count()
-
-        if assessments:
-            total_score = sum(a.self_score for a in assessments if a.self_score is not None)
-            stats['avg_score'] = round(total_score / len(assessments), 1)
-        else:
-            stats['avg_score'] = 0
-        
-    elif current_user.role == 'manager':
-        #для руководства кол-во сотрудников
-        team_count = User.query.filter_by(department_id=current_user.department_id).count()
-        stats['team_count'] = team_count - 1  # исключая самого руководителя
-        
-    elif current_user.role == 'hr':
-        #для hr общая стата
-        stats['total_users'] = User.query.count()
-        stats['total_departments'] = Department.query.count()
-        stats['total_skills'] = Skill.query.count()
+    #статистика для дашборда (общая с /api/dashboard/stats, кэшируется по пользователю)
+    stats = load_dashboard_stats(current_user)
     
     return render_template('dashboard.html', 
                           current_user=current_user, 
@@ -47,6 +34,75 @@ def dashboard():
                           stats=stats,
                           USER_ROLE=current_user.role)
 
+def _profile_summary(user_id):
+    """
+    Сводка профиля по категориям одним запросом: навыков в категории,
+    оценено, средние самооценка и оценка руководителя. Общие средние
+    считаются из тех же сумм, без отдельного запроса по оценкам.
+    """
+    rows = db.session.query(
+        Skill.category,
+        func.count(Skill.id),
+        func.count(SkillAssessment.id),
+        func.coalesce(func.sum(SkillAssessment.self_score), 0),
+        func.count(SkillAssessment.self_score),
+        func.coalesce(func.sum(SkillAssessment.manager_score), 0),
+        func.count(SkillAssessment.manager_score)
+    ).outerjoin(
+        SkillAssessment,
+        (SkillAssessment.skill_id == Skill.id) &
+        (SkillAssessment.user_id == user_id)
+    ).group_by(Skill.category).order_by(Skill.category).all()
+    
+    categories = []
+    totals = [0, 0, 0, 0, 0]
+    for category, skills_count, rated, self_sum, self_count, manager_sum, manager_count in rows:
+        categories.append({
+            'name': category,
+            'skills_count': skills_count,
+            'rated': rated,
+            'avg_self_score': round(self_sum / self_count, 1) if self_count else None,
+            'avg_manager_score': round(manager_sum / manager_count, 1) if manager_count else None
+        })
+        for i, value in enumerate((rated, self_sum, self_count, manager_sum, manager_count)):
+            totals[i] += value
+    
+    rated, self_sum, self_count, manager_sum, manager_count = totals
+    return categories, {
+        'total_assessed_skills': rated,
+        'average_self_score': round(self_sum / self_count, 1) if self_count else None,
+        'average_manager_score': round(manager_sum / manager_count, 1) if manager_count else None
+    }
+
+def _category_skills(user_id, category):
+    """Навыки одной категории с оценками пользователя"""
+    rows = db.session.query(
+        Skill.id, Skill.name, Skill.description,
+        SkillAssessment.self_score,
+        SkillAssessment.manager_score,
+        SkillAssessment.assessed_at
+    ).outerjoin(
+        SkillAssessment,
+        (SkillAssessment.skill_id == Skill.id) &
+        (SkillAssessment.user_id == user_id)
+    ).filter(Skill.category == category).order_by(Skill.name).all()
+    
+    return [{
+        'id': skill_id,
+        'name': name,
+        'description': description,
+        'self_score': self_score,
+        'manager_score': manager_score,
+        'assessed_at': assessed_at.isoformat() if assessed_at else None,
+        'final_score': manager_score or self_score
+    } for skill_id, name, description, self_score, manager_score, assessed_at in rows]
+
+def _can_view_profile(user):
+    """Свой профиль, сотрудник своего отдела для руководителя, любой - для HR и администратора"""
+    if user.id == current_user.id or current_user.role in ['hr', 'admin']:
+        return True
+    return current_user.role == 'manager' and user.department_id == current_user.department_id
+
 @bp.route('/employee/<int:user_id>')
 @login_required
 def view_employee_profile(user_id):
@@ -65,99 +121,36 @@ def view_employee_profile(user_id):
             flash('Вы можете просматривать только сотрудников своего отдела', 'error')
             return redirect(url_for('user.my_team'))
         
-    # Получаем навыки с оценками
-    skills_with_assessments = db.session.query(
-        Skill,
-        SkillAssessment.self_score,
-        SkillAssessment.manager_score,
-        SkillAssessment.assessed_at
-    ).outerjoin(
-        SkillAssessment, 
-        (SkillAssessment.skill_id == Skill.id) & 
-        (SkillAssessment.user_id == user_id)
-    ).order_by(Skill.category, Skill.name).all()
-    
-    # Группируем навыки по категориям
-    skills_by_category = {}
-    for skill, self_score, manager_score, assessed_at in skills_with_assessments:
-        if skill.category not in skills_by_category:
-            skills_by_category[skill.category] = []
-        skills_by_category[skill.category].append({
-            'id': skill.id,
-            'name': skill.name,
-            'description': skill.description,
-            'self_score': self_score,
-            'manager_score': manager_score,
-            'assessed_at': assessed_at
-        })
-    
-    # Статистика
-    assessments = SkillAssessment.query.filter_by(user_id=user_id).all()
-    total_assessed_skills = len(assessments)
-    
-    # Средние оценки
-    self_scores = [a.self_score for a in assessments if a.self_score]
-    manager_scores = [a.manager_score for a in assessments if a.manager_score]
-    
-    average_self_score = round(sum(self_scores) / len(self_scores), 1) if self_scores else None
-    average_manager_score = round(sum(manager_scores) / len(manager_scores), 1) if manager_scores else None
+    # Сводка по категориям и средние оценки одним запросом; навыки категорий подгружаются по запросу
+    categories, totals = _profile_summary(user_id)
     
     return render_template('employee_profile.html',
                           user=employee,
-                          skills_by_category=skills_by_category,
-                          total_assessed_skills=total_assessed_skills,
-                          average_self_score=average_self_score,
-                          average_manager_score=average_manager_score,
+                          categories=categories,
+                          **totals,
                           current_user=current_user,
                           USER_ROLE=current_user.role)
 
 @bp.route('/api/employee/<int:user_id>/skills-data')
 @login_required
 def get_employee_skills_data(user_id):
-    """API для получения данных навыков сотрудника для графика"""
-    # Разрешаем руководителям и HR
-    if current_user.role not in ['manager', 'hr', 'admin']:
-        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
-    
+    """
+    API данных графика: только оцененные навыки по колонкам (skill_ids, self_scores,
+    manager_scores), названия навыков - в /skill/api/skills/labels по labels_version.
+    ?format=msgpack - ответ в MessagePack.
+    """
     employee = User.query.get_or_404(user_id)
     
-    # Проверяем права доступа
-    if current_user.role == 'manager':
-        if employee.department_id != current_user.department_id:
-            return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    # Свой профиль, руководитель своего отдела или HR
+    if not _can_view_profile(employee):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
     
-    # Получаем ВСЕ навыки с оценками (даже без оценок)
-    results = db.session.query(
-        Skill,
-        SkillAssessment.self_score,
-        SkillAssessment.manager_score
-    ).outerjoin(
-        SkillAssessment, 
-        (SkillAssessment.skill_id == Skill.id) & 
-        (SkillAssessment.user_id == user_id)
-    ).order_by(Skill.category, Skill.name).all()
-    
-    # Создаем данные для графика
-    labels = []
-    self_scores = []
-    manager_scores = []
-    
-    for skill, self_score, manager_score in results:
-        labels.append(skill.name)
-        self_scores.append(self_score or 0)  # 0 если нет оценки
-        manager_scores.append(manager_score or 0)  # 0 если нет оценки
-    
-    chart_data = {
-        'labels': labels,
-        'self_scores': self_scores,
-        'manager_scores': manager_scores,
-        'total_skills': len(labels)
-    }
+    fmt = parse_format(request.args.get('format'))
+    if fmt is None:
+        return jsonify({'success': False, 'message': 'Неподдерживаемый формат ответа'}), 406
     
-    return jsonify({
-        'success': True,
-        'chart_data': chart_data
-    })
+    #ответ кэшируется по пользователю и версии оценок
+    return chart_response(skill_series_body(user_id, fmt), fmt)
 
 @bp.route('/api/assess-employee-skill', methods=['POST'])
 @login_required
@@ -225,19 +218,15 @@ def assess_employee_skill():
         db.session.add(assessment)
     
     try:
-        db.session.commit()
-        
-        # Добавляем запись в историю изменений
-        from ..models import AssessmentHistory
-        history = AssessmentHistory(
-            assessment_id=assessment.id,
-            field_changed='manager_score',
-            old_value=None,  # Нет старого значения для новой оценки
-            new_value=score_int,
+        # Запись истории изменений в той же транзакции (или в журнал истории), один commit
+        db.session.flush()
+        record_history(db.session, [history_entry(
+            assessment.id, 'manager_score',
+            None,  # Нет старого значения для новой оценки
+            score_int,
             changed_by=current_user.id,
             notes=f'Оценка поставлена {"руководителем" if current_user.role == "manager" else "HR специалистом"}'
-        )
-        db.session.add(history)
+        )])
         db.session.commit()
         
         return jsonify({
@@ -257,44 +246,167 @@ def assess_employee_skill():
             'message': f'Ошибка при сохранении: {str(e)}'
         }), 500
 
+def _save_assessment_batch(user_id, field, notes):
+    """Проверка пакета оценок из тела запроса и запись одним upsert"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'message': 'Нет данных'}), 400
+    
+    try:
+        scores, errors = parse_assessment_batch(data.get('assessments'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    #пакет записывается целиком или не записывается вовсе
+    if errors:
+        return jsonify({
+            'success': False,
+            'message': 'Некорректные оценки в пакете',
+            'errors': errors
+        }), 400
+    
+    try:
+        saved = upsert_assessments(db.session, user_id, field, scores, changed_by=current_user.id, notes=notes)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'message': f'Сохранено оценок: {len(saved)}',
+            'saved': len(saved),
+            'unchanged': len(scores) - len(saved),
+            'assessments': [
+                {'skill_id': item['skill_id'], field: item['new_value'], 'previous': item['old_value']}
+                for item in saved
+            ]
+        })
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Ошибка пакетного сохранения оценок: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка при сохранении: {str(e)}'}), 500
+
+@bp.route('/api/employee/<int:user_id>/assessments/batch', methods=['POST'])
+@login_required
+def assess_employee_skills_batch(user_id):
+    """Пакетная оценка навыков сотрудника руководителем или HR: {"assessments": [{"skill_id", "score"}]}"""
+    if current_user.role not in ['manager', 'hr', 'admin']:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    employee = db.session.get(User, user_id)
+    if not employee:
+        return jsonify({'success': False, 'message': 'Сотрудник не найден'}), 404
+    
+    # Руководитель может оценивать только своих сотрудников
+    if current_user.role == 'manager' and employee.department_id != current_user.department_id:
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    return _save_assessment_batch(
+        user_id, 'manager_score',
+        f'Оценка поставлена {"руководителем" if current_user.role == "manager" else "HR специалистом"}'
+    )
+
 @bp.route('/profile')
 @login_required
 def profile():
     """Страница профиля с навыками"""
     user = current_user
     
-    #все навыки с оценками
-    skills_with_assessments = db.session.query(
-        Skill,
-        SkillAssessment.self_score,
-        SkillAssessment.manager_score,
-        SkillAssessment.assessed_at
-    ).outerjoin(
-        SkillAssessment, 
-        (SkillAssessment.skill_id == Skill.id) & 
-        (SkillAssessment.user_id == user.id)
-    ).order_by(Skill.category, Skill.name).all()
-    
-    #группируем навыки по категориям
-    skills_by_category = {}
-    for skill, self_score, manager_score, assessed_at in skills_with_assessments:
-        if skill.category not in skills_by_category:
-            skills_by_category[skill.category] = []
-        skills_by_category[skill.category].append({
-            'id': skill.id,
-            'name': skill.name,
-            'description': skill.description,
-            'self_score': self_score,
-            'manager_score': manager_score,
-            'assessed_at': assessed_at,
-            'final_score': manager_score or self_score
-        })
+    #сводка по категориям, навыки категории загружаются при раскрытии
+    categories, totals = _profile_summary(user.id)
     
     return render_template('profile.html', 
                           user=user,
-                          skills_by_category=skills_by_category,
+                          categories=categories,
+                          **totals,
                           USER_ROLE=current_user.role)
 
+@bp.route('/api/profile/<int:user_id>/category/<path:name>')
+@login_required
+def get_profile_category(user_id, name):
+    """Навыки одной категории профиля с оценками пользователя (ленивая загрузка)"""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return jsonify({'success': False, 'message': 'Пользователь не найден'}), 404
+    if not _can_view_profile(user):
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+    
+    try:
+        skills = _category_skills(user_id, name)
+        if not skills:
+            return jsonify({'success': False, 'message': f'Категория "{name}" не найдена'}), 404
+        
+        #разметка та же, что у страницы: свой профиль или профиль сотрудника
+        template = '_profile_skills.html' if user.id == current_user.id else '_employee_skills.html'
+        return jsonify({
+            'success': True,
+            'category': name,
+            'skills': skills,
+            'html': render_template(template, skills=skills, current_user=current_user)
+        })
+    except Exception as e:
+        print(f"❌ Ошибка загрузки категории профиля: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+TEAM_PAGE_SIZE = 50
+TEAM_SORT_FIELDS = ('full_name', 'assessments_count', 'avg_self_score', 'avg_manager_score')
+
+def _team_members_query(manager):
+    """
+    Сотрудники отдела руководителя (кроме него самого) с агрегатами оценок
+    одним запросом: users LEFT JOIN (GROUP BY user_id по skill_assessments).
+    """
+    totals = db.session.query(
+        SkillAssessment.user_id.label('user_id'),
+        func.count(SkillAssessment.id).label('assessments_count'),
+        cast(func.avg(SkillAssessment.self_score), Float).label('avg_self_score'),
+        cast(func.avg(SkillAssessment.manager_score), Float).label('avg_manager_score')
+    ).group_by(SkillAssessment.user_id).subquery()
+    
+    columns = {
+        'full_name': func.coalesce(User.full_name, ''),
+        'assessments_count': func.coalesce(totals.c.assessments_count, 0),
+        #нет оценок - 0, чтобы NULL не ломал keyset сравнение
+        'avg_self_score': func.coalesce(totals.c.avg_self_score, 0.0),
+        'avg_manager_score': func.coalesce(totals.c.avg_manager_score, 0.0)
+    }
+    query = db.session.query(
+        User.id, User.full_name, User.login, User.role,
+        columns['assessments_count'].label('assessments_count'),
+        totals.c.avg_self_score, totals.c.avg_manager_score
+    ).outerjoin(totals, totals.c.user_id == User.id).filter(
+        User.department_id == manager.department_id,
+        User.id != manager.id
+    )
+    return query, columns, totals
+
+def _team_member_data(row):
+    return {
+        'id': row.id,
+        'full_name': row.full_name,
+        'login': row.login,
+        'role': row.role,
+        'assessments_count': row.assessments_count,
+        'avg_self_score': row.avg_self_score,
+        'avg_manager_score': row.avg_manager_score
+    }
+
+def _team_page(query, columns, sort, after=None, limit=TEAM_PAGE_SIZE):
+    """Страница команды с keyset пагинацией по (поле сортировки, id); sort='-поле' - по убыванию"""
+    descending = sort.startswith('-')
+    key = columns[sort.lstrip('-')]
+    
+    if after is not None:
+        if descending:
+            query = query.filter(or_(key < after[0], and_(key == after[0], User.id > after[1])))
+        else:
+            query = query.filter(or_(key > after[0], and_(key == after[0], User.id > after[1])))
+    
+    query = query.add_columns(key.label('sort_key'))
+    rows = query.order_by(key.desc() if descending else key, User.id).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(rows[limit - 1].sort_key, rows[limit - 1].id)
+    return rows[:limit], next_cursor
+
 @bp.route('/my-team')
 @login_required
 def my_team():
@@ -305,76 +417,96 @@ def my_team():
             'message': 'Доступ запрещен. Только для руководителей.'
         }), 403
     
-    #получение всех сотрудников с данного отдела (кроме самого руководства)
-    team_members = User.query.filter(
-        User.department_id == current_user.department_id,
-        User.id != current_user.id
-    ).all()
-    
-    #для всех сотрудников стата навыков
-    members_data = []
-    for member in team_members:
-        assessments = SkillAssessment.query.filter_by(user_id=member.id).all()
-        avg_self_score = None
-        avg_manager_score = None
-        
-        if assessments:
-            self_scores = [a.self_score for a in assessments if a.self_score]
-            manager_scores = [a.manager_score for a in assessments if a.manager_score]
-            
-            avg_self_score = sum(self_scores) / len(self_scores) if self_scores else None
-            avg_manager_score = sum(manager_scores) / len(manager_scores) if manager_scores else None
-        
-        members_data.append({
-            'id': member.id,
-            'full_name': member.full_name,
-            'login': member.login,
-            'role': member.role,
-            'assessments_count': len(assessments),
-            'avg_self_score': avg_self_score,
-            'avg_manager_score': avg_manager_score
-        })
+    #первая страница сотрудников и сводка по всей команде (оконные агрегаты) одним запросом
+    query, columns, totals = _team_members_query(current_user)
+    query = query.add_columns(
+        func.count().over().label('team_size'),
+        func.count(case((columns['assessments_count'] > 0, 1))).over().label('assessed_members'),
+        func.avg(totals.c.avg_manager_score).over().label('team_avg_manager_score')
+    )
+    rows, next_cursor = _team_page(query, columns, 'full_name')
+    
+    members_data = [_team_member_data(row) for row in rows]
+    team_stats = {
+        'team_size': rows[0].team_size if rows else 0,
+        'assessed_members': rows[0].assessed_members if rows else 0,
+        'avg_manager_score': rows[0].team_avg_manager_score if rows else None
+    }
     
     return render_template('my_team.html',
                           current_user=current_user,
                           team_members=members_data,
+                          team_stats=team_stats,
+                          next_cursor=next_cursor,
                           USER_ROLE=current_user.role)
+
+@bp.route('/api/my-team')
+@login_required
+def get_my_team():
+    """Сотрудники команды с агрегатами оценок: сортировка sort=[-]поле и keyset пагинация"""
+    if current_user.role != 'manager':
+        return jsonify({'success': False, 'message': 'Доступ запрещен. Только для руководителей.'}), 403
+    
+    sort = request.args.get('sort', 'full_name')
+    limit = min(max(request.args.get('limit', TEAM_PAGE_SIZE, type=int), 1), 200)
+    cursor = request.args.get('cursor')
+    
+    if sort.lstrip('-') not in TEAM_SORT_FIELDS:
+        return jsonify({
+            'success': False,
+            'message': f'Сортировка должна быть одной из: {", ".join(TEAM_SORT_FIELDS)} (с "-" - по убыванию)'
+        }), 400
+    
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, 2)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        query, columns, _ = _team_members_query(current_user)
+        rows, next_cursor = _team_page(query, columns, sort, after, limit)
+        return jsonify({
+            'success': True,
+            'members': [_team_member_data(row) for row in rows],
+            'sort': sort,
+            'next_cursor': next_cursor,
+            'limit': limit
+        })
+    except Exception as e:
+        print(f"❌ Ошибка загрузки команды: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
+
+@bp.route('/api/my-team/coverage')
+@login_required
+def get_team_coverage():
+    """Покрытие навыков командой руководителя и навыки с bus factor 1"""
+    if current_user.role != 'manager':
+        return jsonify({'success': False, 'message': 'Доступ запрещен. Только для руководителей.'}), 403
+    if current_user.department_id is None:
+        return jsonify({'success': False, 'message': 'Руководитель не привязан к отделу'}), 400
+    
+    department_id = current_user.department_id
+    try:
+        reports = analytics_cache.get_or_compute(
+            'team_coverage', department_id,
+            lambda: build_team_coverage(department_id, get_score_matrix())
+        )
+        return jsonify({
+            'success': True,
+            'coverage': reports[0] if reports else None
+        })
+    except Exception as e:
+        print(f"❌ Ошибка расчета покрытия навыков: {str(e)}")
+        return jsonify({'success': False, 'message': f'Ошибка: {str(e)}'}), 500
     
 @bp.route('/api/dashboard/stats')
 @login_required
+@conditional_response('users', 'departments', 'skills', 'skill_assessments')
 def get_dashboard_stats():
     """API для получения статистики дашборда"""
-    stats = {}
-    
-    if current_user.role == 'employee':
-        assessments = SkillAssessment.query.filter_by(user_id=current_user.id).all()
-        stats['assessed_skills'] = len(assessments)
-        stats['total_skills'] = Skill.query.count()
-        
-        if assessments:
-            total_score = sum(a.self_score for a in assessments if a.self_score)
-            stats['avg_score'] = round(total_score / len(assessments), 1)
-        else:
-            stats['avg_score'] = 0
-            
-    elif current_user.role == 'manager':
-        team_count = User.query.filter_by(department_id=current_user.department_id).count()
-        stats['team_count'] = team_count - 1 if team_count > 0 else 0
-        
-        pending_reviews = SkillAssessment.query.join(
-            User, SkillAssessment.user_id == User.id
-        ).filter(
-            User.department_id == current_user.department_id,
-            User.id != current_user.id,
-            SkillAssessment.manager_score.is_(None),
-            SkillAssessment.self_score.isnot(None)
-        ).count()
-        stats['pending_reviews'] = pending_reviews
-        
-    elif current_user.role == 'hr':
-        stats['total_users'] = User.query.count()
-        stats['total_departments'] = Department.query.count()
-        stats['total_skills'] = Skill.query.count()
+    stats = load_dashboard_stats(current_user)
     
     return jsonify({
         'success': True,
@@ -445,6 +577,12 @@ def assess_skill():
             'message': f'Ошибка при сохранении: {str(e)}'
         }), 500
 
+@bp.route('/api/assessments/batch', methods=['POST'])
+@login_required
+def assess_skills_batch():
+    """Пакетная самооценка навыков: {"assessments": [{"skill_id", "score"}]}"""
+    return _save_assessment_batch(current_user.id, 'self_score', 'Изменение самооценки')
+
 @bp.route('/register')
 @login_required
 def register_page():
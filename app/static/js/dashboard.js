@@ -342,4 +342,81 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('addUserForm').addEventListener('change', function(e) {
         saveFormData();
     });
-});
\ No newline at end of file
+});
+// Загрузка JSON с учетом ETag / Last-Modified: сервер отвечает 304,
+// если данные не менялись, и мы берем сохраненный ответ из sessionStorage
+function fetchJSONWithValidators(url) {
+    const storageKey = `validators:${url}`;
+    let cached = null;
+    try {
+        cached = JSON.parse(sessionStorage.getItem(storageKey));
+    } catch (e) {
+        cached = null;
+    }
+
+    const headers = { 'Accept': 'application/json' };
+    if (cached) {
+        if (cached.etag) headers['If-None-Match'] = cached.etag;
+        if (cached.lastModified) headers['If-Modified-Since'] = cached.lastModified;
+    }
+
+    return fetch(url, { headers: headers, credentials: 'same-origin' })
+        .then(response => {
+            if (response.status === 304 && cached) {
+                return cached.data;
+            }
+            return response.json().then(data => {
+                const etag = response.headers.get('ETag');
+                if (response.ok && etag) {
+                    try {
+                        sessionStorage.setItem(storageKey, JSON.stringify({
+                            etag: etag,
+                            lastModified: response.headers.get('Last-Modified'),
+                            data: data
+                        }));
+                    } catch (e) {
+                        // sessionStorage переполнен - просто работаем без кэша
+                    }
+                }
+                return data;
+            });
+        });
+}
+
+// Статистика дашборда встроена в страницу при рендере, поэтому при загрузке
+// запрос к API не нужен; обновляем ее только когда вкладка снова становится видимой
+let dashboardStats = readEmbeddedDashboardStats();
+
+function readEmbeddedDashboardStats() {
+    const element = document.getElementById('dashboardStatsData');
+    if (!element) return null;
+    try {
+        return JSON.parse(element.textContent);
+    } catch (e) {
+        return null;
+    }
+}
+
+function renderDashboardStats(stats) {
+    document.querySelectorAll('[data-stat]').forEach(element => {
+        const value = stats[element.dataset.stat] || 0;
+        element.textContent = element.dataset.format === 'fixed1' ? Number(value).toFixed(1) : value;
+    });
+}
+
+function refreshDashboardStats() {
+    fetchJSONWithValidators('/user/api/dashboard/stats')
+        .then(data => {
+            if (data && data.success) {
+                dashboardStats = data.data;
+                renderDashboardStats(dashboardStats);
+            }
+        })
+        .catch(error => console.error('Error loading dashboard stats:', error));
+}
+
+document.addEventListener('visibilitychange', function() {
+    if (dashboardStats && document.visibilityState === 'visible') {
+        refreshDashboardStats();
+    }
+});
@@ -8,22 +8,61 @@ document.addEventListener('DOMContentLoaded', function() {
     console.log('MANAGER_CHART_URL:', MANAGER_CHART_URL);
     console.log('USER_ROLE:', USER_ROLE || 'not defined');
     
-    // Инициализация в зависимости от роли
-    if (USER_ROLE !== 'hr') {
-        initializeManagerRating();
-    } else {
-        initializeHRView();
-    }
-    
+    initializeCategories();
     initializeRadarChart();
     loadChartData();
 });
 
-function initializeManagerRating() {
+// Навыки категории загружаются при первом раскрытии
+function initializeCategories() {
+    const headers = document.querySelectorAll('.category-header[data-category]');
+    headers.forEach(header => {
+        header.addEventListener('click', function() {
+            toggleCategory(this.closest('.category-card'));
+        });
+    });
+    
+    // Первую категорию раскрываем сразу
+    if (headers.length > 0) {
+        toggleCategory(headers[0].closest('.category-card'));
+    }
+}
+
+function toggleCategory(card) {
+    const list = card.querySelector('.skills-list');
+    list.hidden = !list.hidden;
+    if (list.hidden || list.dataset.loaded) {
+        return;
+    }
+    list.dataset.loaded = 'true';
+    
+    fetch(`${EMPLOYEE_CATEGORY_URL}${encodeURIComponent(list.dataset.category)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message || 'Ошибка загрузки категории');
+            }
+            list.innerHTML = data.html;
+            
+            // Инициализация в зависимости от роли
+            if (USER_ROLE !== 'hr') {
+                initializeManagerRating(list);
+            } else {
+                initializeHRView(list);
+            }
+        })
+        .catch(error => {
+            console.error('Error loading category:', error);
+            delete list.dataset.loaded;
+            list.innerHTML = '<div class="text-muted">Не удалось загрузить навыки</div>';
+        });
+}
+
+function initializeManagerRating(root = document) {
     console.log('Initializing manager rating...');
     
     // Обработчики для кнопок оценки руководителя
-    document.querySelectorAll('.score-btn').forEach(btn => {
+    root.querySelectorAll('.score-btn').forEach(btn => {
         btn.addEventListener('click', function() {
             const skillItem = this.closest('.skill-item');
             const skillId = skillItem.dataset.skillId;
@@ -53,16 +92,16 @@ function initializeManagerRating() {
     });
 }
 
-function initializeHRView() {
+function initializeHRView(root = document) {
     console.log('Initializing HR view (read-only mode)');
     
     // Для HR скрываем кнопки оценки
-    document.querySelectorAll('.score-btn').forEach(btn => {
+    root.querySelectorAll('.score-btn').forEach(btn => {
         btn.style.display = 'none';
     });
     
     // Меняем заголовки оценок
-    document.querySelectorAll('.score-manager').forEach(badge => {
+    root.querySelectorAll('.score-manager').forEach(badge => {
         if (badge.title === 'Ваша оценка') {
             badge.title = 'Оценка руководителя';
         }
@@ -281,29 +320,19 @@ function loadChartData() {
     document.getElementById('chartContainer').style.display = 'none';
     document.getElementById('noDataMessage').style.display = 'none';
     
-    // Загружаем данные через API
-    fetch(MANAGER_CHART_URL)
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .then(data => {
-            console.log('Chart data received from API:', data);
+    // Загружаем ряд оцененных навыков и словарь названий
+    loadSkillChartData(MANAGER_CHART_URL)
+        .then(chartData => {
+            console.log('Chart data received from API:', chartData);
+            lastChartData = chartData;
             
-            if (data.success && data.chart_data) {
-                // Фильтруем только те навыки, у которых есть хотя бы одна оценка
-                const filteredData = filterChartData(data.chart_data);
-                
-                if (filteredData.hasData) {
-                    updateChartWithFilteredData(filteredData);
-                } else {
-                    console.log('No assessment data available');
-                    showNoDataMessage();
-                }
+            // Фильтруем только те навыки, у которых есть хотя бы одна оценка
+            const filteredData = filterChartData(chartData);
+            
+            if (filteredData.hasData) {
+                updateChartWithFilteredData(filteredData);
             } else {
-                console.warn('No chart data available from API');
+                console.log('No assessment data available');
                 showNoDataMessage();
             }
         })
@@ -313,6 +342,54 @@ function loadChartData() {
         });
 }
 
+// Словарь навыков {id: [название, категория]} общий для всех графиков, перезагружается при смене версии
+let skillLabels = null;
+// Последние загруженные данные графика (для отладки без повторного запроса)
+let lastChartData = null;
+
+function fetchJSON(url) {
+    return fetch(url).then(response => {
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    });
+}
+
+function loadSkillLabels(version) {
+    if (skillLabels && skillLabels.version === version) {
+        return Promise.resolve(skillLabels);
+    }
+    return fetchJSON(SKILL_LABELS_URL).then(data => {
+        skillLabels = data;
+        return data;
+    });
+}
+
+function loadSkillChartData(url) {
+    // Ряд содержит только id оцененных навыков и оценки (null - нет оценки)
+    return fetchJSON(url).then(series => {
+        if (!series.success) {
+            throw new Error(series.message || 'Ошибка загрузки данных графика');
+        }
+        return loadSkillLabels(series.labels_version).then(labels => {
+            const chartData = { labels: [], self_scores: [], manager_scores: [], skill_ids: [] };
+            series.skill_ids.forEach((skillId, index) => {
+                const label = labels.skills[skillId];
+                if (!label) {
+                    return;
+                }
+                chartData.skill_ids.push(skillId);
+                chartData.labels.push(label[0]);
+                chartData.self_scores.push(series.self_scores[index]);
+                chartData.manager_scores.push(series.manager_scores[index]);
+            });
+            chartData.total_skills = chartData.labels.length;
+            return chartData;
+        });
+    });
+}
+
 function filterChartData(chartData) {
     const labels = [];
     const selfScores = [];
@@ -506,16 +583,17 @@ function showErrorToast(message) {
 // Вспомогательная функция для отладки (можно удалить в продакшене)
 window.testChartAPI = function() {
     console.log('Testing chart API...');
-    fetch(MANAGER_CHART_URL)
-        .then(r => r.json())
-        .then(data => {
-            console.log('API Response:', data);
-            if (data.success && data.chart_data) {
-                console.log('Skills from API:', data.chart_data.labels);
-                console.log('Total skills:', data.chart_data.labels.length);
-                console.log('Self scores:', data.chart_data.self_scores);
-                console.log('Manager scores:', data.chart_data.manager_scores);
-            }
+    // Берем данные последней загрузки графика, без повторного запроса
+    const chartDataPromise = lastChartData
+        ? Promise.resolve(lastChartData)
+        : loadSkillChartData(MANAGER_CHART_URL);
+    chartDataPromise
+        .then(chartData => {
+            console.log('Chart data:', chartData);
+            console.log('Skills from API:', chartData.labels);
+            console.log('Total skills:', chartData.labels.length);
+            console.log('Self scores:', chartData.self_scores);
+            console.log('Manager scores:', chartData.manager_scores);
         })
         .catch(e => console.error('API Error:', e));
 };
@@ -1,6 +1,7 @@
 document.addEventListener('DOMContentLoaded', function() {
     // Инициализация
     setupEventListeners();
+    loadTeamCoverage();
 });
 
 let currentMemberId = null;
@@ -8,11 +9,26 @@ let currentMemberName = '';
 let skillsData = [];
 let pendingChanges = {};
 
+// Экранирование данных пользователей перед вставкой в HTML
+function escapeHtml(value) {
+    return String(value ?? '')
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
 function setupEventListeners() {
     // Обработчики для модального окна
     document.querySelector('.close-assessment').addEventListener('click', closeAssessmentModal);
     document.getElementById('saveAssessmentBtn').addEventListener('click', saveAllAssessments);
     
+    const loadMoreBtn = document.getElementById('loadMoreMembersBtn');
+    if (loadMoreBtn) {
+        loadMoreBtn.addEventListener('click', loadMoreMembers);
+    }
+    
     // Закрытие модального окна при клике на оверлей
     document.getElementById('assessmentModal').addEventListener('click', function(e) {
         if (e.target === this) {
@@ -231,4 +247,118 @@ function showAssessmentToast(message, type = 'success') {
     setTimeout(() => {
         toast.style.display = 'none';
     }, 3000);
-}
\ No newline at end of file
+}
+
+function loadTeamCoverage() {
+    const list = document.getElementById('busFactorList');
+    const table = document.getElementById('coverageTable');
+    if (!list || !table) return;
+    
+    fetch('/user/api/my-team/coverage')
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                list.textContent = data.message || 'Ошибка загрузки покрытия';
+                return;
+            }
+            renderTeamCoverage(data.coverage, list, table);
+        })
+        .catch(error => {
+            console.error('Error loading coverage:', error);
+            list.textContent = 'Ошибка загрузки покрытия';
+        });
+}
+
+function renderTeamCoverage(coverage, list, table) {
+    if (!coverage || coverage.skills.ids.length === 0) {
+        list.textContent = 'Навыки команды еще не оценены';
+        return;
+    }
+    
+    // Навыки, которые держатся на одном человеке
+    const risky = new Set(coverage.bus_factor_1.map(item => item.skill_id));
+    if (coverage.bus_factor_1.length) {
+        list.innerHTML = '<strong>Зависят от одного человека:</strong> ' + coverage.bus_factor_1
+            .map(item => `${escapeHtml(item.skill)} (${escapeHtml(item.full_name || '—')})`)
+            .join(', ');
+    } else {
+        list.textContent = 'Нет навыков, которые зависят от одного человека';
+    }
+    
+    const tbody = table.querySelector('tbody');
+    tbody.innerHTML = '';
+    const skills = coverage.skills;
+    skills.ids.forEach((skillId, i) => {
+        const row = document.createElement('tr');
+        row.innerHTML = `
+            <td class="${risky.has(skillId) ? 'coverage-risk' : ''}">${escapeHtml(skills.names[i])}</td>
+            <td>${escapeHtml(skills.categories[i])}</td>
+            <td>${skills.rated[i]} / ${coverage.team_size}</td>
+            <td>${skills.level_3[i]}</td>
+            <td>${skills.level_4[i]}</td>
+        `;
+        tbody.appendChild(row);
+    });
+    table.style.display = 'table';
+}
+
+function loadMoreMembers() {
+    const grid = document.getElementById('teamMembersGrid');
+    const button = document.getElementById('loadMoreMembersBtn');
+    const cursor = grid.dataset.nextCursor;
+    if (!cursor) return;
+    
+    button.disabled = true;
+    fetch(`/user/api/my-team?cursor=${encodeURIComponent(cursor)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                showAssessmentToast(data.message || 'Ошибка загрузки команды', 'error');
+                return;
+            }
+            data.members.forEach(member => grid.appendChild(renderMemberCard(member)));
+            grid.dataset.nextCursor = data.next_cursor || '';
+            button.style.display = data.next_cursor ? '' : 'none';
+        })
+        .catch(error => {
+            console.error('Error loading team:', error);
+            showAssessmentToast('Ошибка загрузки команды', 'error');
+        })
+        .finally(() => {
+            button.disabled = false;
+        });
+}
+
+function renderMemberCard(member) {
+    const card = document.createElement('div');
+    card.className = 'member-card';
+    card.dataset.memberId = member.id;
+    
+    const initial = member.full_name ? member.full_name.split(' ')[0][0] : 'U';
+    const avgSelf = member.avg_self_score ? member.avg_self_score.toFixed(1) : '-';
+    card.innerHTML = `
+        <div class="member-header">
+            <div class="member-avatar">${escapeHtml(initial)}</div>
+            <div class="member-info">
+                <h3>${escapeHtml(member.full_name)}</h3>
+                <div class="role">${escapeHtml(member.login)}</div>
+            </div>
+        </div>
+        <div class="member-stats">
+            <div class="stat-item">
+                <div class="stat-value">${escapeHtml(member.assessments_count)}</div>
+                <div class="stat-label">Оцененных навыков</div>
+            </div>
+            <div class="stat-item">
+                <div class="stat-value">${avgSelf}</div>
+                <div class="stat-label">Средняя самооценка</div>
+            </div>
+        </div>
+        <div class="member-actions">
+            <a href="/user/employee/${encodeURIComponent(member.id)}" class="btn-view">
+                <i class="fas fa-eye"></i> Посмотреть профиль сотрудника
+            </a>
+        </div>
+    `;
+    return card;
+}
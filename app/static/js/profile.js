@@ -3,18 +3,57 @@ let chartData = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Profile page loaded');
-    initializeSkillRating();
+    initializeCategories();
     initializeRadarChart();
     
     // Загружаем начальные данные для графика
     loadChartData();
 });
 
-function initializeSkillRating() {
+// Навыки категории загружаются при первом раскрытии
+function initializeCategories() {
+    const headers = document.querySelectorAll('.category-header[data-category]');
+    headers.forEach(header => {
+        header.addEventListener('click', function() {
+            toggleCategory(this.closest('.category-card'));
+        });
+    });
+    
+    // Первую категорию раскрываем сразу
+    if (headers.length > 0) {
+        toggleCategory(headers[0].closest('.category-card'));
+    }
+}
+
+function toggleCategory(card) {
+    const list = card.querySelector('.skills-list');
+    list.hidden = !list.hidden;
+    if (list.hidden || list.dataset.loaded) {
+        return;
+    }
+    list.dataset.loaded = 'true';
+    
+    fetch(`${PROFILE_CATEGORY_URL}${encodeURIComponent(list.dataset.category)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message || 'Ошибка загрузки категории');
+            }
+            list.innerHTML = data.html;
+            initializeSkillRating(list);
+        })
+        .catch(error => {
+            console.error('Error loading category:', error);
+            delete list.dataset.loaded;
+            list.innerHTML = '<div class="text-muted">Не удалось загрузить навыки</div>';
+        });
+}
+
+function initializeSkillRating(root = document) {
     console.log('Initializing skill rating...');
     
     // Обработчики для кнопок оценки
-    document.querySelectorAll('.score-btn').forEach(btn => {
+    root.querySelectorAll('.score-btn').forEach(btn => {
         btn.addEventListener('click', function() {
             const skillItem = this.closest('.skill-item');
             const skillId = skillItem.dataset.skillId;
@@ -217,44 +256,49 @@ function loadChartData() {
     document.getElementById('chartContainer').style.display = 'none';
     document.getElementById('noDataMessage').style.display = 'none';
     
-    // Имитируем загрузку данных (в реальности здесь будет AJAX запрос)
-    setTimeout(() => {
-        updateChartFromDOM();
-    }, 500);
+    // Навыки категорий загружаются лениво, поэтому данные графика берем из API:
+    // ряд оцененных навыков (id и оценки) и общий словарь названий навыков
+    fetch(PROFILE_CHART_URL)
+        .then(response => response.json())
+        .then(series => {
+            if (!series.success || series.skill_ids.length === 0) {
+                showNoDataMessage();
+                return;
+            }
+            return loadSkillLabels(series.labels_version).then(labels => {
+                const skills = [];
+                const selfScores = [];
+                const managerScores = [];
+                series.skill_ids.forEach((skillId, index) => {
+                    const label = labels.skills[skillId];
+                    if (label) {
+                        skills.push(label[0]);
+                        selfScores.push(series.self_scores[index] || 0);
+                        managerScores.push(series.manager_scores[index] || 0);
+                    }
+                });
+                updateChart(skills, selfScores, managerScores);
+            });
+        })
+        .catch(error => {
+            console.error('Error loading chart data:', error);
+            showNoDataMessage();
+        });
 }
 
-function updateChartFromDOM() {
-    console.log('Updating chart from DOM...');
-    
-    // Собираем данные из DOM
-    const skills = [];
-    const selfScores = [];
-    const managerScores = [];
-    
-    document.querySelectorAll('.skill-item').forEach(skillItem => {
-        const skillId = skillItem.dataset.skillId;
-        const skillName = skillItem.querySelector('.skill-name').textContent;
-        
-        // Получаем самооценку
-        const selfScoreBadge = skillItem.querySelector('.score-self');
-        const selfScore = selfScoreBadge ? parseInt(selfScoreBadge.textContent) : 0;
-        
-        // Получаем оценку руководителя
-        const managerScoreBadge = skillItem.querySelector('.score-manager');
-        const managerScore = managerScoreBadge ? parseInt(managerScoreBadge.textContent) : 0;
-        
-        if (selfScore > 0 || managerScore > 0) {
-            skills.push(skillName);
-            selfScores.push(selfScore);
-            managerScores.push(managerScore);
-        }
-    });
-    
-    if (skills.length > 0) {
-        updateChart(skills, selfScores, managerScores);
-    } else {
-        showNoDataMessage();
+// Словарь навыков {id: [название, категория]}, перезагружается при смене версии
+let skillLabels = null;
+
+function loadSkillLabels(version) {
+    if (skillLabels && skillLabels.version === version) {
+        return Promise.resolve(skillLabels);
     }
+    return fetch(SKILL_LABELS_URL)
+        .then(response => response.json())
+        .then(data => {
+            skillLabels = data;
+            return data;
+        });
 }
 
 function updateChart(skills, selfScores, managerScores) {
@@ -321,17 +365,8 @@ function updateChart(skills, selfScores, managerScores) {
 function updateChartData(skillId, newScore) {
     console.log(`Updating chart data for skill ${skillId} with score ${newScore}`);
     
-    // Находим элемент навыка
-    const skillItem = document.querySelector(`.skill-item[data-skill-id="${skillId}"]`);
-    if (!skillItem) {
-        console.error(`Skill item ${skillId} not found`);
-        return;
-    }
-    
-    const skillName = skillItem.querySelector('.skill-name').textContent;
-    
-    // Обновляем данные графика из DOM
-    updateChartFromDOM();
+    // Перезагружаем данные графика
+    loadChartData();
 }
 
 function showNoDataMessage() {
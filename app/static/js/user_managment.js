@@ -126,8 +126,7 @@ function setupModalEventListeners() {
 }
 
 function loadDepartments() {
-    return fetch('/hr/api/departments')
-        .then(response => response.json())
+    return fetchJSONWithValidators('/hr/api/departments')
         .then(data => {
             if (data.success) {
                 const select = document.getElementById('department_id');
@@ -540,20 +539,50 @@ function deleteUser() {
     });
 }
 
-// Поиск по навыкам
-function searchBySkill() {
-    const skillName = document.getElementById('skillSearch').value.trim();
+// Подсказки навыков: сервер ищет по префиксу, весь каталог в браузер не грузим
+function suggestSkills(query) {
+    clearTimeout(debounceTimers.skillSuggestions);
+    const datalist = document.getElementById('skillSuggestions');
+    if (!query || !query.trim()) {
+        datalist.innerHTML = '';
+        return;
+    }
+    
+    debounceTimers.skillSuggestions = setTimeout(() => {
+        fetch(`/api/skills/search?q=${encodeURIComponent(query.trim())}&limit=15`)
+            .then(response => response.ok ? response.json() : [])
+            .then(skills => {
+                datalist.innerHTML = '';
+                skills.forEach(skill => {
+                    const option = document.createElement('option');
+                    option.value = skill.name;
+                    option.label = skill.category;
+                    datalist.appendChild(option);
+                });
+            })
+            .catch(error => console.error('Error loading skill suggestions:', error));
+    }, 150);
+}
+
+// Поиск по навыкам (результаты приходят страницами, следующая страница - по курсору)
+let skillSearchState = null;
+
+function searchBySkill(cursor = null) {
+    const skillName = cursor ? skillSearchState.skillName : document.getElementById('skillSearch').value.trim();
     const minScoreSelect = document.getElementById('minScore');
-    const minScore = minScoreSelect ? minScoreSelect.value : 1;
+    const minScore = cursor ? skillSearchState.minScore : (minScoreSelect ? minScoreSelect.value : 1);
     
     if (!skillName) {
         showNotification('Введите название навыка для поиска', 'error');
         return;
     }
     
-    // Очищаем предыдущие результаты
-    document.getElementById('skillSearchResults').style.display = 'none';
-    document.getElementById('skillResultsContent').innerHTML = '';
+    if (!cursor) {
+        // Очищаем предыдущие результаты
+        skillSearchState = { skillName, minScore, users: [], totalFound: null };
+        document.getElementById('skillSearchResults').style.display = 'none';
+        document.getElementById('skillResultsContent').innerHTML = '';
+    }
     
     const searchBtn = document.querySelector('button[onclick="searchBySkill()"]');
     const originalText = searchBtn.innerHTML;
@@ -564,6 +593,12 @@ function searchBySkill() {
         skill: skillName,
         min_score: minScore
     });
+    if (cursor) {
+        params.set('cursor', cursor);
+    } else {
+        // Общее количество считается только для первой страницы
+        params.set('include_total', '1');
+    }
     
     fetch(`/hr/search-by-skills?${params}`)
         .then(response => {
@@ -577,16 +612,26 @@ function searchBySkill() {
             searchBtn.innerHTML = '<i class="fas fa-search me-2"></i>Найти сотрудников';
             
             if (data.success) {
+                // Копим страницы, общее количество берем из первого ответа
+                skillSearchState.users = skillSearchState.users.concat(data.users || []);
+                if (data.total_found !== null && data.total_found !== undefined) {
+                    skillSearchState.totalFound = data.total_found;
+                }
+                data.users = skillSearchState.users;
+                data.total_found = skillSearchState.totalFound;
+                
                 // Добавляем minScore в данные для отображения
                 data.minScore = minScore;
                 displaySkillSearchResults(data);
                 document.getElementById('skillSearchResults').style.display = 'block';
                 
-                // Прокрутка к результатам
-                document.getElementById('skillSearchResults').scrollIntoView({
-                    behavior: 'smooth',
-                    block: 'start'
-                });
+                if (!cursor) {
+                    // Прокрутка к результатам
+                    document.getElementById('skillSearchResults').scrollIntoView({
+                        behavior: 'smooth',
+                        block: 'start'
+                    });
+                }
             } else {
                     showNotification(data.message || 'Ошибка поиска', 'error');
             }
@@ -683,6 +728,16 @@ function displaySkillSearchResults(data) {
     });
     
     html += '</div>';
+    
+    if (data.next_cursor) {
+        html += `
+            <div style="text-align: center; margin-top: 1.5rem;">
+                <button class="btn" onclick="searchBySkill('${data.next_cursor}')" style="padding: 0.75rem 2rem; background: #f8f9fa; border: 1px solid #ddd; border-radius: 5px; cursor: pointer;">
+                    <i class="fas fa-chevron-down"></i> Показать еще
+                </button>
+            </div>
+        `;
+    }
     content.innerHTML = html;
 }
 
@@ -1240,8 +1295,7 @@ function updateSearchResultsInfo(visible, total) {
 function loadAllUsers() {
     const tableBody = document.getElementById('usersTableBody');
     
-    fetch('/hr/api/all-users')
-        .then(response => response.json())
+    fetchJSONWithValidators('/hr/api/all-users')
         .then(data => {
             if (data.success) {
                 renderUsersTable(data.users);
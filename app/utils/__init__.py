@@ -3,7 +3,11 @@ from .helpers import (
     make_response,
     validate_required_fields,
     format_score,
-    calculate_average_scores
+    calculate_average_scores,
+    calculate_average_scores_batch,
+    calculate_score_statistics_batch,
+    encode_cursor,
+    decode_cursor
 )
 
 from .validators import (
@@ -21,6 +25,144 @@ from .export_csv import (
     create_csv_response
 )
 
+from .rollups import (
+    get_hr_summary,
+    rebuild_rollups,
+    ensure_rollups
+)
+
+from .changes import (
+    subscribe,
+    subscribe_flush,
+    mark_changed
+)
+
+from .cache import (
+    AnalyticsCache,
+    analytics_cache
+)
+
+from .versioning import (
+    conditional_response,
+    get_versions,
+    data_version
+)
+
+from .notifications import (
+    ChangeNotifier,
+    change_notifier
+)
+
+from .live_stats import (
+    HRStatsFeed,
+    hr_stats_feed,
+    snapshot_delta
+)
+
+from .score_matrix import (
+    ScoreMatrix,
+    score_matrix,
+    get_score_matrix
+)
+
+from .reports import (
+    final_score_expression,
+    build_heatmap,
+    build_distribution,
+    build_cohort_comparison,
+    build_team_coverage
+)
+
+from .trends import (
+    rebuild_trends,
+    get_trends,
+    TREND_BUCKETS
+)
+
+from .search import (
+    normalize_text,
+    trigrams,
+    NgramIndex,
+    get_search_backend,
+    ensure_search_indexes
+)
+
+from .skill_index import (
+    SkillPrefixIndex,
+    skill_index,
+    get_skill_index
+)
+
+from .talent import (
+    parse_talent_query,
+    evaluate_with_matrix,
+    evaluate_with_sql
+)
+
+from .dashboard_stats import (
+    DashboardStatsCache,
+    dashboard_stats,
+    compute_dashboard_stats,
+    get_dashboard_stats
+)
+
+from .similarity import (
+    SimilarityIndex,
+    similarity_index,
+    similar_users_sql
+)
+
+from .history import (
+    HistoryCapture,
+    history_capture,
+    history_trigger_enabled,
+    acting_user_id,
+    set_acting_user,
+    execute_without_history_trigger
+)
+
+from .journal import (
+    HistoryJournal,
+    history_journal,
+    history_entry,
+    record_history,
+    write_history
+)
+
+from .assessments import (
+    parse_assessment_batch,
+    upsert_assessments,
+    MAX_BATCH_SIZE
+)
+
+from .chart_data import (
+    ChartDataCache,
+    chart_cache,
+    compute_skill_series,
+    compute_skill_labels,
+    encode_payload
+)
+
+from .skill_catalog import (
+    SkillCatalog,
+    skill_catalog,
+    get_skill_catalog
+)
+
+from .invalidation import (
+    InvalidationBus,
+    invalidation_bus,
+    invalidate
+)
+
+from .skill_import import (
+    read_import_rows,
+    validate_import_rows,
+    diff_catalog,
+    apply_import,
+    MAX_IMPORT_ROWS
+)
+
 __all__ = [
     #helpers.py
     'JSONEncoder',
@@ -28,6 +170,10 @@ __all__ = [
     'validate_required_fields',
     'format_score',
     'calculate_average_scores',
+    'calculate_average_scores_batch',
+    'calculate_score_statistics_batch',
+    'encode_cursor',
+    'decode_cursor',
     
     #validators.py
     'validate_password_strength',
@@ -40,5 +186,118 @@ __all__ = [
     'export_assessments_to_csv',
     'export_users_to_csv',
     'export_skills_to_csv',
-    'create_csv_response'
+    'create_csv_response',
+
+    #rollups.py
+    'get_hr_summary',
+    'rebuild_rollups',
+    'ensure_rollups',
+
+    #changes.py
+    'subscribe',
+    'subscribe_flush',
+    'mark_changed',
+
+    #cache.py
+    'AnalyticsCache',
+    'analytics_cache',
+
+    #versioning.py
+    'conditional_response',
+    'get_versions',
+    'data_version',
+
+    #notifications.py
+    'ChangeNotifier',
+    'change_notifier',
+
+    #live_stats.py
+    'HRStatsFeed',
+    'hr_stats_feed',
+    'snapshot_delta',
+
+    #score_matrix.py
+    'ScoreMatrix',
+    'score_matrix',
+    'get_score_matrix',
+
+    #reports.py
+    'final_score_expression',
+    'build_heatmap',
+    'build_distribution',
+    'build_cohort_comparison',
+    'build_team_coverage',
+
+    #trends.py
+    'rebuild_trends',
+    'get_trends',
+    'TREND_BUCKETS',
+
+    #search.py
+    'normalize_text',
+    'trigrams',
+    'NgramIndex',
+    'get_search_backend',
+    'ensure_search_indexes',
+
+    #skill_index.py
+    'SkillPrefixIndex',
+    'skill_index',
+    'get_skill_index',
+
+    #talent.py
+    'parse_talent_query',
+    'evaluate_with_matrix',
+    'evaluate_with_sql',
+
+    #dashboard_stats.py
+    'DashboardStatsCache',
+    'dashboard_stats',
+    'compute_dashboard_stats',
+    'get_dashboard_stats',
+
+    #similarity.py
+    'SimilarityIndex',
+    'similarity_index',
+    'similar_users_sql',
+
+    #history.py
+    'HistoryCapture',
+    'history_capture',
+    'history_trigger_enabled',
+    'acting_user_id',
+    'set_acting_user',
+    'execute_without_history_trigger',
+
+    #journal.py
+    'HistoryJournal',
+    'history_journal',
+    'history_entry',
+    'record_history',
+    'write_history',
+
+    #assessments.py
+    'parse_assessment_batch',
+    'upsert_assessments',
+    'MAX_BATCH_SIZE',
+    #chart_data.py
+    'ChartDataCache',
+    'chart_cache',
+    'compute_skill_series',
+    'compute_skill_labels',
+    'encode_payload',
+    #skill_catalog.py
+    'SkillCatalog',
+    'skill_catalog',
+    'get_skill_catalog',
+    #invalidation.py
+    'InvalidationBus',
+    'invalidation_bus',
+    'invalidate',
+    #skill_import.py
+    'read_import_rows',
+    'validate_import_rows',
+    'diff_catalog',
+    'apply_import',
+    'MAX_IMPORT_ROWS'
 ]
\ No newline at end of file
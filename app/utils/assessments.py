@@ -0,0 +1,182 @@
+"""
+Пакетная запись оценок навыков.
+
+Пары (skill_id, оценка) проверяются целиком (один запрос к навыкам), затем
+измененные оценки записываются одним INSERT ... ON CONFLICT (user_id, skill_id)
+DO UPDATE (PostgreSQL и SQLite), а записи истории - одним массовым INSERT
+в той же транзакции (или через журнал истории, см. journal.py).
+
+Массовая запись идет в обход ORM, поэтому слушатели SkillAssessment и
+AssessmentHistory не срабатывают: агрегаты, динамика, матрица оценок и кэш
+дашборда обновляются здесь явно, а измененные таблицы помечаются через
+mark_changed (версии, кэш аналитики, уведомления других процессов).
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select
+
+from .. import db
+from ..models import Skill, SkillAssessment, User
+from .changes import mark_changed
+from .dashboard_stats import queue_invalidation
+from .history import execute_without_history_trigger
+from .journal import history_entry, record_history
+from .rollups import apply_deltas, assessment_vector, combine, scopes_for, skill_scope
+from .score_matrix import queue_assessment_deltas
+
+SCORE_FIELDS = ('self_score', 'manager_score')
+MAX_BATCH_SIZE = 500
+
+assessments_table = SkillAssessment.__table__
+
+def parse_assessment_batch(items, max_size=MAX_BATCH_SIZE):
+    """
+    Проверяет пакет оценок [{'skill_id': ..., 'score': ...}] одним запросом к навыкам.
+
+    Returns:
+        tuple: ({skill_id: оценка}, [{'index', 'skill_id', 'message'}]) - ошибки по элементам
+
+    Raises:
+        ValueError: пакет не список, пустой или больше max_size
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('Передайте непустой список оценок assessments')
+    if len(items) > max_size:
+        raise ValueError(f'Слишком много оценок в одном запросе (больше {max_size})')
+
+    scores, errors, positions = {}, [], {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'skill_id': None, 'message': 'Ожидается объект {skill_id, score}'})
+            continue
+        skill_id, score = item.get('skill_id'), item.get('score')
+        try:
+            skill_id = int(skill_id)
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'skill_id': skill_id, 'message': 'Некорректный skill_id'})
+            continue
+        try:
+            score = int(score)
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'skill_id': skill_id, 'message': 'Некорректная оценка'})
+            continue
+        if not 1 <= score <= 5:
+            errors.append({'index': index, 'skill_id': skill_id, 'message': 'Оценка должна быть от 1 до 5'})
+            continue
+        if skill_id in scores:
+            errors.append({'index': index, 'skill_id': skill_id, 'message': 'Навык указан несколько раз'})
+            continue
+        scores[skill_id] = score
+        positions[skill_id] = index
+
+    if scores:
+        known = set(db.session.execute(select(Skill.id).where(Skill.id.in_(scores))).scalars())
+        for skill_id in scores.keys() - known:
+            errors.append({'index': positions[skill_id], 'skill_id': skill_id, 'message': 'Навык не найден'})
+            del scores[skill_id]
+
+    errors.sort(key=lambda error: error['index'])
+    return scores, errors
+
+def _upsert_statement(dialect_name, field, rows):
+    """INSERT ... ON CONFLICT (user_id, skill_id) DO UPDATE для диалекта соединения"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f'Пакетная запись оценок не поддерживается для {dialect_name}')
+
+    statement = dialect_insert(assessments_table).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[assessments_table.c.user_id, assessments_table.c.skill_id],
+        set_={field: statement.excluded[field], 'updated_at': statement.excluded.updated_at}
+    ).returning(assessments_table.c.id, assessments_table.c.skill_id)
+
+def upsert_assessments(session, user_id, field, scores, changed_by=None, notes=None):
+    """
+    Записывает оценки пользователя {skill_id: оценка} в поле field одним upsert.
+    Оценки, совпадающие с текущими, пропускаются. Коммит делает вызывающий код.
+
+    Returns:
+        list: измененные оценки [{'skill_id', 'assessment_id', 'old_value', 'new_value'}]
+    """
+    if field not in SCORE_FIELDS:
+        raise ValueError(f'Неизвестный тип оценки: {field}')
+
+    connection = session.connection()
+    #старые значения берутся под блокировкой: строка пользователя упорядочивает
+    #параллельные upsert его оценок (в том числе еще не существующих), а FOR UPDATE
+    #по оценкам - с остальными путями записи, поэтому дельты сводок не теряются
+    user = connection.execute(
+        select(User.department_id, User.role).where(User.id == user_id).with_for_update()
+    ).first()
+    if user is None:
+        raise ValueError(f'Пользователь {user_id} не найден')
+
+    existing = {
+        row.skill_id: row
+        for row in connection.execute(
+            select(
+                assessments_table.c.skill_id,
+                assessments_table.c.self_score,
+                assessments_table.c.manager_score
+            ).where(
+                assessments_table.c.user_id == user_id,
+                assessments_table.c.skill_id.in_(scores)
+            ).with_for_update()
+        )
+    }
+
+    changed = {}
+    for skill_id, score in scores.items():
+        row = existing.get(skill_id)
+        old = (row.self_score, row.manager_score) if row is not None else None
+        if old is not None and old[SCORE_FIELDS.index(field)] == score:
+            continue
+        changed[skill_id] = old
+    if not changed:
+        return []
+
+    #историю с примечанием и автором пишем сами в обоих режимах, триггер ее пропускает
+    now = datetime.utcnow()
+    result = execute_without_history_trigger(connection, _upsert_statement(connection.dialect.name, field, [
+        {'user_id': user_id, 'skill_id': skill_id, field: scores[skill_id], 'assessed_at': now, 'updated_at': now}
+        for skill_id in sorted(changed)
+    ]))
+    ids = {row.skill_id: row.id for row in result}
+
+    saved, history, vectors, skill_deltas, matrix_rows = [], [], [], {}, []
+    for skill_id, old in sorted(changed.items()):
+        old_self, old_manager = old if old is not None else (None, None)
+        new_self, new_manager = (scores[skill_id], old_manager) if field == 'self_score' else (old_self, scores[skill_id])
+        old_value = old_self if field == 'self_score' else old_manager
+
+        delta = assessment_vector(new_self, new_manager)
+        if old is not None:
+            delta = combine(assessment_vector(old_self, old_manager, sign=-1), delta)
+        vectors.append(delta)
+        skill_deltas[skill_scope(skill_id)] = delta
+        matrix_rows.append((user_id, skill_id, new_self, new_manager))
+        history.append(history_entry(
+            ids[skill_id], field, old_value, scores[skill_id],
+            changed_by=changed_by, notes=notes, changed_at=now
+        ))
+        saved.append({
+            'skill_id': skill_id,
+            'assessment_id': ids[skill_id],
+            'old_value': old_value,
+            'new_value': scores[skill_id]
+        })
+
+    #срезы пользователя получают сумму изменений, срезы навыков - изменение своей оценки
+    total = combine(*vectors)
+    apply_deltas(connection, {**{scope: total for scope in scopes_for(user.department_id, user.role)}, **skill_deltas})
+    #история и динамика: в этой транзакции или через журнал (динамику в режиме триггеров обновляет БД)
+    record_history(session, history, connection)
+
+    queue_assessment_deltas(session, matrix_rows)
+    queue_invalidation(session, [user_id], [user.department_id])
+    mark_changed(session, assessments_table.name)
+    return saved
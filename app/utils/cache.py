@@ -0,0 +1,174 @@
+"""
+Кэш результатов аналитики.
+
+Результаты хранятся по ключу (название отчета, срез), например
+('hr_summary', 'all') или ('team_stats', '<id отдела>'). Запись данных
+не удаляет значения, а помечает их устаревшими: следующий запрос получает
+старое значение сразу, а пересчет идет в фоновом потоке (stale-while-revalidate).
+Блокирующий пересчет бывает только при первом прогреве ключа.
+
+Каждый сброс увеличивает поколение кэша. Результат, посчитанный в поколении,
+которое успело смениться, не сохраняется: он мог прочитать данные до записи.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from .. import db
+from .changes import subscribe_flush
+from .invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+#таблицы, изменение которых делает аналитику устаревшей
+ANALYTICS_TABLES = frozenset({'users', 'departments', 'skills', 'skill_assessments'})
+
+ANALYTICS_TOPIC = 'analytics'
+
+class _Entry:
+    __slots__ = ('value', 'created_at', 'stale')
+
+    def __init__(self, value):
+        self.value = value
+        self.created_at = time.monotonic()
+        self.stale = False
+
+class AnalyticsCache:
+    """LRU кэш с TTL, фоновым обновлением и счетчиками попаданий"""
+
+    def __init__(self, app=None, ttl=300, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0,
+            'evictions': 0, 'errors': 0, 'discarded': 0
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('ANALYTICS_CACHE_TTL', self.ttl)
+        self.maxsize = app.config.setdefault('ANALYTICS_CACHE_MAXSIZE', self.maxsize)
+        app.extensions['analytics_cache'] = self
+        self.clear()
+        #у значений есть свой TTL, запасной срок шины не нужен
+        invalidation_bus.register(ANALYTICS_TOPIC, _on_invalidate, ttl=0)
+
+    def get_or_compute(self, report, scope, compute):
+        """Возвращает значение отчета, при необходимости пересчитывая его"""
+        key = (report, str(scope))
+
+        with self._lock:
+            generation = self._generation
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                expired = time.monotonic() - entry.created_at > self.ttl
+                if not entry.stale and not expired:
+                    self._stats['hits'] += 1
+                    return entry.value
+
+                self._stats['stale_hits'] += 1
+                start_refresh = key not in self._refreshing
+                if start_refresh:
+                    self._refreshing.add(key)
+            else:
+                self._stats['misses'] += 1
+
+        if entry is None:
+            #холодный старт: считаем синхронно
+            value = compute()
+            self._store(key, value, generation)
+            return value
+
+        if start_refresh:
+            value = self._schedule_refresh(key, compute, generation)
+            if value is not None:
+                return value
+        return entry.value
+
+    def invalidate(self, report=None, scope=None):
+        """Помечает значения устаревшими (все, по отчету или по отчету и срезу)"""
+        with self._lock:
+            self._generation += 1
+            for (entry_report, entry_scope), entry in self._entries.items():
+                if report is not None and entry_report != report:
+                    continue
+                if scope is not None and entry_scope != str(scope):
+                    continue
+                entry.stale = True
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Счетчики попаданий/промахов и размер кэша"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['maxsize'] = self.maxsize
+            stats['ttl'] = self.ttl
+        return stats
+
+    def _store(self, key, value, generation):
+        with self._lock:
+            #значение, сброшенное во время пересчета, не сохраняем: данные могли устареть
+            if generation != self._generation:
+                self._stats['discarded'] += 1
+                return False
+            self._entries[key] = _Entry(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return True
+
+    def _schedule_refresh(self, key, compute, generation):
+        """Запускает пересчет в фоне; в синхронном режиме (тесты) сразу возвращает новое значение"""
+        app = current_app._get_current_object()
+        if app.config.get('ANALYTICS_CACHE_ASYNC', not app.testing):
+            thread = threading.Thread(target=self._refresh, args=(app, key, compute, generation), daemon=True)
+            thread.start()
+            return None
+        return self._refresh(app, key, compute, generation)
+
+    def _refresh(self, app, key, compute, generation):
+        try:
+            with app.app_context():
+                try:
+                    value = compute()
+                finally:
+                    db.session.remove()
+            if self._store(key, value, generation):
+                with self._lock:
+                    self._stats['refreshes'] += 1
+            return value
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            logger.error(f"Ошибка фонового пересчета {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+analytics_cache = AnalyticsCache()
+
+@subscribe_flush
+def invalidate_analytics(session, tables):
+    #рассылка остальным вместе с транзакцией, пометка в этом процессе - после commit
+    #(ключ - название отчета, None - все)
+    if tables & ANALYTICS_TABLES:
+        invalidation_bus.invalidate(ANALYTICS_TOPIC, session=session)
+
+def _on_invalidate(report):
+    analytics_cache.invalidate(report=report)
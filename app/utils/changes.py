@@ -0,0 +1,62 @@
+"""
+Отслеживание изменений данных в сессии SQLAlchemy.
+
+После каждого flush запоминаем, какие таблицы были затронуты, а после
+успешного commit передаем этот набор подписчикам (кэши, счетчики версий).
+При откате транзакции накопленные изменения просто отбрасываются.
+"""
+
+import logging
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_subscribers = []
+_flush_subscribers = []
+
+def subscribe(callback):
+    """Регистрирует обработчик, вызываемый после commit с набором измененных таблиц"""
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+    return callback
+
+def subscribe_flush(callback):
+    """Регистрирует обработчик, вызываемый внутри транзакции (session, таблицы) при каждом изменении"""
+    if callback not in _flush_subscribers:
+        _flush_subscribers.append(callback)
+    return callback
+
+def mark_changed(session, *tables):
+    """Помечает таблицы измененными (для массовых операций в обход ORM)"""
+    session.info.setdefault('changed_tables', set()).update(tables)
+    for callback in list(_flush_subscribers):
+        callback(session, frozenset(tables))
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_tables(session, flush_context):
+    tables = set()
+    for obj in chain(session.new, session.deleted):
+        tables.add(obj.__tablename__)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tables.add(obj.__tablename__)
+    if tables:
+        mark_changed(session, *tables)
+
+@event.listens_for(Session, 'after_commit')
+def _notify_subscribers(session):
+    tables = session.info.pop('changed_tables', None)
+    if not tables:
+        return
+    for callback in list(_subscribers):
+        try:
+            callback(frozenset(tables))
+        except Exception as e:
+            logger.error(f"Ошибка обработчика изменений {callback.__name__}: {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_tables(session):
+    session.info.pop('changed_tables', None)
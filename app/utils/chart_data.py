@@ -0,0 +1,176 @@
+"""
+Компактные данные графика навыков сотрудника.
+
+Ряд пользователя содержит только оцененные навыки, по колонкам:
+skill_ids, self_scores, manager_scores (null - оценки нет). Названия и
+категории навыков отдаются отдельным словарем {id: [название, категория]}
+(/skill/api/skills/labels), общим для всех сотрудников и проверяемым
+браузером по ETag. Размер ряда зависит от числа оцененных навыков,
+а не от размера каталога.
+
+Готовые ответы (байты JSON или MessagePack) хранятся в LRU кэше по ключу
+(пользователь, версия его оценок, версия skills, формат). Версия оценок
+пользователя - их число и время последнего изменения (один запрос по
+индексу user_id), версия навыков берется из data_versions. Запись оценок
+в любом процессе делает старый ключ этого пользователя недоступным без
+явного сброса, ключи остальных сотрудников не меняются, а устаревшие
+вытесняются по LRU.
+
+MessagePack (?format=msgpack) доступен, если установлен пакет msgpack.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from sqlalchemy import func
+
+from .. import db
+from ..models import Skill, SkillAssessment
+from .versioning import get_versions
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT_JSON = 'json'
+FORMAT_MSGPACK = 'msgpack'
+
+MIMETYPES = {
+    FORMAT_JSON: 'application/json',
+    FORMAT_MSGPACK: 'application/x-msgpack'
+}
+
+def available_formats():
+    """Форматы ответа, доступные в текущем окружении"""
+    return (FORMAT_JSON, FORMAT_MSGPACK) if msgpack is not None else (FORMAT_JSON,)
+
+def parse_format(value):
+    """Формат ответа из параметра ?format= (None - неизвестный или недоступный)"""
+    fmt = (value or FORMAT_JSON).lower()
+    return fmt if fmt in available_formats() else None
+
+def chart_response(body, fmt):
+    """Ответ Flask с готовыми байтами и типом содержимого формата"""
+    return current_app.response_class(body, mimetype=MIMETYPES[fmt])
+
+def encode_payload(payload, fmt=FORMAT_JSON):
+    """Кодирует ответ в байты: компактный JSON или MessagePack"""
+    if fmt == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise ValueError('Формат msgpack недоступен: пакет msgpack не установлен')
+        return msgpack.packb(payload, use_bin_type=True)
+    if fmt != FORMAT_JSON:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def compute_skill_series(user_id):
+    """Оцененные навыки пользователя по колонкам в порядке категорий и названий"""
+    rows = db.session.query(
+        SkillAssessment.skill_id,
+        SkillAssessment.self_score,
+        SkillAssessment.manager_score
+    ).join(
+        Skill, Skill.id == SkillAssessment.skill_id
+    ).filter(
+        SkillAssessment.user_id == user_id,
+        (SkillAssessment.self_score.isnot(None)) | (SkillAssessment.manager_score.isnot(None))
+    ).order_by(Skill.category, Skill.name).all()
+
+    return {
+        'skill_ids': [row.skill_id for row in rows],
+        'self_scores': [row.self_score for row in rows],
+        'manager_scores': [row.manager_score for row in rows]
+    }
+
+def user_series_version(user_id):
+    """Версия оценок пользователя: число оценок и время последнего изменения"""
+    count, updated_at = db.session.query(
+        func.count(SkillAssessment.id),
+        func.max(SkillAssessment.updated_at)
+    ).filter(SkillAssessment.user_id == user_id).one()
+    return f'{count}.{updated_at:%Y%m%d%H%M%S%f}' if updated_at is not None else str(count)
+
+def compute_skill_labels():
+    """Словарь навыков {id: [название, категория]} (ключи - строки, как в JSON)"""
+    rows = db.session.query(Skill.id, Skill.name, Skill.category).order_by(Skill.id).all()
+    return {str(row.id): [row.name, row.category] for row in rows}
+
+class ChartDataCache:
+    """LRU кэш закодированных ответов графика по ключу с версиями данных"""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def init_app(self, app):
+        self.maxsize = app.config.setdefault('CHART_CACHE_MAXSIZE', self.maxsize)
+        app.extensions['chart_cache'] = self
+        self.clear()
+
+    def get_or_encode(self, key, build, fmt):
+        """Готовые байты ответа из кэша или собранные и закодированные заново"""
+        key = key + (fmt,)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return body
+            self._stats['misses'] += 1
+
+        body = encode_payload(build(), fmt)
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['bytes'] = sum(len(body) for body in self._entries.values())
+        return stats
+
+chart_cache = ChartDataCache()
+
+def _encode(key, build, fmt):
+    if 'chart_cache' not in current_app.extensions:
+        return encode_payload(build(), fmt)
+    return chart_cache.get_or_encode(key, build, fmt)
+
+def skill_series_body(user_id, fmt=FORMAT_JSON):
+    """Ответ /user/api/employee/<id>/skills-data в байтах выбранного формата"""
+    #ключ меняют только оценки этого пользователя, а не любая запись оценок
+    version = user_series_version(user_id)
+    labels_version = get_versions('skills')['skills'][0]
+
+    def build():
+        return {
+            'success': True,
+            'user_id': user_id,
+            'version': version,
+            'labels_version': labels_version,
+            **compute_skill_series(user_id)
+        }
+    return _encode(('series', user_id, version, labels_version), build, fmt)
+
+def skill_labels_body(fmt=FORMAT_JSON):
+    """Ответ /skill/api/skills/labels в байтах выбранного формата"""
+    version = get_versions('skills')['skills'][0]
+
+    def build():
+        return {'success': True, 'version': version, 'skills': compute_skill_labels()}
+    return _encode(('labels', version), build, fmt)
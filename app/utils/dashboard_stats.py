@@ -0,0 +1,181 @@
+"""
+Статистика дашборда пользователя с кэшем на пользователя.
+
+Страница /user/dashboard и /user/api/dashboard/stats берут статистику из
+одного источника. Значения хранятся в LRU кэше с TTL по ключу
+(пользователь, роль) и сбрасываются точечно: изменение оценок сотрудника
+сбрасывает его запись и записи руководителей его отдела, изменение
+пользователей, отделов и навыков (общие счетчики) - весь кэш.
+
+Счетчики руководителя (размер команды, ожидающие проверки самооценки)
+читаются из агрегатов analytics_rollups, а не считаются JOIN по отделу.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import AnalyticsRollup, Department, Skill, SkillAssessment, User
+from .changes import subscribe
+from .notifications import change_notifier
+from .rollups import SCOPE_DEPARTMENT, department_key, get_global_rollup, pending_expression
+
+#таблицы с общими счетчиками: их изменение сбрасывает весь кэш
+GLOBAL_TABLES = frozenset({'users', 'departments', 'skills'})
+
+def _rollup(scope, scope_key):
+    return AnalyticsRollup.query.filter_by(scope=scope, scope_key=scope_key).first()
+
+def compute_dashboard_stats(user):
+    """Статистика дашборда для роли пользователя"""
+    stats = {}
+
+    if user.role == 'employee':
+        assessed, self_sum = db.session.query(
+            func.count(SkillAssessment.id), func.coalesce(func.sum(SkillAssessment.self_score), 0)
+        ).filter(SkillAssessment.user_id == user.id).one()
+        stats['assessed_skills'] = assessed
+        stats['total_skills'] = Skill.query.count()
+        stats['avg_score'] = round(self_sum / assessed, 1) if assessed else 0
+
+    elif user.role == 'manager':
+        rollup = _rollup(SCOPE_DEPARTMENT, department_key(user.department_id))
+        team_count = rollup.user_count if rollup else 0
+        stats['team_count'] = team_count - 1 if team_count > 0 else 0
+
+        #счетчик отдела включает самооценки самого руководителя
+        own_pending = db.session.query(func.count(pending_expression())).filter(
+            SkillAssessment.user_id == user.id
+        ).scalar()
+        stats['pending_reviews'] = max((rollup.pending_count if rollup else 0) - own_pending, 0)
+
+    elif user.role == 'hr':
+        rollup = get_global_rollup()
+        stats['total_users'] = rollup.user_count if rollup else User.query.count()
+        stats['total_departments'] = Department.query.count()
+        stats['total_skills'] = Skill.query.count()
+
+    return stats
+
+class _Entry:
+    __slots__ = ('value', 'created_at', 'department_id')
+
+    def __init__(self, value, department_id):
+        self.value = value
+        self.created_at = time.monotonic()
+        self.department_id = department_id
+
+class DashboardStatsCache:
+    """LRU кэш статистики дашборда по (пользователь, роль) с TTL"""
+
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('DASHBOARD_STATS_TTL', self.ttl)
+        self.maxsize = app.config.setdefault('DASHBOARD_STATS_MAXSIZE', self.maxsize)
+        app.extensions['dashboard_stats'] = self
+        self.clear()
+        change_notifier.add_listener(_on_remote_change)
+
+    def get(self, user):
+        """Статистика пользователя из кэша или вычисленная заново"""
+        key = (user.id, user.role)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry.value
+            self._stats['misses'] += 1
+
+        value = compute_dashboard_stats(user)
+        with self._lock:
+            self._entries[key] = _Entry(value, user.department_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def invalidate(self, user_ids=(), department_ids=()):
+        """Сбрасывает записи пользователей и руководителей отделов"""
+        user_ids, department_ids = set(user_ids), set(department_ids)
+        with self._lock:
+            for key in list(self._entries):
+                user_id, role = key
+                entry = self._entries[key]
+                if user_id in user_ids or (role == 'manager' and entry.department_id in department_ids):
+                    del self._entries[key]
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        return stats
+
+dashboard_stats = DashboardStatsCache()
+
+def get_dashboard_stats(user):
+    """Статистика дашборда (через кэш, если он подключен к приложению)"""
+    if 'dashboard_stats' not in current_app.extensions:
+        return compute_dashboard_stats(user)
+    return dashboard_stats.get(user)
+
+#изменения оценок копятся в сессии и сбрасывают кэш только после commit
+
+def _queue_assessment_change(connection, target, user_id):
+    session = Session.object_session(target)
+    if session is None or user_id is None:
+        return
+    department_id = connection.execute(
+        select(User.department_id).where(User.id == user_id)
+    ).scalar()
+    queue_invalidation(session, [user_id], [department_id])
+
+def queue_invalidation(session, user_ids, department_ids):
+    """Сброс записей после commit (в том числе для массовых записей в обход ORM)"""
+    changes = session.info.setdefault('dashboard_stats_changes', (set(), set()))
+    changes[0].update(user_ids)
+    changes[1].update(department_ids)
+
+@event.listens_for(SkillAssessment, 'after_insert')
+@event.listens_for(SkillAssessment, 'after_update')
+@event.listens_for(SkillAssessment, 'after_delete')
+def _dashboard_assessment_changed(mapper, connection, target):
+    _queue_assessment_change(connection, target, target.user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_dashboard_changes(session):
+    changes = session.info.pop('dashboard_stats_changes', None)
+    if changes:
+        dashboard_stats.invalidate(*changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_changes(session):
+    session.info.pop('dashboard_stats_changes', None)
+
+@subscribe
+def _invalidate_global_counts(tables):
+    if tables & GLOBAL_TABLES:
+        dashboard_stats.clear()
+
+def _on_remote_change(payload):
+    #в других процессах неизвестно, чьи оценки изменились: сбрасываем все
+    if payload.get('pid') != os.getpid() and set(payload.get('tables', ())) & (GLOBAL_TABLES | {'skill_assessments'}):
+        dashboard_stats.clear()
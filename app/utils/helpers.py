@@ -1,7 +1,12 @@
+import base64
 import json
 from datetime import datetime, date
 from decimal import Decimal
 from flask import jsonify
+import numpy as np
+
+#допустимые значения оценок
+SCORE_VALUES = np.arange(1, 6)
 
 class JSONEncoder(json.JSONEncoder):
     """Кастомный JSON encoder для обработки специальных типов"""
@@ -64,4 +69,70 @@ def calculate_average_scores(scores):
     if not valid_scores:
         return None
     
-    return sum(valid_scores) / len(valid_scores)
\ No newline at end of file
+    return sum(valid_scores) / len(valid_scores)
+
+def calculate_average_scores_batch(histograms):
+    """
+    Векторный аналог calculate_average_scores для многих групп сразу.
+    Принимает гистограммы оценок (для каждой группы 5 счетчиков для баллов 1..5),
+    возвращает список средних (None для пустых групп).
+    """
+    counts = np.asarray(histograms, dtype=np.float64).reshape(-1, len(SCORE_VALUES))
+    totals = counts.sum(axis=1)
+    sums = counts @ SCORE_VALUES
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(totals > 0, sums / totals, np.nan)
+    return [None if np.isnan(mean) else float(mean) for mean in means]
+
+def calculate_score_statistics_batch(histograms, quantiles=(0.25, 0.5, 0.75, 0.9)):
+    """
+    Статистика по гистограммам оценок 1..5 для многих групп: количество, среднее,
+    стандартное отклонение (генеральное) и перцентили с линейной интерполяцией,
+    как у percentile_cont в PostgreSQL. Исходные оценки не разворачиваются.
+    """
+    counts = np.asarray(histograms, dtype=np.int64).reshape(-1, len(SCORE_VALUES))
+    totals = counts.sum(axis=1)
+    cumulative = counts.cumsum(axis=1)
+    means = calculate_average_scores_batch(counts)
+
+    results = []
+    for group, total in enumerate(totals):
+        if total == 0:
+            results.append({'count': 0, 'mean': None, 'stddev': None,
+                            'percentiles': {q: None for q in quantiles}})
+            continue
+
+        mean = means[group]
+        variance = float(counts[group] @ (SCORE_VALUES - mean) ** 2) / total
+
+        #значение k-го (с нуля) элемента отсортированной выборки
+        positions = np.asarray(quantiles, dtype=np.float64) * (total - 1)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.ceil(positions).astype(np.int64)
+        lower_values = SCORE_VALUES[np.searchsorted(cumulative[group], lower, side='right')]
+        upper_values = SCORE_VALUES[np.searchsorted(cumulative[group], upper, side='right')]
+        values = lower_values + (positions - lower) * (upper_values - lower_values)
+
+        results.append({
+            'count': int(total),
+            'mean': mean,
+            'stddev': float(np.sqrt(variance)),
+            'percentiles': {q: float(value) for q, value in zip(quantiles, values)}
+        })
+    return results
+
+def encode_cursor(*values):
+    """Непрозрачный курсор keyset пагинации из значений ключа сортировки последней строки"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Разбор курсора; ValueError, если курсор поврежден или другой длины"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Некорректный курсор')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Некорректный курсор')
+    return values
@@ -0,0 +1,240 @@
+"""
+Запись истории изменений оценок.
+
+По умолчанию (режим orm) историю ORM изменений пишет слушатель after_update
+SkillAssessment в models.py: запись AssessmentHistory на каждое измененное
+поле с автором из current_user. Массовые записи в обход ORM он не видит.
+
+Режим trigger (только PostgreSQL) переносит эту запись в БД: statement-level
+триггер UPDATE на skill_assessments пишет те же записи из переходных таблиц
+(старые и новые строки всего запроса) одним INSERT ... SELECT, а триггер на
+assessment_history добавляет все записи истории в агрегаты динамики
+(score_trend_buckets). Автор изменения берется из настройки транзакции
+app.current_user_id, которую приложение выставляет из current_user
+(set_config(..., true) действует до конца транзакции).
+
+Записи, которые код пишет сам через record_history (с примечанием и автором
+маршрута), пишутся в обоих режимах одинаково; массовый upsert оценок при
+этом выполняется через execute_without_history_trigger, чтобы триггер не
+записал те же изменения второй раз.
+
+Триггеры устанавливает и удаляет команда flask history-capture trigger|orm
+(HISTORY_CAPTURE - режим по умолчанию для нее), при запуске приложения
+режим только определяется по pg_trigger: схема не меняется, и все воркеры
+работают в режиме, который фактически установлен в БД. После смены режима
+воркеры нужно перезапустить. На SQLite всегда используется слушатель.
+"""
+
+import logging
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .. import db
+from .changes import mark_changed, subscribe_flush
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_ORM = 'orm'
+CAPTURE_TRIGGER = 'trigger'
+
+ACTING_USER_SETTING = 'app.current_user_id'
+HISTORY_SKIP_SETTING = 'app.history_skip'
+
+HISTORY_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION skill_assessments_capture_history() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    acting_user integer := NULLIF(current_setting('{ACTING_USER_SETTING}', true), '')::integer;
+    changed timestamp := timezone('utc', now());
+BEGIN
+    --историю этого запроса пишет само приложение (upsert_assessments)
+    IF current_setting('{HISTORY_SKIP_SETTING}', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    --те же записи, что слушатель after_update в models.py
+    INSERT INTO assessment_history (assessment_id, field_changed, old_value, new_value, changed_by, changed_at, notes,
+                                    department_id)
+    SELECT n.id, f.field, f.old_value, f.new_value, acting_user, changed, f.notes, u.department_id
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    LEFT JOIN users u ON u.id = n.user_id
+    CROSS JOIN LATERAL (VALUES
+        ('self_score', o.self_score, n.self_score, 'Изменение самооценки'),
+        ('manager_score', o.manager_score, n.manager_score, 'Изменение оценки руководителя')
+    ) AS f(field, old_value, new_value, notes)
+    WHERE f.old_value IS DISTINCT FROM f.new_value;
+    RETURN NULL;
+END
+$$
+"""
+
+#тот же расчет, что trends.history_vector и trends.bucket_start
+TRENDS_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION assessment_history_capture_trends() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO score_trend_buckets (bucket, bucket_start, skill_id, department_key, field_changed,
+                                     change_count, value_sum, value_count, delta_sum, delta_count)
+    SELECT b.bucket, b.bucket_start, a.skill_id, COALESCE(h.department_id::text, ''), h.field_changed,
+           count(*), COALESCE(sum(h.new_value), 0), count(h.new_value),
+           COALESCE(sum(h.new_value - h.old_value), 0), count(h.new_value - h.old_value)
+    FROM new_history h
+    JOIN skill_assessments a ON a.id = h.assessment_id
+    CROSS JOIN LATERAL (VALUES
+        ('week', date_trunc('week', COALESCE(h.changed_at, timezone('utc', now())))::date),
+        ('month', date_trunc('month', COALESCE(h.changed_at, timezone('utc', now())))::date)
+    ) AS b(bucket, bucket_start)
+    GROUP BY b.bucket, b.bucket_start, a.skill_id, COALESCE(h.department_id::text, ''), h.field_changed
+    ON CONFLICT (bucket, bucket_start, skill_id, department_key, field_changed) DO UPDATE SET
+        change_count = score_trend_buckets.change_count + EXCLUDED.change_count,
+        value_sum = score_trend_buckets.value_sum + EXCLUDED.value_sum,
+        value_count = score_trend_buckets.value_count + EXCLUDED.value_count,
+        delta_sum = score_trend_buckets.delta_sum + EXCLUDED.delta_sum,
+        delta_count = score_trend_buckets.delta_count + EXCLUDED.delta_count;
+    RETURN NULL;
+END
+$$
+"""
+
+#(имя, таблица, событие, переходные таблицы, функция)
+HISTORY_TRIGGERS = (
+    ('skill_assessments_history_update', 'skill_assessments', 'UPDATE',
+     'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'skill_assessments_capture_history'),
+    ('assessment_history_trends', 'assessment_history', 'INSERT',
+     'NEW TABLE AS new_history', 'assessment_history_capture_trends'),
+)
+
+#триггеры прежних версий, которые удаляются при смене режима: (имя, таблица)
+OBSOLETE_TRIGGERS = (
+    ('skill_assessments_history_insert', 'skill_assessments'),
+)
+
+def installed_triggers(connection):
+    """Имена триггеров истории, установленных и включенных в БД (PostgreSQL)"""
+    names = [name for name, *_ in HISTORY_TRIGGERS] + [name for name, _ in OBSOLETE_TRIGGERS]
+    return set(connection.execute(
+        text("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal AND tgenabled <> 'D' AND tgname = ANY(:names)"),
+        {'names': names}
+    ).scalars())
+
+class HistoryCapture:
+    """Режим записи истории оценок: слушатель ORM или триггеры PostgreSQL"""
+
+    def __init__(self):
+        self.mode = CAPTURE_ORM
+
+    @property
+    def trigger_enabled(self):
+        return self.mode == CAPTURE_TRIGGER
+
+    def detect(self, connection=None):
+        """
+        Определяет режим по триггерам, установленным в БД (схему не меняет).
+        Если триггеры есть, слушатели ORM молчат, иначе история писалась бы дважды.
+        """
+        requested = current_app.config.get('HISTORY_CAPTURE', CAPTURE_ORM)
+        if connection is None:
+            with db.engine.connect() as connection:
+                return self.detect(connection)
+
+        installed = installed_triggers(connection) if connection.dialect.name == 'postgresql' else set()
+        self.mode = CAPTURE_TRIGGER if installed else CAPTURE_ORM
+        if installed and installed != {name for name, *_ in HISTORY_TRIGGERS}:
+            logger.warning(
+                f'Триггеры истории оценок установлены не полностью ({", ".join(sorted(installed))}), '
+                f'выполните flask history-capture trigger'
+            )
+        if requested != self.mode:
+            logger.warning(
+                f'HISTORY_CAPTURE={requested}, но в БД установлен режим {self.mode}: '
+                f'режим меняет команда flask history-capture {requested}'
+            )
+        return self.mode
+
+    def switch(self, mode, connection=None):
+        """
+        Устанавливает (trigger) или удаляет (orm) триггеры в транзакции connection.
+        Коммит делает вызывающий код; запущенные воркеры нужно перезапустить.
+        """
+        if mode not in (CAPTURE_ORM, CAPTURE_TRIGGER):
+            raise ValueError(f'Неизвестный режим записи истории: {mode}')
+        connection = connection or db.session.connection()
+        if connection.dialect.name != 'postgresql':
+            raise ValueError('Триггеры истории оценок поддерживаются только PostgreSQL')
+
+        for name, table in OBSOLETE_TRIGGERS:
+            connection.execute(text(f'DROP TRIGGER IF EXISTS {name} ON {table}'))
+        for name, table, *_ in HISTORY_TRIGGERS:
+            connection.execute(text(f'DROP TRIGGER IF EXISTS {name} ON {table}'))
+        if mode == CAPTURE_TRIGGER:
+            connection.execute(text(HISTORY_FUNCTION_SQL))
+            connection.execute(text(TRENDS_FUNCTION_SQL))
+            for name, table, operation, referencing, function in HISTORY_TRIGGERS:
+                connection.execute(text(
+                    f'CREATE TRIGGER {name} AFTER {operation} ON {table} '
+                    f'REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION {function}()'
+                ))
+        self.mode = mode
+
+history_capture = HistoryCapture()
+
+def history_trigger_enabled():
+    """История и динамика пишутся триггерами БД (ORM слушатели их пропускают)"""
+    return history_capture.trigger_enabled
+
+def acting_user_id():
+    """
+    id текущего пользователя, уже загруженного Flask-Login (None вне запроса).
+    Пользователь не загружается: это вызвало бы запрос внутри flush.
+    """
+    user = g.get('_login_user') if has_request_context() else None
+    return getattr(user, 'id', None)
+
+def set_acting_user(session, connection=None):
+    """Передает id текущего пользователя триггерам (один раз за транзакцию)"""
+    if not history_capture.trigger_enabled or session.info.get('acting_user_set'):
+        return
+    user_id = acting_user_id()
+    if user_id is None:
+        return
+    (connection or session.connection()).execute(
+        text('SELECT set_config(:name, :value, true)'),
+        {'name': ACTING_USER_SETTING, 'value': str(user_id)}
+    )
+    session.info['acting_user_set'] = True
+
+def execute_without_history_trigger(connection, statement):
+    """
+    Выполняет statement, историю которого вызывающий код пишет сам через
+    record_history, так что триггер ее пропускает. Возвращает строки результата.
+    """
+    if not history_capture.trigger_enabled or connection.dialect.name != 'postgresql':
+        return connection.execute(statement).all()
+    skip = text('SELECT set_config(:name, :value, true)')
+    connection.execute(skip, {'name': HISTORY_SKIP_SETTING, 'value': 'on'})
+    try:
+        return connection.execute(statement).all()
+    finally:
+        connection.execute(skip, {'name': HISTORY_SKIP_SETTING, 'value': ''})
+
+@event.listens_for(Session, 'after_begin')
+def _acting_user_on_begin(session, transaction, connection):
+    set_acting_user(session, connection)
+
+@event.listens_for(Session, 'before_flush')
+def _acting_user_on_flush(session, flush_context, instances):
+    #транзакция могла начаться до загрузки пользователя (запрос самого Flask-Login)
+    set_acting_user(session)
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reset_acting_user(session):
+    session.info.pop('acting_user_set', None)
+
+@subscribe_flush
+def _history_changed_by_trigger(session, tables):
+    #строки истории триггера не видны сессии: помечаем таблицу сами
+    if history_capture.trigger_enabled and 'skill_assessments' in tables:
+        mark_changed(session, 'assessment_history')
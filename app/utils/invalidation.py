@@ -0,0 +1,362 @@
+"""
+Шина сброса кэшей между процессами.
+
+Кэши в памяти процесса (каталог навыков, аналитика и т.п.) подписываются
+на тему: invalidation_bus.register('skill_catalog', handler, ttl=300).
+Изменяющий код вызывает invalidate(topic, key, session=session) внутри
+транзакции (обычно из subscribe_flush): сообщение остальным воркерам и
+репликам уходит вместе с транзакцией, а обработчик темы в текущем процессе
+вызывается после commit; при rollback не происходит ни того, ни другого
+(key=None - сбросить все значения темы). Без транзакции сброс выполняется
+и рассылается сразу.
+
+Транспорты (INVALIDATION_TRANSPORT):
+    notifier - через ChangeNotifier (notifications.py): тот же канал и тот же
+               LISTEN поток, сообщение уходит pg_notify в транзакции
+               изменения; по умолчанию для PostgreSQL (значение postgres -
+               то же самое);
+    socket   - Unix datagram сокеты в общем каталоге INVALIDATION_SOCKET_DIR,
+               для нескольких воркеров на одном хосте (SQLite) и тестов,
+               отправка после commit;
+    local    - только текущий процесс, по умолчанию для остальных БД.
+
+Сообщение может потеряться (обрыв LISTEN соединения, перезапуск воркера),
+поэтому у темы есть запасной TTL: если тема не сбрасывалась целиком дольше
+ttl секунд, перед очередным запросом обработчик вызывается с key=None.
+"""
+
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, scoped_session
+
+from .. import db
+from .notifications import change_notifier
+
+logger = logging.getLogger(__name__)
+
+class LocalBusTransport:
+    """Без рассылки: сброс только в текущем процессе"""
+
+    name = 'local'
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def publish_in_transaction(self, session, payload):
+        return False
+
+    def publish(self, payload):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+class NotifierBusTransport:
+    """
+    Сообщения шины внутри уведомлений ChangeNotifier ({'invalidation': ...}):
+    тот же канал, транспорт и LISTEN поток, что у остальных кэшей.
+    """
+
+    name = 'notifier'
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def publish_in_transaction(self, session, payload):
+        """pg_notify в транзакции session (доставка после commit). False - не отправлено"""
+        return change_notifier.publish(session, {'invalidation': payload})
+
+    def publish(self, payload):
+        #сброс вне транзакции изменения: отдельная короткая транзакция
+        with Session(db.engine) as session, session.begin():
+            if not self.publish_in_transaction(session, payload):
+                raise ValueError('Сообщение шины сброса не помещается в уведомление')
+        self.bus.record('sent')
+
+    def _receive(self, payload):
+        message = payload.get('invalidation')
+        if message is not None:
+            self.bus.dispatch(message)
+
+    def start(self):
+        change_notifier.add_listener(self._receive)
+
+    def stop(self):
+        change_notifier.remove_listener(self._receive)
+
+class SocketBusTransport:
+    """
+    Unix datagram сокет на каждый процесс в общем каталоге: публикация
+    отправляет сообщение во все сокеты каталога, сокеты завершенных
+    процессов удаляются при первой неудачной отправке.
+    """
+
+    name = 'socket'
+    max_datagram = 65536
+
+    def __init__(self, bus, directory):
+        self.bus = bus
+        self.directory = directory
+        self.path = os.path.join(directory, f'{bus.origin}.sock')
+        self._socket = None
+        self._sender = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._socket is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            listener.bind(self.path)
+            listener.settimeout(1.0)
+            self._socket = listener
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._receive_forever, name='invalidation-bus', daemon=True)
+            self._thread.start()
+
+    def _receive_forever(self):
+        listener = self._socket
+        while not self._stop.is_set():
+            try:
+                data = listener.recv(self.max_datagram)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            try:
+                self.bus.dispatch(json.loads(data.decode('utf-8')))
+            except ValueError:
+                logger.warning(f"Некорректное сообщение шины сброса: {data[:200]!r}")
+
+    def publish_in_transaction(self, session, payload):
+        #сокеты не связаны с транзакцией: отправка после commit
+        return False
+
+    def publish(self, payload):
+        if self._sender is None:
+            return
+        data = json.dumps(payload).encode('utf-8')
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.sock') or path == self.path:
+                continue
+            try:
+                self._sender.sendto(data, path)
+                self.bus.record('sent')
+            except (ConnectionRefusedError, FileNotFoundError):
+                #процесс-получатель завершился, его сокет больше не нужен
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                self.bus.record('send_errors')
+                logger.error(f"Ошибка отправки в {path}: {e}")
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            for sock in (self._socket, self._sender):
+                if sock is not None:
+                    sock.close()
+            self._socket = self._sender = None
+            if self._thread is not None:
+                self._thread.join(timeout=2)
+                self._thread = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+class _Topic:
+    __slots__ = ('handlers', 'ttl', 'reset_at')
+
+    def __init__(self, ttl):
+        self.handlers = []
+        self.ttl = ttl
+        self.reset_at = time.monotonic()
+
+class InvalidationBus:
+    """Рассылка invalidate(topic, key) обработчикам тем во всех процессах"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.transport = LocalBusTransport(self)
+        self._topics = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'published': 0, 'sent': 0, 'send_errors': 0, 'received': 0,
+            'handled': 0, 'handler_errors': 0, 'expired': 0
+        }
+        self._by_topic = {}
+        self._last_received_at = None
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('INVALIDATION_TTL', self.ttl)
+        database_uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        transport = app.config.setdefault(
+            'INVALIDATION_TRANSPORT',
+            'notifier' if database_uri.startswith('postgresql') else 'local'
+        )
+        directory = app.config.setdefault(
+            'INVALIDATION_SOCKET_DIR', os.path.join(tempfile.gettempdir(), 'skills_app_invalidate')
+        )
+
+        self.transport.stop()
+        #идентификатор отправителя: свои сообщения, вернувшиеся через транспорт, пропускаются
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        if transport in ('notifier', 'postgres'):
+            self.transport = NotifierBusTransport(self)
+        elif transport == 'socket':
+            self.transport = SocketBusTransport(self, directory)
+        else:
+            self.transport = LocalBusTransport(self)
+        with self._lock:
+            for topic in self._topics.values():
+                topic.reset_at = time.monotonic()
+            if self._topics:
+                self.transport.start()
+
+        if not self._atexit_registered:
+            atexit.register(self.stop)
+            self._atexit_registered = True
+
+        app.before_request(self.expire_due)
+        app.extensions['invalidation_bus'] = self
+
+    def register(self, topic, handler, ttl=None):
+        """
+        Подписывает обработчик handler(key) на тему. ttl - запасной срок,
+        после которого тема сбрасывается целиком без сообщения (0 - без срока,
+        None - INVALIDATION_TTL).
+        """
+        with self._lock:
+            entry = self._topics.setdefault(topic, _Topic(self.ttl if ttl is None else ttl))
+            if ttl is not None:
+                entry.ttl = ttl
+            if handler not in entry.handlers:
+                entry.handlers.append(handler)
+            self._by_topic.setdefault(topic, {'published': 0, 'received': 0, 'expired': 0})
+        self.transport.start()
+        return handler
+
+    def invalidate(self, topic, key=None, session=None):
+        """
+        Сбрасывает значение темы во всех процессах. С session в открытой
+        транзакции сообщение уходит вместе с ней (если транспорт это умеет,
+        иначе после commit), а сброс в текущем процессе - после commit;
+        при rollback отменяется и то, и другое.
+        """
+        if isinstance(session, scoped_session):
+            session = session()
+        if session is not None and session.in_transaction():
+            pending = session.info.setdefault('invalidations', {}).setdefault(self, {})
+            if (topic, key) not in pending:
+                pending[(topic, key)] = self.transport.publish_in_transaction(session, self._payload(topic, key))
+            return
+        self.committed(topic, key)
+
+    def committed(self, topic, key=None, sent=False):
+        """Сброс после commit: обработчики текущего процесса и рассылка, если она еще не ушла"""
+        self._handle(topic, key)
+        self.record('published', topic)
+        if sent:
+            #ушло вместе с транзакцией и доставляется после commit
+            self.record('sent')
+            return
+        try:
+            self.transport.publish(self._payload(topic, key))
+        except Exception as e:
+            self.record('send_errors')
+            logger.error(f"Ошибка публикации сброса {topic}/{key}: {e}")
+
+    def _payload(self, topic, key):
+        return {'topic': topic, 'key': key, 'origin': self.origin}
+
+    def dispatch(self, payload):
+        """Сообщение от транспорта: вызывает обработчики темы (свои сообщения пропускаются)"""
+        if payload.get('origin') == self.origin or 'topic' not in payload:
+            return
+        self._last_received_at = time.time()
+        self.record('received', payload['topic'])
+        self._handle(payload['topic'], payload.get('key'))
+
+    def _handle(self, topic, key):
+        with self._lock:
+            entry = self._topics.get(topic)
+            if entry is None:
+                return
+            handlers = list(entry.handlers)
+            if key is None:
+                entry.reset_at = time.monotonic()
+        for handler in handlers:
+            try:
+                handler(key)
+                self.record('handled')
+            except Exception as e:
+                self.record('handler_errors')
+                logger.error(f"Ошибка обработчика сброса {topic}: {e}")
+
+    def expire_due(self):
+        """Сбрасывает темы, не сбрасывавшиеся целиком дольше своего ttl"""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                topic for topic, entry in self._topics.items()
+                if entry.ttl and now - entry.reset_at > entry.ttl
+            ]
+        for topic in due:
+            self.record('expired', topic)
+            self._handle(topic, None)
+
+    def record(self, counter, topic=None):
+        with self._lock:
+            self._stats[counter] += 1
+            if topic is not None and counter in ('published', 'received', 'expired'):
+                self._by_topic.setdefault(topic, {'published': 0, 'received': 0, 'expired': 0})[counter] += 1
+
+    def stats(self):
+        """Счетчики доставки: всего и по темам"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['topics'] = {topic: dict(counters) for topic, counters in self._by_topic.items()}
+        stats['transport'] = self.transport.name
+        stats['last_received_at'] = self._last_received_at
+        return stats
+
+    def stop(self):
+        self.transport.stop()
+
+invalidation_bus = InvalidationBus()
+
+def invalidate(topic, key=None, session=None):
+    """Сброс значения темы во всех процессах (см. InvalidationBus.invalidate)"""
+    invalidation_bus.invalidate(topic, key, session)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_invalidations(session):
+    for bus, pending in session.info.pop('invalidations', {}).items():
+        for (topic, key), sent in pending.items():
+            bus.committed(topic, key, sent)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop('invalidations', None)
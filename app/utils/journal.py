@@ -0,0 +1,329 @@
+"""
+Журнал истории оценок: синхронная или отложенная запись AssessmentHistory.
+
+HISTORY_JOURNAL=sync (по умолчанию) - записи истории вставляются одним
+INSERT в транзакции изменения оценки, вместе с агрегатами динамики.
+
+HISTORY_JOURNAL=async - записи копятся в сессии и после commit попадают
+в ограниченную очередь процесса; фоновый поток забирает их пачками и
+пишет одним INSERT на пачку в отдельной транзакции, поэтому транзакция
+изменения оценки короче и держит меньше блокировок. Постановка в очередь
+не ждет: если очередь заполнена, вызывающий поток сам дописывает накопленное
+вместе со своими записями (backpressure), а при остановке процесса очередь
+дописывается до конца (atexit). Запись идет после commit, поэтому ошибки
+журнала не выбрасываются наружу: пачки, которые не удалось записать,
+сохраняются в файл HISTORY_JOURNAL_FAILED_PATH (по одной записи JSON в строке)
+и дописываются командой flask replay-history-journal.
+Записи в очереди живут только в памяти процесса: при аварийном завершении
+они теряются, поэтому для строгих установок остается режим sync.
+
+В режиме триггеров (см. history.py) журнал пишет только записи, которые код
+добавляет сам, а агрегаты динамики по ним обновляет триггер на assessment_history.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, select, insert
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import AssessmentHistory, SkillAssessment, User
+from .changes import mark_changed
+from .history import history_trigger_enabled
+from .trends import apply_trend_deltas, history_vector, trend_keys
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SYNC = 'sync'
+JOURNAL_ASYNC = 'async'
+
+history_table = AssessmentHistory.__table__
+
+def write_history(connection, entries):
+    """
+    Вставляет записи истории одним INSERT и добавляет их в агрегаты динамики
+    (в режиме триггеров это делает БД) через переданное соединение (в его
+    транзакции). Записи удаленных оценок
+    пропускаются. Возвращает число записанных строк.
+    """
+    if not entries:
+        return 0
+    rows = connection.execute(
+        select(SkillAssessment.id, SkillAssessment.skill_id, User.department_id)
+        .join(User, User.id == SkillAssessment.user_id)
+        .where(SkillAssessment.id.in_({entry['assessment_id'] for entry in entries}))
+    )
+    owners = {row.id: (row.skill_id, row.department_id) for row in rows}
+    entries = [entry for entry in entries if entry['assessment_id'] in owners]
+    if not entries:
+        return 0
+
+    #отдел на момент изменения: у записей из очереди он уже определен при постановке
+    for entry in entries:
+        entry.setdefault('department_id', owners[entry['assessment_id']][1])
+    connection.execute(insert(history_table), entries)
+    if history_trigger_enabled():
+        return len(entries)
+
+    trends = {}
+    for entry in entries:
+        skill_id = owners[entry['assessment_id']][0]
+        vector = history_vector(entry['old_value'], entry['new_value'])
+        for key in trend_keys(entry['changed_at'], skill_id, entry['department_id'], entry['field_changed']):
+            total = trends.setdefault(key, {})
+            for column, value in vector.items():
+                total[column] = total.get(column, 0) + value
+    apply_trend_deltas(connection, trends)
+    return len(entries)
+
+def resolve_departments(connection, entries):
+    """Проставляет записям истории текущий отдел владельца оценки одним запросом"""
+    missing = {entry['assessment_id'] for entry in entries if 'department_id' not in entry}
+    if not missing:
+        return
+    departments = dict(connection.execute(
+        select(SkillAssessment.id, User.department_id)
+        .join(User, User.id == SkillAssessment.user_id)
+        .where(SkillAssessment.id.in_(missing))
+    ).all())
+    for entry in entries:
+        entry.setdefault('department_id', departments.get(entry['assessment_id']))
+
+def history_entry(assessment_id, field, old_value, new_value, changed_by=None, notes=None, changed_at=None):
+    """Запись истории для record_history (время изменения фиксируется сразу)"""
+    return {
+        'assessment_id': assessment_id,
+        'field_changed': field,
+        'old_value': old_value,
+        'new_value': new_value,
+        'changed_by': changed_by,
+        'changed_at': changed_at or datetime.utcnow(),
+        'notes': notes
+    }
+
+class HistoryJournal:
+    """Ограниченная очередь записей истории с фоновой записью пачками"""
+
+    def __init__(self, maxsize=10000, batch_size=500, interval=0.5):
+        self.mode = JOURNAL_SYNC
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.failed_path = None
+        self.app = None
+        self._queue = queue.Queue(maxsize)
+        self._write_lock = threading.Lock()
+        self._failed_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._worker = None
+        self._stop = threading.Event()
+        self._stats = {'queued': 0, 'written': 0, 'batches': 0, 'backpressure': 0, 'failed': 0}
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self.mode = app.config.setdefault('HISTORY_JOURNAL', self.mode)
+        self.maxsize = app.config.setdefault('HISTORY_JOURNAL_MAXSIZE', self.maxsize)
+        self.batch_size = app.config.setdefault('HISTORY_JOURNAL_BATCH', self.batch_size)
+        self.interval = app.config.setdefault('HISTORY_JOURNAL_INTERVAL', self.interval)
+        self.failed_path = app.config.setdefault(
+            'HISTORY_JOURNAL_FAILED_PATH', os.path.join(app.instance_path, 'history_journal_failed.jsonl')
+        )
+        app.extensions['history_journal'] = self
+
+        #записи от предыдущего приложения дописываются до смены очереди
+        self.shutdown()
+        self.app = app
+        self._queue = queue.Queue(self.maxsize)
+        self._stop.clear()
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    @property
+    def enabled(self):
+        return self.mode == JOURNAL_ASYNC and self.app is not None
+
+    def _background(self):
+        #по умолчанию в фоне, в тестах очередь дописывается явно через flush()
+        return self.app.config.get('HISTORY_JOURNAL_BACKGROUND', not self.app.testing)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._write_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='history-journal', daemon=True)
+                self._worker.start()
+
+    def enqueue(self, entries):
+        """
+        Ставит записи в очередь без ожидания. Если очередь заполнена, накопленное
+        и оставшиеся записи дописываются пачками в текущем потоке. Вызывается
+        после commit, поэтому исключений не выбрасывает.
+        """
+        entries = list(entries)
+        if self._background():
+            try:
+                self._ensure_worker()
+            except RuntimeError as e:
+                #без фонового потока очередь дописывается при заполнении и остановке
+                logger.error(f"Не удалось запустить поток журнала истории: {e}")
+        self._count('queued', len(entries))
+        for index, entry in enumerate(entries):
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                self._count('backpressure')
+                self._write_through(entries[index:])
+                return
+
+    def _write_through(self, entries):
+        """Дописывает очередь и записи entries (более новые) в текущем потоке"""
+        with self._write_lock:
+            batch = self._drain(self.maxsize) + entries
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start:start + self.batch_size])
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Пишет пачку в отдельной транзакции (повтор один раз, затем в файл неудачных записей)"""
+        for attempt in range(2):
+            try:
+                with self.app.app_context():
+                    with Session(db.engine) as session, session.begin():
+                        written = write_history(session.connection(), batch)
+                        mark_changed(session, history_table.name, 'score_trend_buckets')
+                self._count('written', written)
+                self._count('batches')
+                return
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала истории ({len(batch)} записей, попытка {attempt + 1}): {e}")
+                time.sleep(self.interval * attempt)
+        self._save_failed(batch)
+
+    def _save_failed(self, entries):
+        self._count('failed', len(entries))
+        lines = ''.join(
+            json.dumps(dict(entry, changed_at=entry['changed_at'].isoformat()), ensure_ascii=False) + '\n'
+            for entry in entries
+        )
+        try:
+            with self._failed_lock:
+                os.makedirs(os.path.dirname(self.failed_path) or '.', exist_ok=True)
+                with open(self.failed_path, 'a', encoding='utf-8') as file:
+                    file.write(lines)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить записи журнала истории в {self.failed_path}: {e}\n{lines}")
+            return
+        logger.error(
+            f"{len(entries)} записей истории сохранены в {self.failed_path}, "
+            f"дописать: flask replay-history-journal"
+        )
+
+    def replay_failed(self):
+        """
+        Дописывает записи, сохраненные после неудачной записи пачек, одной
+        транзакцией и удаляет файл. Возвращает число записанных строк.
+        """
+        with self._failed_lock:
+            if not self.failed_path or not os.path.exists(self.failed_path):
+                return 0
+            with open(self.failed_path, encoding='utf-8') as file:
+                entries = [json.loads(line) for line in file if line.strip()]
+            for entry in entries:
+                entry['changed_at'] = datetime.fromisoformat(entry['changed_at'])
+            with Session(db.engine) as session, session.begin():
+                written = write_history(session.connection(), entries)
+                mark_changed(session, history_table.name, 'score_trend_buckets')
+            os.remove(self.failed_path)
+        return written
+
+    def flush(self):
+        """Дописывает все записи из очереди в текущем потоке"""
+        if self.app is None:
+            return
+        with self._write_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            with self._write_lock:
+                self._write([first] + self._drain(self.batch_size - 1))
+
+    def shutdown(self):
+        """Останавливает фоновый поток и дописывает остаток очереди"""
+        self._stop.set()
+        worker, self._worker = self._worker, None
+        if worker is not None and worker.is_alive():
+            worker.join(timeout=max(self.interval * 2, 1))
+        self.flush()
+        self._stop.clear()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _count(self, counter, value=1):
+        #счетчики меняются из потоков запросов и фонового потока
+        with self._stats_lock:
+            self._stats[counter] += value
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+history_journal = HistoryJournal()
+
+def record_history(session, entries, connection=None):
+    """
+    Записывает историю изменений оценок по текущему режиму журнала: в очередь
+    после commit или сразу в транзакции session.
+    """
+    if not entries:
+        return
+    if history_journal.enabled:
+        #отдел запоминается сейчас: к моменту записи пачки сотрудник мог перейти в другой
+        resolve_departments(connection or session.connection(), entries)
+        session.info.setdefault('history_journal', []).extend(entries)
+        return
+    write_history(connection or session.connection(), entries)
+    mark_changed(session, history_table.name)
+
+@event.listens_for(Session, 'after_commit')
+def _enqueue_history(session):
+    entries = session.info.pop('history_journal', None)
+    if not entries:
+        return
+    try:
+        history_journal.enqueue(entries)
+    except Exception as e:
+        #изменение оценки уже зафиксировано: ошибка журнала не должна превращать ответ в 500
+        logger.error(f"Ошибка журнала истории ({len(entries)} записей): {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_history(session):
+    session.info.pop('history_journal', None)
@@ -0,0 +1,148 @@
+"""
+Живая HR статистика для Server-Sent Events.
+
+Один поток на процесс получает уведомления об изменениях (ChangeNotifier),
+пересчитывает сводку из агрегатов один раз на пачку изменений и раздает
+снимок всем открытым SSE соединениям. Каждое соединение отправляет клиенту
+только разницу с последним отправленным снимком.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from .. import db
+from .cache import ANALYTICS_TABLES
+from .notifications import change_notifier
+from .rollups import get_hr_summary
+
+logger = logging.getLogger(__name__)
+
+def build_snapshot():
+    """
+    Компактный снимок HR статистики: общие цифры, роли и отделы по ключам.
+    Отделы ключуются по id: названия могут совпадать.
+    """
+    stats, roles, departments = get_hr_summary()
+    return {
+        'stats': stats,
+        'roles': {item['role']: item['count'] for item in roles},
+        'departments': {
+            str(item['id']): {'name': item['department'], 'count': item['count'], 'avg_score': item['avg_score']}
+            for item in departments
+        }
+    }
+
+def snapshot_delta(old, new):
+    """Разница между снимками; удаленные ключи передаются как None"""
+    delta = {}
+    for section, values in new.items():
+        previous = (old or {}).get(section, {})
+        changed = {key: value for key, value in values.items() if previous.get(key) != value}
+        changed.update({key: None for key in previous if key not in values})
+        if changed:
+            delta[section] = changed
+    return delta
+
+class HRStatsFeed:
+    """Пересчет сводки по уведомлениям и раздача снимков подписчикам"""
+
+    def __init__(self, app=None, debounce=0.5, queue_size=16):
+        self.debounce = debounce
+        self.queue_size = queue_size
+        self.snapshot = None
+        self._app = None
+        self._queues = set()
+        self._changed = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.debounce = app.config.setdefault('HR_STATS_STREAM_DEBOUNCE', self.debounce)
+        app.extensions['hr_stats_feed'] = self
+        with self._lock:
+            self.snapshot = None
+
+    def subscribe(self):
+        """Регистрирует SSE соединение; возвращает очередь снимков и текущий снимок"""
+        updates = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._queues.add(updates)
+            snapshot = self.snapshot
+
+        if snapshot is None:
+            snapshot = build_snapshot()
+            with self._lock:
+                self.snapshot = snapshot
+
+        self._start()
+        return updates, snapshot
+
+    def unsubscribe(self, updates):
+        with self._lock:
+            self._queues.discard(updates)
+
+    def _background(self):
+        return self._app.config.get('HR_STATS_STREAM_BACKGROUND', not self._app.testing)
+
+    def _start(self):
+        if self._background():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        change_notifier.add_listener(self._on_change)
+
+    def _on_change(self, payload):
+        if not ANALYTICS_TABLES & set(payload.get('tables', ())):
+            return
+        with self._lock:
+            if not self._queues:
+                #никто не слушает: просто сбрасываем снимок, пересчитаем при подключении
+                self.snapshot = None
+                return
+        if self._background():
+            self._changed.set()
+        else:
+            #тесты: пересчитываем сразу в текущем потоке
+            self.publish()
+
+    def _run(self):
+        while True:
+            self._changed.wait()
+            #склеиваем пачку изменений в один пересчет
+            time.sleep(self.debounce)
+            self._changed.clear()
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Ошибка пересчета живой HR статистики: {e}")
+
+    def publish(self):
+        """Пересчитывает снимок и раздает его всем подписчикам"""
+        with self._app.app_context():
+            try:
+                snapshot = build_snapshot()
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            self.snapshot = snapshot
+            queues = list(self._queues)
+
+        for updates in queues:
+            try:
+                updates.put_nowait(snapshot)
+            except queue.Full:
+                #медленный клиент: старый снимок не нужен, важен только последний
+                try:
+                    updates.get_nowait()
+                except queue.Empty:
+                    pass
+                updates.put_nowait(snapshot)
+
+hr_stats_feed = HRStatsFeed()
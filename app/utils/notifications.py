@@ -0,0 +1,189 @@
+"""
+Уведомления об изменении данных между процессами.
+
+ChangeNotifier рассылает набор измененных таблиц всем подписчикам во всех
+воркерах, а publish() - произвольные сообщения (например, дельты кэшей),
+которые доставляются вместе с транзакцией. На PostgreSQL используется LISTEN/NOTIFY: pg_notify выполняется
+в той же транзакции, что и запись, и доставляется только после commit.
+Для SQLite и тестов есть локальный транспорт, который работает в пределах
+одного процесса.
+"""
+
+import json
+import logging
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from .changes import subscribe, subscribe_flush
+
+logger = logging.getLogger(__name__)
+
+class LocalTransport:
+    """Доставка внутри текущего процесса (SQLite, тесты, один воркер)"""
+
+    name = 'local'
+
+    def __init__(self, notifier):
+        self.notifier = notifier
+
+    def publish_in_transaction(self, session, payload):
+        #локальная доставка возможна только после commit
+        pass
+
+    def publish_after_commit(self, payload):
+        self.notifier.dispatch(payload)
+
+    def start(self):
+        pass
+
+class PostgresTransport:
+    """LISTEN/NOTIFY: уведомление уходит вместе с транзакцией и приходит во все воркеры"""
+
+    name = 'postgres'
+    reconnect_delay = 5
+
+    def __init__(self, notifier, database_uri):
+        self.notifier = notifier
+        self.dsn = make_url(database_uri).set(drivername='postgresql').render_as_string(hide_password=False)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish_in_transaction(self, session, payload):
+        session.connection().execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': self.notifier.channel, 'payload': json.dumps(payload)}
+        )
+
+    def publish_after_commit(self, payload):
+        #уже отправлено через pg_notify внутри транзакции
+        pass
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, daemon=True)
+                self._thread.start()
+
+    def _listen_forever(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.notifier.channel}')
+
+                while True:
+                    if select.select([connection], [], [], 30) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            self.notifier.dispatch(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning(f"Некорректное уведомление: {notify.payload}")
+            except Exception as e:
+                logger.error(f"Ошибка LISTEN {self.notifier.channel}: {e}")
+                time.sleep(self.reconnect_delay)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+class ChangeNotifier:
+    """Рассылка изменений таблиц слушателям во всех процессах"""
+
+    #предел размера уведомления (pg_notify принимает меньше 8000 байт)
+    max_payload = 7900
+
+    def __init__(self, app=None, channel='skills_app_changes'):
+        self.channel = channel
+        self.transport = LocalTransport(self)
+        self._listeners = []
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.channel = app.config.setdefault('CHANGE_NOTIFY_CHANNEL', self.channel)
+        database_uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        transport = app.config.setdefault(
+            'CHANGE_NOTIFY_TRANSPORT',
+            'postgres' if database_uri.startswith('postgresql') else 'local'
+        )
+        if transport == 'postgres':
+            self.transport = PostgresTransport(self, database_uri)
+        else:
+            self.transport = LocalTransport(self)
+        #слушатели, подписанные до смены транспорта
+        if self._listeners:
+            self.transport.start()
+        app.extensions['change_notifier'] = self
+
+    def add_listener(self, callback):
+        """Подписка на изменения; LISTEN поток запускается при первой подписке"""
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+        self.transport.start()
+        return callback
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def publish(self, session, payload):
+        """
+        Сообщение слушателям всех процессов вместе с транзакцией session: на
+        PostgreSQL - pg_notify в транзакции, локально - после commit.
+
+        Returns:
+            bool: False, если сообщение не помещается в уведомление (его не отправили)
+        """
+        payload = dict(payload, pid=os.getpid())
+        if len(json.dumps(payload)) > self.max_payload:
+            return False
+        self.transport.publish_in_transaction(session, payload)
+        session.info.setdefault('notifier_messages', []).append(payload)
+        return True
+
+    def dispatch(self, payload):
+        """Передает уведомление всем слушателям текущего процесса"""
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Ошибка слушателя уведомлений: {e}")
+
+change_notifier = ChangeNotifier()
+
+@subscribe_flush
+def _publish_in_transaction(session, tables):
+    change_notifier.transport.publish_in_transaction(
+        session, {'tables': sorted(tables), 'pid': os.getpid()}
+    )
+
+@subscribe
+def _publish_after_commit(tables):
+    change_notifier.transport.publish_after_commit({'tables': sorted(tables), 'pid': os.getpid()})
+
+@event.listens_for(Session, 'after_commit')
+def _publish_messages(session):
+    for payload in session.info.pop('notifier_messages', ()):
+        change_notifier.transport.publish_after_commit(payload)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_messages(session):
+    session.info.pop('notifier_messages', None)
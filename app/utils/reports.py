@@ -0,0 +1,417 @@
+"""
+Аналитические отчеты, которые считаются в БД одним сгруппированным запросом.
+
+Итоговая оценка везде считается как в search_by_skills: оценка руководителя,
+а если ее нет - самооценка.
+"""
+
+import numpy as np
+from sqlalchemy import func, case, distinct, and_
+
+from .. import db
+from ..models import Department, Skill, SkillAssessment, User
+
+HEATMAP_DIMENSIONS = ('department', 'role', 'position')
+HEATMAP_GROUPINGS = ('category', 'skill')
+
+def final_score_expression():
+    """SQL выражение итоговой оценки"""
+    return func.coalesce(SkillAssessment.manager_score, SkillAssessment.self_score)
+
+def _dimension_column(dimension):
+    return {
+        'department': User.department_id,
+        'role': User.role,
+        'position': User.position,
+    }[dimension]
+
+def _dimension_labels(dimension, keys):
+    """Человекочитаемые подписи для значений измерения"""
+    if dimension == 'department':
+        names = dict(db.session.query(Department.id, Department.name).all())
+        return [names.get(key, 'Без отдела') if key is not None else 'Без отдела' for key in keys]
+    if dimension == 'position':
+        return [key or 'Без должности' for key in keys]
+    return [key or '' for key in keys]
+
+def build_heatmap(dimension='department', by='category'):
+    """
+    Тепловая карта: измерение (отдел/роль/должность) × категория или навык.
+
+    Возвращает плотные матрицы в колоночном виде: средняя итоговая оценка,
+    число оцененных сотрудников, число оценок и доля сотрудников с оценкой >= 4.
+    Все агрегаты считаются одним GROUP BY по skill_assessments.
+    """
+    if dimension not in HEATMAP_DIMENSIONS:
+        raise ValueError(f'Неизвестное измерение: {dimension}')
+    if by not in HEATMAP_GROUPINGS:
+        raise ValueError(f'Неизвестная группировка: {by}')
+
+    final_score = final_score_expression()
+    dimension_column = _dimension_column(dimension)
+    column_key = Skill.category if by == 'category' else Skill.id
+
+    rows = db.session.query(
+        dimension_column.label('row_key'),
+        column_key.label('column_key'),
+        func.avg(final_score).label('avg_score'),
+        func.count(final_score).label('assessments'),
+        func.count(distinct(SkillAssessment.user_id)).label('assessed_users'),
+        func.count(distinct(case((final_score >= 4, SkillAssessment.user_id)))).label('high_users')
+    ).select_from(SkillAssessment).join(
+        User, User.id == SkillAssessment.user_id
+    ).join(
+        Skill, Skill.id == SkillAssessment.skill_id
+    ).filter(
+        final_score.isnot(None)
+    ).group_by(dimension_column, column_key).all()
+
+    group_sizes = dict(
+        db.session.query(dimension_column, func.count(User.id)).group_by(dimension_column).all()
+    )
+
+    #строки по подписи (не по строке ключа: иначе отделы 1, 10, 2), пустое значение в конце
+    row_keys = {row.row_key for row in rows} | set(group_sizes)
+    row_labels = dict(zip(row_keys, _dimension_labels(dimension, row_keys)))
+    row_keys = sorted(row_keys, key=lambda key: (key is None, row_labels[key], key))
+
+    if by == 'category':
+        column_keys = sorted({row.column_key for row in rows})
+        column_labels = list(column_keys)
+    else:
+        skills = db.session.query(Skill.id, Skill.name).order_by(Skill.name, Skill.id).all()
+        rated = {row.column_key for row in rows}
+        column_keys = [skill_id for skill_id, _ in skills if skill_id in rated]
+        skill_names = dict(skills)
+        column_labels = [skill_names[skill_id] for skill_id in column_keys]
+
+    row_index = {key: i for i, key in enumerate(row_keys)}
+    column_index = {key: j for j, key in enumerate(column_keys)}
+
+    def empty():
+        return [[None] * len(column_keys) for _ in row_keys]
+
+    avg_scores, assessed_users, assessments, share_high = empty(), empty(), empty(), empty()
+    for row in rows:
+        i, j = row_index[row.row_key], column_index[row.column_key]
+        avg_scores[i][j] = round(float(row.avg_score), 2)
+        assessed_users[i][j] = row.assessed_users
+        assessments[i][j] = row.assessments
+        share_high[i][j] = round(row.high_users / row.assessed_users, 3) if row.assessed_users else None
+
+    return {
+        'dimension': dimension,
+        'by': by,
+        'rows': [row_labels[key] for key in row_keys],
+        'row_keys': row_keys,
+        'columns': column_labels,
+        'column_keys': column_keys,
+        'group_sizes': [group_sizes.get(key, 0) for key in row_keys],
+        'avg_score': avg_scores,
+        'assessed_users': assessed_users,
+        'assessments': assessments,
+        'share_high': share_high
+    }
+
+DISTRIBUTION_QUANTILES = (0.25, 0.5, 0.75, 0.9)
+
+def _distribution_columns():
+    """Выражения оценок для распределений: самооценка, оценка руководителя, итоговая"""
+    return {
+        'self': SkillAssessment.self_score,
+        'manager': SkillAssessment.manager_score,
+        'final': final_score_expression(),
+    }
+
+def _histogram_aggregates(columns):
+    aggregates = []
+    for kind, column in columns.items():
+        for score in range(1, 6):
+            aggregates.append(
+                func.coalesce(func.sum(case((column == score, 1), else_=0)), 0).label(f'{kind}_{score}')
+            )
+    return aggregates
+
+def _filtered(query, skill_id=None, department_id=None):
+    query = query.select_from(SkillAssessment)
+    if department_id is not None:
+        query = query.join(User, User.id == SkillAssessment.user_id).filter(User.department_id == department_id)
+    if skill_id is not None:
+        query = query.filter(SkillAssessment.skill_id == skill_id)
+    return query
+
+def build_distribution(skill_id=None, department_id=None):
+    """
+    Распределение оценок (самооценка, руководитель, итоговая): гистограмма 1..5,
+    среднее, медиана, p25/p75/p90 и стандартное отклонение.
+
+    На PostgreSQL перцентили считает percentile_cont; на остальных БД запрос
+    возвращает только гистограмму, а статистика восстанавливается по ней
+    (оценки целые 1..5, поэтому результат совпадает с percentile_cont).
+    В обоих случаях оценки не выгружаются в Python построчно.
+    """
+    from .helpers import calculate_score_statistics_batch
+
+    columns = _distribution_columns()
+    aggregates = _histogram_aggregates(columns)
+
+    use_percentile_cont = db.session.get_bind().dialect.name == 'postgresql'
+    if use_percentile_cont:
+        for kind, column in columns.items():
+            aggregates.append(func.stddev_pop(column).label(f'{kind}_stddev'))
+            aggregates.append(func.avg(column).label(f'{kind}_mean'))
+            for q in DISTRIBUTION_QUANTILES:
+                aggregates.append(func.percentile_cont(q).within_group(column).label(f'{kind}_p{int(q * 100)}'))
+
+    row = _filtered(db.session.query(*aggregates), skill_id, department_id).one()._mapping
+
+    histograms = [[int(row[f'{kind}_{score}']) for score in range(1, 6)] for kind in columns]
+    statistics = calculate_score_statistics_batch(histograms, DISTRIBUTION_QUANTILES)
+
+    distribution = {}
+    for (kind, _), histogram, stats in zip(columns.items(), histograms, statistics):
+        if use_percentile_cont and stats['count']:
+            stats['mean'] = float(row[f'{kind}_mean'])
+            stats['stddev'] = float(row[f'{kind}_stddev'])
+            stats['percentiles'] = {q: float(row[f'{kind}_p{int(q * 100)}']) for q in DISTRIBUTION_QUANTILES}
+
+        percentiles = stats['percentiles']
+        distribution[kind] = {
+            'histogram': {str(score): count for score, count in zip(range(1, 6), histogram)},
+            'count': stats['count'],
+            'mean': round(stats['mean'], 2) if stats['mean'] is not None else None,
+            'median': percentiles[0.5],
+            'p25': percentiles[0.25],
+            'p75': percentiles[0.75],
+            'p90': percentiles[0.9],
+            'stddev': round(stats['stddev'], 3) if stats['stddev'] is not None else None
+        }
+    return distribution
+
+MAX_COMPARE_USERS = 50
+MAX_COMPARE_DEPARTMENT = 200
+
+def build_cohort_comparison(user_ids=None, department_id=None, scope_department_id=None):
+    """
+    Сравнение группы сотрудников: матрица навыки × сотрудники в колоночном виде.
+
+    Один запрос users LEFT JOIN (оценки + навыки); в матрицу попадают только
+    навыки, которые оценил хотя бы один сотрудник группы. scope_department_id
+    ограничивает выборку отделом руководителя прямо в запросе.
+    Для каждого навыка считаются min/max/mean, для пар сотрудников - средняя
+    абсолютная разница и число общих навыков.
+
+    Returns:
+        dict | None: None, если в группе никого нет
+    """
+    final_score = final_score_expression()
+    query = db.session.query(
+        User.id, User.full_name,
+        Skill.id, Skill.name, Skill.category, final_score
+    ).select_from(User).outerjoin(
+        SkillAssessment, and_(SkillAssessment.user_id == User.id, final_score.isnot(None))
+    ).outerjoin(
+        Skill, Skill.id == SkillAssessment.skill_id
+    )
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+    if department_id is not None:
+        query = query.filter(User.department_id == department_id)
+    if scope_department_id is not None:
+        query = query.filter(User.department_id == scope_department_id)
+
+    users = {}
+    skills = {}
+    cells = []
+    for user_id, full_name, skill_id, skill_name, category, score in query.all():
+        users.setdefault(user_id, full_name)
+        if skill_id is not None:
+            skills.setdefault(skill_id, (skill_name, category))
+            cells.append((user_id, skill_id, score))
+
+    if not users:
+        return None
+
+    if user_ids is not None:
+        order = {user_id: i for i, user_id in enumerate(user_ids)}
+        user_order = sorted(users, key=lambda user_id: order.get(user_id, len(order)))
+    else:
+        user_order = sorted(users, key=lambda user_id: (users[user_id] or '', user_id))
+    skill_order = sorted(skills, key=lambda skill_id: (skills[skill_id][1] or '', skills[skill_id][0], skill_id))
+
+    user_index = {user_id: i for i, user_id in enumerate(user_order)}
+    skill_index = {skill_id: i for i, skill_id in enumerate(skill_order)}
+
+    scores = np.full((len(skill_order), len(user_order)), np.nan)
+    for user_id, skill_id, score in cells:
+        scores[skill_index[skill_id], user_index[user_id]] = score
+    rated = ~np.isnan(scores)
+
+    stats = {'min': [], 'max': [], 'mean': [], 'rated': rated.sum(axis=1).tolist()}
+    if len(skill_order):
+        stats['min'] = np.nanmin(scores, axis=1).tolist()
+        stats['max'] = np.nanmax(scores, axis=1).tolist()
+        stats['mean'] = np.round(np.nanmean(scores, axis=1), 2).tolist()
+
+    #попарные различия только по навыкам, оцененным у обоих, произведениями матриц
+    #навыки × сотрудники: |a - b| = сумма шагов между соседними значениями шкалы,
+    #которые лежат между a и b (a >= v и b < v или наоборот)
+    rated_counts = rated.astype(np.int32)
+    common = rated_counts.T @ rated_counts
+    differences = np.zeros(common.shape)
+    values = np.unique(scores[rated])
+    for previous, value in zip(values[:-1], values[1:]):
+        above = (rated & (scores >= value)).astype(np.int32)
+        above_rated = above.T @ rated_counts
+        differences += (value - previous) * (above_rated + above_rated.T - 2 * (above.T @ above))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_abs_diff = np.where(common > 0, np.round(differences / np.maximum(common, 1), 2), np.nan)
+
+    def nullable(matrix):
+        return [[None if np.isnan(value) else value for value in row] for row in matrix.tolist()]
+
+    return {
+        'users': {
+            'ids': user_order,
+            'names': [users[user_id] for user_id in user_order]
+        },
+        'skills': {
+            'ids': skill_order,
+            'names': [skills[skill_id][0] for skill_id in skill_order],
+            'categories': [skills[skill_id][1] for skill_id in skill_order]
+        },
+        'scores': [[None if value is None else int(value) for value in row] for row in nullable(scores)],
+        'stats': stats,
+        'pairwise': {
+            'mean_abs_diff': nullable(mean_abs_diff),
+            'common_skills': common.tolist()
+        }
+    }
+
+COVERAGE_LEVELS = (3, 4)
+#навык держится на одном человеке, если уровень >= 3 есть только у него
+BUS_FACTOR_MIN_SCORE = COVERAGE_LEVELS[0]
+
+def _coverage_rows_sql(department_id=None):
+    """(отдел, навык, оценили, >=3, >=4, владелец) одним GROUP BY по отделам и навыкам"""
+    final_score = final_score_expression()
+    competent, expert = COVERAGE_LEVELS
+    query = db.session.query(
+        User.department_id,
+        SkillAssessment.skill_id,
+        func.count(final_score),
+        func.count(case((final_score >= competent, 1))),
+        func.count(case((final_score >= expert, 1))),
+        func.max(case((final_score >= BUS_FACTOR_MIN_SCORE, SkillAssessment.user_id)))
+    ).join(User, User.id == SkillAssessment.user_id).filter(final_score.isnot(None))
+    if department_id is not None:
+        query = query.filter(User.department_id == department_id)
+    else:
+        query = query.filter(User.department_id.isnot(None))
+    rows = query.group_by(User.department_id, SkillAssessment.skill_id).all()
+
+    sizes = db.session.query(User.department_id, func.count(User.id)).group_by(User.department_id)
+    if department_id is not None:
+        sizes = sizes.filter(User.department_id == department_id)
+    return rows, dict(sizes.all())
+
+def _coverage_rows_matrix(matrix, department_id=None):
+    """То же по матрице оценок: строки сортируются по отделу и считаются непрерывными срезами"""
+    with matrix.locked():
+        codes, labels = matrix.group_codes('department')
+        selected = matrix.active[:matrix.n_users] & (codes >= 0)
+        if department_id is not None:
+            selected &= codes == (labels.index(department_id) if department_id in labels else -2)
+
+        rows = np.nonzero(selected)[0]
+        rows = rows[np.argsort(codes[rows], kind='stable')]
+        row_codes = codes[rows]
+        if department_id is not None:
+            scores = matrix.block(rows, np.arange(matrix.n_skills))
+        else:
+            scores = matrix.scores('final')[rows]
+        group_codes, starts = np.unique(row_codes, return_index=True)
+        ends = np.append(starts[1:], len(rows))
+
+        result, sizes = [], {}
+        for code, start, end in zip(group_codes, starts, ends):
+            block = scores[start:end]
+            rated = np.count_nonzero(block, axis=0)
+            competent, expert = (np.count_nonzero(block >= level, axis=0) for level in COVERAGE_LEVELS)
+            sizes[labels[code]] = int(end - start)
+            for col in np.nonzero(rated)[0]:
+                owner = None
+                if competent[col] == 1:
+                    owner = int(matrix.user_ids[rows[start + np.argmax(block[:, col] >= BUS_FACTOR_MIN_SCORE)]])
+                result.append((
+                    labels[code], int(matrix.skill_ids[col]), int(rated[col]),
+                    int(competent[col]), int(expert[col]), owner
+                ))
+    return result, sizes
+
+def build_team_coverage(department_id=None, matrix=None):
+    """
+    Покрытие навыков командой: для каждого навыка отдела - сколько сотрудников
+    его оценили, сколько на уровне >= 3 и >= 4, и навыки с bus factor 1
+    (уровень >= 3 только у одного человека).
+
+    Считается одним сгруппированным запросом сразу по всем отделам
+    (или по одному), а при включенной матрице оценок - по ней.
+
+    Returns:
+        list: отчеты по отделам, отсортированные по названию отдела
+    """
+    if matrix is not None:
+        rows, sizes = _coverage_rows_matrix(matrix, department_id)
+    else:
+        rows, sizes = _coverage_rows_sql(department_id)
+
+    skill_ids = {row[1] for row in rows}
+    owner_ids = {row[5] for row in rows if row[3] == 1 and row[5] is not None}
+    skills = {
+        skill_id: (name, category) for skill_id, name, category in
+        db.session.query(Skill.id, Skill.name, Skill.category).filter(Skill.id.in_(skill_ids)).all()
+    } if skill_ids else {}
+    owners = dict(
+        db.session.query(User.id, User.full_name).filter(User.id.in_(owner_ids)).all()
+    ) if owner_ids else {}
+
+    department_ids = set(sizes) | {row[0] for row in rows}
+    if department_id is not None:
+        department_ids.add(department_id)
+    department_ids.discard(None)
+    names = dict(
+        db.session.query(Department.id, Department.name).filter(Department.id.in_(department_ids)).all()
+    ) if department_ids else {}
+
+    by_department = {key: [] for key in department_ids}
+    for row in rows:
+        if row[1] in skills:
+            by_department[row[0]].append(row)
+
+    reports = []
+    for key in sorted(department_ids, key=lambda key: (names.get(key, ''), key)):
+        cells = sorted(by_department[key], key=lambda row: (skills[row[1]][1] or '', skills[row[1]][0], row[1]))
+        reports.append({
+            'department_id': key,
+            'department': names.get(key, 'Без отдела'),
+            'team_size': sizes.get(key, 0),
+            'skills': {
+                'ids': [row[1] for row in cells],
+                'names': [skills[row[1]][0] for row in cells],
+                'categories': [skills[row[1]][1] for row in cells],
+                'rated': [row[2] for row in cells],
+                'level_3': [row[3] for row in cells],
+                'level_4': [row[4] for row in cells]
+            },
+            'bus_factor_1': [
+                {
+                    'skill_id': row[1],
+                    'skill': skills[row[1]][0],
+                    'user_id': row[5],
+                    'full_name': owners.get(row[5])
+                }
+                for row in cells if row[3] == 1 and row[5] is not None
+            ]
+        })
+    return reports
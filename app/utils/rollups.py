@@ -0,0 +1,400 @@
+"""
+Инкрементальные агрегаты (rollups) для HR аналитики.
+
+Таблица analytics_rollups хранит для каждого среза (глобально, по отделу,
+по роли, по навыку) количество пользователей и оценок, суммы и количество
+непустых самооценок, оценок руководителя и итоговых оценок. Агрегаты
+обновляются в той же транзакции, что и запись SkillAssessment/User, поэтому
+HR страницы читают O(кол-во отделов) строк вместо GROUP BY по всем оценкам,
+а каталог навыков берет число оценок из срезов навыков. Пользователей
+в срезе навыка не считают (user_count = 0).
+
+Изменения пишутся одной командой INSERT ... ON CONFLICT DO UPDATE (без
+гонки первой записи). Глобальный срез затрагивает каждая запись, поэтому
+он разбит на GLOBAL_SHARDS строк (scope_key '', '1', '2', ...): процессы и
+потоки пишут в разные строки и не ждут блокировку одной строки до конца
+чужой транзакции, а при чтении строки среза суммируются.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import event, select, func, case, and_, text
+from sqlalchemy.orm.attributes import get_history
+
+from .. import db
+from ..models import AnalyticsRollup, Department, Skill, SkillAssessment, User
+from .schema import add_missing_columns
+
+ROLLUP_COLUMNS = (
+    'user_count',
+    'assessment_count',
+    'self_sum',
+    'self_count',
+    'manager_sum',
+    'manager_count',
+    'final_sum',
+    'final_count',
+    'pending_count',
+)
+
+SCOPE_GLOBAL = 'global'
+SCOPE_DEPARTMENT = 'department'
+SCOPE_ROLE = 'role'
+SCOPE_SKILL = 'skill'
+
+#число строк глобального среза
+GLOBAL_SHARDS = 8
+
+#ключ advisory lock для построения агрегатов при запуске
+ROLLUPS_LOCK_KEY = 0x726f6c6c
+
+rollups_table = AnalyticsRollup.__table__
+
+def global_key():
+    """
+    Строка глобального среза для текущего процесса и потока. Одна транзакция
+    выполняется в одном потоке, поэтому всегда пишет в одну и ту же строку.
+    """
+    shard = hash((os.getpid(), threading.get_ident())) % GLOBAL_SHARDS
+    return str(shard) if shard else ''
+
+def department_key(department_id):
+    """Ключ среза для отдела (пустая строка - без отдела)"""
+    return str(department_id) if department_id is not None else ''
+
+def scopes_for(department_id, role):
+    """Все срезы, в которые попадает пользователь"""
+    return [
+        (SCOPE_GLOBAL, global_key()),
+        (SCOPE_DEPARTMENT, department_key(department_id)),
+        (SCOPE_ROLE, role or ''),
+    ]
+
+def skill_scope(skill_id):
+    """Срез навыка"""
+    return (SCOPE_SKILL, str(skill_id))
+
+def pending_expression():
+    """SQL выражение для подсчета оценок, ожидающих проверки руководителем"""
+    return case((and_(SkillAssessment.self_score.isnot(None), SkillAssessment.manager_score.is_(None)), 1))
+
+def assessment_vector(self_score, manager_score, sign=1):
+    """Вклад одной оценки в агрегаты"""
+    final_score = manager_score if manager_score is not None else self_score
+    return {
+        'assessment_count': sign,
+        'self_sum': sign * (self_score or 0),
+        'self_count': sign if self_score is not None else 0,
+        'manager_sum': sign * (manager_score or 0),
+        'manager_count': sign if manager_score is not None else 0,
+        'final_sum': sign * (final_score or 0),
+        'final_count': sign if final_score is not None else 0,
+        #самооценка есть, оценки руководителя еще нет - ждет проверки
+        'pending_count': sign if self_score is not None and manager_score is None else 0,
+    }
+
+def combine(*vectors):
+    """Сумма нескольких векторов изменений"""
+    result = {}
+    for vector in vectors:
+        for column, value in vector.items():
+            result[column] = result.get(column, 0) + value
+    return result
+
+def _insert(dialect_name):
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f'Агрегаты не поддерживаются для {dialect_name}')
+    return dialect_insert
+
+def apply_delta(connection, scopes, delta):
+    """
+    Применяет изменения агрегатов к срезам через текущее соединение (в той же транзакции)
+    одной командой INSERT ... ON CONFLICT (scope, scope_key) DO UPDATE.
+    """
+    apply_deltas(connection, {scope: delta for scope in scopes})
+
+def apply_deltas(connection, deltas):
+    """
+    Разные изменения для разных срезов {(scope, scope_key): delta} одной командой.
+    Строки блокируются в порядке срезов, одинаковом для всех транзакций.
+    """
+    deltas = {
+        scope: {column: value for column, value in delta.items() if value}
+        for scope, delta in deltas.items()
+    }
+    deltas = {scope: delta for scope, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    columns = {column for delta in deltas.values() for column in delta}
+    statement = _insert(connection.dialect.name)(rollups_table).values([
+        dict({column: 0 for column in ROLLUP_COLUMNS}, **deltas[scope], scope=scope[0], scope_key=scope[1])
+        for scope in sorted(deltas)
+    ])
+    updates = {column: rollups_table.c[column] + statement.excluded[column] for column in columns}
+    updates['updated_at'] = datetime.utcnow()
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[rollups_table.c.scope, rollups_table.c.scope_key], set_=updates
+    ))
+
+def user_scopes(connection, user_id):
+    """Срезы пользователя по данным из БД"""
+    row = connection.execute(
+        select(User.department_id, User.role).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return [(SCOPE_GLOBAL, global_key())]
+    return scopes_for(row.department_id, row.role)
+
+def _previous(target, attr):
+    """Значение атрибута до текущего flush"""
+    history = get_history(target, attr)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(target, attr)
+
+def _user_totals(connection, user_id):
+    """Вклад всех оценок пользователя в агрегаты"""
+    final_score = func.coalesce(SkillAssessment.manager_score, SkillAssessment.self_score)
+    row = connection.execute(
+        select(
+            func.count(SkillAssessment.id),
+            func.coalesce(func.sum(SkillAssessment.self_score), 0),
+            func.count(SkillAssessment.self_score),
+            func.coalesce(func.sum(SkillAssessment.manager_score), 0),
+            func.count(SkillAssessment.manager_score),
+            func.coalesce(func.sum(final_score), 0),
+            func.count(final_score),
+            func.count(pending_expression()),
+        ).where(SkillAssessment.user_id == user_id)
+    ).first()
+    return dict(zip(ROLLUP_COLUMNS[1:], (int(value or 0) for value in row)))
+
+#слушатели изменений оценок
+
+def assessment_scopes(connection, user_id, skill_id):
+    """Срезы оценки: срезы пользователя и срез навыка"""
+    return user_scopes(connection, user_id) + [skill_scope(skill_id)]
+
+@event.listens_for(SkillAssessment, 'after_insert')
+def rollup_assessment_insert(mapper, connection, target):
+    apply_delta(
+        connection,
+        assessment_scopes(connection, target.user_id, target.skill_id),
+        assessment_vector(target.self_score, target.manager_score)
+    )
+
+@event.listens_for(SkillAssessment, 'after_update')
+def rollup_assessment_update(mapper, connection, target):
+    old_user_id = _previous(target, 'user_id')
+    old_skill_id = _previous(target, 'skill_id')
+    old_vector = assessment_vector(
+        _previous(target, 'self_score'), _previous(target, 'manager_score'), sign=-1
+    )
+    new_vector = assessment_vector(target.self_score, target.manager_score)
+
+    if old_user_id == target.user_id and old_skill_id == target.skill_id:
+        apply_delta(
+            connection, assessment_scopes(connection, target.user_id, target.skill_id),
+            combine(old_vector, new_vector)
+        )
+    else:
+        apply_delta(connection, assessment_scopes(connection, old_user_id, old_skill_id), old_vector)
+        apply_delta(connection, assessment_scopes(connection, target.user_id, target.skill_id), new_vector)
+
+@event.listens_for(SkillAssessment, 'after_delete')
+def rollup_assessment_delete(mapper, connection, target):
+    apply_delta(
+        connection,
+        assessment_scopes(connection, _previous(target, 'user_id'), _previous(target, 'skill_id')),
+        assessment_vector(
+            _previous(target, 'self_score'), _previous(target, 'manager_score'), sign=-1
+        )
+    )
+
+#слушатели изменений пользователей
+
+@event.listens_for(User, 'after_insert')
+def rollup_user_insert(mapper, connection, target):
+    apply_delta(connection, scopes_for(target.department_id, target.role), {'user_count': 1})
+
+@event.listens_for(User, 'after_update')
+def rollup_user_update(mapper, connection, target):
+    old_department_id = _previous(target, 'department_id')
+    old_role = _previous(target, 'role')
+    if old_department_id == target.department_id and old_role == target.role:
+        return
+
+    totals = _user_totals(connection, target.id)
+    totals['user_count'] = 1
+    negative = {column: -value for column, value in totals.items()}
+
+    #глобальный срез не меняется, переносим только отдел и роль
+    old_scopes = scopes_for(old_department_id, old_role)[1:]
+    new_scopes = scopes_for(target.department_id, target.role)[1:]
+    for old_scope, new_scope in zip(old_scopes, new_scopes):
+        if old_scope != new_scope:
+            apply_delta(connection, [old_scope], negative)
+            apply_delta(connection, [new_scope], totals)
+
+@event.listens_for(User, 'after_delete')
+def rollup_user_delete(mapper, connection, target):
+    #оценки пользователя удаляются каскадом раньше и учитываются своими слушателями
+    apply_delta(
+        connection,
+        scopes_for(_previous(target, 'department_id'), _previous(target, 'role')),
+        {'user_count': -1}
+    )
+
+def rebuild_rollups():
+    """Полный пересчет агрегатов с нуля"""
+    final_score = func.coalesce(SkillAssessment.manager_score, SkillAssessment.self_score)
+    aggregates = (
+        func.count(SkillAssessment.id),
+        func.coalesce(func.sum(SkillAssessment.self_score), 0),
+        func.count(SkillAssessment.self_score),
+        func.coalesce(func.sum(SkillAssessment.manager_score), 0),
+        func.count(SkillAssessment.manager_score),
+        func.coalesce(func.sum(final_score), 0),
+        func.count(final_score),
+        func.count(pending_expression()),
+    )
+    size = len(aggregates)
+
+    rows = {}
+
+    def add(scope, scope_key, values):
+        row = rows.setdefault((scope, scope_key), {column: 0 for column in ROLLUP_COLUMNS})
+        for column, value in values.items():
+            row[column] += int(value or 0)
+
+    groupings = (
+        (SCOPE_GLOBAL, None, lambda value: ''),
+        (SCOPE_DEPARTMENT, User.department_id, department_key),
+        (SCOPE_ROLE, User.role, lambda value: value or ''),
+        (SCOPE_SKILL, SkillAssessment.skill_id, str),
+    )
+    for scope, group_column, make_key in groupings:
+        user_query = db.session.query(func.count(User.id))
+        assessment_query = db.session.query(*aggregates).select_from(SkillAssessment).join(
+            User, User.id == SkillAssessment.user_id
+        )
+        if group_column is not None:
+            user_query = user_query.add_columns(group_column).group_by(group_column)
+            assessment_query = assessment_query.add_columns(group_column).group_by(group_column)
+
+        #в срезах навыков пользователей не считаем
+        for row in user_query.all() if scope != SCOPE_SKILL else ():
+            key = make_key(row[1]) if group_column is not None else ''
+            add(scope, key, {'user_count': row[0]})
+
+        for row in assessment_query.all():
+            key = make_key(row[size]) if group_column is not None else ''
+            add(scope, key, dict(zip(ROLLUP_COLUMNS[1:], row[:size])))
+
+    rows.setdefault((SCOPE_GLOBAL, ''), {column: 0 for column in ROLLUP_COLUMNS})
+
+    AnalyticsRollup.query.delete()
+    db.session.add_all([
+        AnalyticsRollup(scope=scope, scope_key=scope_key, **values)
+        for (scope, scope_key), values in rows.items()
+    ])
+    db.session.commit()
+    return len(rows)
+
+def ensure_rollups():
+    """
+    Строит агрегаты, если таблица еще пустая (первый запуск), в ней не хватает
+    колонок или срезов навыков.
+    На PostgreSQL это делает один воркер (advisory lock), остальные не ждут его.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        acquired = connection.execute(
+            text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': ROLLUPS_LOCK_KEY}
+        ).scalar()
+        if not acquired:
+            db.session.rollback()
+            return
+
+    #таблица создана до появления счетчиков: добавляем колонки с типом из модели и пересчитываем
+    added = add_missing_columns(connection, rollups_table, [rollups_table.c[column] for column in ROLLUP_COLUMNS])
+    exists = AnalyticsRollup.query.filter_by(scope=SCOPE_GLOBAL).first()
+    #агрегаты построены до появления срезов навыков
+    missing_skills = (
+        AnalyticsRollup.query.filter_by(scope=SCOPE_SKILL).first() is None
+        and SkillAssessment.query.first() is not None
+    )
+    if exists is None or added or missing_skills:
+        rebuild_rollups()
+    else:
+        db.session.commit()
+
+def merge_rollups(rollups):
+    """Сумма строк одного среза (несохраняемый объект AnalyticsRollup, None - строк нет)"""
+    rollups = list(rollups)
+    if not rollups:
+        return None
+    return AnalyticsRollup(
+        scope=rollups[0].scope, scope_key='',
+        **{column: sum(getattr(rollup, column) for rollup in rollups) for column in ROLLUP_COLUMNS}
+    )
+
+def get_global_rollup():
+    """Глобальный срез: сумма всех его строк"""
+    return merge_rollups(AnalyticsRollup.query.filter_by(scope=SCOPE_GLOBAL).all())
+
+def get_skill_counts():
+    """Число оценок по навыкам {skill_id: count} из срезов навыков"""
+    rows = db.session.query(AnalyticsRollup.scope_key, AnalyticsRollup.assessment_count).filter(
+        AnalyticsRollup.scope == SCOPE_SKILL
+    )
+    return {int(scope_key): count for scope_key, count in rows}
+
+def get_hr_summary():
+    """Сводная HR статистика из агрегатов: общая, по ролям и по отделам"""
+    rollups = AnalyticsRollup.query.filter(AnalyticsRollup.scope != SCOPE_SKILL).all()
+
+    global_rollup = merge_rollups(rollup for rollup in rollups if rollup.scope == SCOPE_GLOBAL)
+    role_rollups = []
+    department_rollups = {}
+    for rollup in rollups:
+        if rollup.scope == SCOPE_ROLE:
+            role_rollups.append(rollup)
+        elif rollup.scope == SCOPE_DEPARTMENT:
+            department_rollups[rollup.scope_key] = rollup
+
+    avg_score = float(global_rollup.avg_score) if global_rollup else 0
+
+    stats = {
+        'total_users': global_rollup.user_count if global_rollup else 0,
+        'avg_score': round(avg_score, 1),
+        'total_skills': Skill.query.count(),
+        'assessed_skills': global_rollup.self_count if global_rollup else 0
+    }
+
+    roles = [
+        {'role': rollup.scope_key, 'count': rollup.user_count}
+        for rollup in sorted(role_rollups, key=lambda r: r.scope_key)
+        if rollup.user_count > 0
+    ]
+
+    departments = []
+    for department_id, name in db.session.query(Department.id, Department.name).order_by(Department.name).all():
+        rollup = department_rollups.get(department_key(department_id))
+        departments.append({
+            'id': department_id,
+            'department': name or 'Без отдела',
+            'count': rollup.user_count if rollup else 0,
+            'avg_score': round(float(rollup.avg_score), 1) if rollup else 0
+        })
+
+    return stats, roles, departments
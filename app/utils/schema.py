@@ -0,0 +1,51 @@
+"""
+Добавление колонок, появившихся в моделях после создания таблиц.
+
+db.create_all() создает только отсутствующие таблицы и не меняет
+существующие, поэтому новые колонки добавляются отдельно: с типом и
+значением по умолчанию из модели, через ADD COLUMN IF NOT EXISTS на
+PostgreSQL (одновременный запуск нескольких воркеров безопасен) и через
+точку сохранения с пропуском "duplicate column" на SQLite.
+"""
+
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.exc import OperationalError
+
+def missing_columns(connection, table, columns=None):
+    """Колонки модели (все или из списка columns), которых нет в таблице БД"""
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    return [column for column in (columns if columns is not None else table.columns) if column.name not in existing]
+
+def _column_ddl(dialect, column):
+    preparer = dialect.identifier_preparer
+    ddl = f'{preparer.quote(column.name)} {column.type.compile(dialect=dialect)}'
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        ddl += ' DEFAULT ' + str(literal(default).compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    #NOT NULL без значения по умолчанию нельзя добавить в непустую таблицу
+    if not column.nullable and default is not None:
+        ddl += ' NOT NULL'
+    return ddl
+
+def add_missing_columns(connection, table, columns=None):
+    """
+    Добавляет отсутствующие колонки через текущее соединение (в его транзакции).
+
+    Returns:
+        list: имена колонок, которых не было в таблице
+    """
+    missing = missing_columns(connection, table, columns)
+    dialect = connection.dialect
+    name = dialect.identifier_preparer.quote(table.name)
+    for column in missing:
+        if dialect.name == 'postgresql':
+            connection.execute(text(f'ALTER TABLE {name} ADD COLUMN IF NOT EXISTS {_column_ddl(dialect, column)}'))
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(text(f'ALTER TABLE {name} ADD COLUMN {_column_ddl(dialect, column)}'))
+        except OperationalError as e:
+            #колонку успел добавить другой процесс
+            if 'duplicate column' not in str(e).lower():
+                raise
+    return [column.name for column in missing]
@@ -0,0 +1,558 @@
+"""
+Матрица оценок пользователи×навыки в памяти (NumPy).
+
+Самооценки и оценки руководителя хранятся в двух плотных int8 массивах,
+0 означает отсутствие оценки. Матрица загружается один раз, а дальше
+обновляется дельтами после commit каждой записи SkillAssessment/User.
+Дельты уходят в другие процессы вместе с транзакцией (change_notifier),
+полная перезагрузка нужна только если дельты не поместились в уведомление.
+Аналитика (средние по группам, распределения, срезы строк и столбцов)
+считается векторно, без обхода ORM объектов. Для булевых запросов по навыкам
+строятся упакованные битовые карты (навык, порог), которые патчатся
+вместе с оценками.
+
+Включается настройкой SCORE_MATRIX_ENABLED.
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from .. import db
+from ..models import Skill, SkillAssessment, User
+from .notifications import change_notifier
+
+logger = logging.getLogger(__name__)
+
+SCORE_KINDS = ('self', 'manager', 'final')
+GROUP_FIELDS = ('department', 'role', 'position')
+
+class ScoreMatrix:
+    """Плотная int8 матрица оценок с инкрементальными обновлениями"""
+
+    def __init__(self, initial_users=64, initial_skills=32):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._initial_shape = (initial_users, initial_skills)
+        self.stale = True
+        #дельты, пришедшие во время загрузки (None - загрузка не идет)
+        self._pending = None
+        self._reset(*self._initial_shape)
+
+    def _reset(self, user_capacity, skill_capacity):
+        #поколение матрицы и счетчики изменений строк/каталога для производных индексов
+        self.generation = getattr(self, 'generation', 0) + 1
+        self.catalog_version = 0
+        self.row_versions = np.zeros(user_capacity, dtype=np.int64)
+        self.n_users = 0
+        self.n_skills = 0
+        self.user_index = {}
+        self.skill_index = {}
+        self.user_ids = np.zeros(user_capacity, dtype=np.int64)
+        self.skill_ids = np.zeros(skill_capacity, dtype=np.int64)
+        self.self_scores = np.zeros((user_capacity, skill_capacity), dtype=np.int8)
+        self.manager_scores = np.zeros((user_capacity, skill_capacity), dtype=np.int8)
+        self.active = np.zeros(user_capacity, dtype=bool)
+        self.user_groups = {field: [None] * user_capacity for field in GROUP_FIELDS}
+        #битовые карты (skill_id, порог) -> упакованный массив бит по строкам матрицы
+        self.bitmaps = {}
+        #карты групп пользователей (измерение, значение); сбрасываются при изменении пользователей
+        self.group_bitmaps = {}
+
+    #загрузка и рост
+
+    def load(self):
+        """
+        Полная загрузка матрицы из БД тремя запросами. Дельты, применяемые
+        во время чтения, копятся и повторяются поверх загруженных данных
+        (значения в дельтах абсолютные, повтор уже прочитанных безопасен).
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            self._load()
+        finally:
+            with self._lock:
+                self._pending = None
+        return self
+
+    def _load(self):
+        users = db.session.execute(
+            select(User.id, User.department_id, User.role, User.position).order_by(User.id)
+        ).all()
+        skill_ids = db.session.execute(select(Skill.id).order_by(Skill.id)).scalars().all()
+        assessments = db.session.execute(
+            select(
+                SkillAssessment.user_id,
+                SkillAssessment.skill_id,
+                SkillAssessment.self_score,
+                SkillAssessment.manager_score
+            )
+        ).all()
+
+        with self._lock:
+            self._reset(max(len(users), 1), max(len(skill_ids), 1))
+            for user_id, department_id, role, position in users:
+                self._set_user(user_id, department_id, role, position)
+            for skill_id in skill_ids:
+                self._column(skill_id)
+
+            if assessments:
+                data = np.array(
+                    [(u, s, self_score or 0, manager_score or 0)
+                     for u, s, self_score, manager_score in assessments],
+                    dtype=np.int64
+                )
+                rows = self._lookup(self.user_ids[:self.n_users], data[:, 0])
+                cols = self._lookup(self.skill_ids[:self.n_skills], data[:, 1])
+                known = (rows >= 0) & (cols >= 0)
+                self.self_scores[rows[known], cols[known]] = data[known, 2]
+                self.manager_scores[rows[known], cols[known]] = data[known, 3]
+
+            pending, self._pending = self._pending, None
+            self.stale = False
+            self.apply_deltas(pending)
+
+    @staticmethod
+    def _lookup(sorted_ids, ids):
+        """Векторный поиск индексов по отсортированному массиву id (-1 если не найден)"""
+        positions = np.searchsorted(sorted_ids, ids)
+        positions = np.clip(positions, 0, max(len(sorted_ids) - 1, 0))
+        found = len(sorted_ids) > 0
+        if not found:
+            return np.full(len(ids), -1)
+        return np.where(sorted_ids[positions] == ids, positions, -1)
+
+    def _grow(self, user_capacity, skill_capacity):
+        old_users, old_skills = self.self_scores.shape
+        if user_capacity <= old_users and skill_capacity <= old_skills:
+            return
+        user_capacity = max(user_capacity, old_users)
+        skill_capacity = max(skill_capacity, old_skills)
+
+        for name in ('self_scores', 'manager_scores'):
+            grown = np.zeros((user_capacity, skill_capacity), dtype=np.int8)
+            grown[:old_users, :old_skills] = getattr(self, name)
+            setattr(self, name, grown)
+        if user_capacity > old_users:
+            self.group_bitmaps.clear()
+            size = (user_capacity + 7) // 8
+            for key, bits in self.bitmaps.items():
+                self.bitmaps[key] = np.concatenate([bits, np.zeros(size - len(bits), dtype=np.uint8)])
+            self.user_ids = np.concatenate([self.user_ids, np.zeros(user_capacity - old_users, dtype=np.int64)])
+            self.active = np.concatenate([self.active, np.zeros(user_capacity - old_users, dtype=bool)])
+            self.row_versions = np.concatenate([self.row_versions, np.zeros(user_capacity - old_users, dtype=np.int64)])
+            for field in GROUP_FIELDS:
+                self.user_groups[field].extend([None] * (user_capacity - old_users))
+        if skill_capacity > old_skills:
+            self.skill_ids = np.concatenate([self.skill_ids, np.zeros(skill_capacity - old_skills, dtype=np.int64)])
+
+    def _row(self, user_id):
+        row = self.user_index.get(user_id)
+        if row is None:
+            if self.n_users >= len(self.user_ids):
+                self._grow(len(self.user_ids) * 2, 0)
+            row = self.n_users
+            self.n_users += 1
+            self.user_index[user_id] = row
+            self.user_ids[row] = user_id
+        return row
+
+    def _column(self, skill_id):
+        col = self.skill_index.get(skill_id)
+        if col is None:
+            if self.n_skills >= len(self.skill_ids):
+                self._grow(0, len(self.skill_ids) * 2)
+            col = self.n_skills
+            self.n_skills += 1
+            self.catalog_version += 1
+            self.skill_index[skill_id] = col
+            self.skill_ids[col] = skill_id
+        return col
+
+    def _set_user(self, user_id, department_id, role, position):
+        row = self._row(user_id)
+        self.active[row] = True
+        self.user_groups['department'][row] = department_id
+        self.user_groups['role'][row] = role
+        self.user_groups['position'][row] = position or ''
+        return row
+
+    #инкрементальные обновления
+
+    def apply_deltas(self, deltas):
+        """Применяет дельты записей (во время загрузки - откладывает до ее конца)"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(deltas)
+                return
+            if self.stale:
+                return
+            for kind, values in deltas:
+                if kind == 'reload':
+                    #дельты потеряны: перечитаем матрицу при следующем обращении
+                    self.stale = True
+                    return
+                if kind == 'assessment':
+                    old_user_id, old_skill_id, user_id, skill_id, self_score, manager_score = values
+                    if (old_user_id, old_skill_id) != (user_id, skill_id):
+                        self.remove_assessment(old_user_id, old_skill_id)
+                    self.apply_assessment(user_id, skill_id, self_score, manager_score)
+                elif kind == 'assessment_deleted':
+                    self.remove_assessment(*values)
+                elif kind == 'user':
+                    self.apply_user(*values)
+                elif kind == 'user_deleted':
+                    self.remove_user(*values)
+                elif kind == 'skill_deleted':
+                    self.remove_skill(*values)
+
+    def apply_assessment(self, user_id, skill_id, self_score, manager_score):
+        with self._lock:
+            row, col = self._row(user_id), self._column(skill_id)
+            self.self_scores[row, col] = self_score or 0
+            self.manager_scores[row, col] = manager_score or 0
+            self.row_versions[row] += 1
+            self._update_bits(row, col)
+
+    def remove_assessment(self, user_id, skill_id):
+        with self._lock:
+            row, col = self.user_index.get(user_id), self.skill_index.get(skill_id)
+            if row is not None and col is not None:
+                self.self_scores[row, col] = 0
+                self.manager_scores[row, col] = 0
+                self.row_versions[row] += 1
+                self._update_bits(row, col)
+
+    def apply_user(self, user_id, department_id, role, position):
+        with self._lock:
+            row = self._set_user(user_id, department_id, role, position)
+            self.row_versions[row] += 1
+            self.group_bitmaps.clear()
+            for skill_id in {skill_id for skill_id, _ in self.bitmaps}:
+                self._update_bits(row, self.skill_index[skill_id])
+
+    def remove_user(self, user_id):
+        with self._lock:
+            row = self.user_index.get(user_id)
+            if row is not None:
+                self.active[row] = False
+                self.self_scores[row, :] = 0
+                self.manager_scores[row, :] = 0
+                self.row_versions[row] += 1
+                self.group_bitmaps.clear()
+                byte, mask = row >> 3, np.uint8(0x80 >> (row & 7))
+                for bits in self.bitmaps.values():
+                    bits[byte] &= ~mask
+
+    def remove_skill(self, skill_id):
+        with self._lock:
+            col = self.skill_index.get(skill_id)
+            if col is not None:
+                self.self_scores[:, col] = 0
+                self.manager_scores[:, col] = 0
+                self.catalog_version += 1
+                for key in [key for key in self.bitmaps if key[0] == skill_id]:
+                    del self.bitmaps[key]
+
+    #битовые карты для булевых запросов по навыкам
+
+    def _update_bits(self, row, col):
+        """Пересчитывает бит строки во всех построенных картах навыка"""
+        skill_id = int(self.skill_ids[col])
+        manager_score = self.manager_scores[row, col]
+        final_score = manager_score if manager_score > 0 else self.self_scores[row, col]
+        byte, mask = row >> 3, np.uint8(0x80 >> (row & 7))
+        for min_score in range(1, 6):
+            bits = self.bitmaps.get((skill_id, min_score))
+            if bits is None:
+                continue
+            if self.active[row] and final_score >= min_score:
+                bits[byte] |= mask
+            else:
+                bits[byte] &= ~mask
+
+    def bitmap(self, skill_id, min_score=1):
+        """
+        Упакованная битовая карта строк, у которых итоговая оценка навыка
+        не ниже min_score. Строится при первом обращении, дальше
+        обновляется вместе с оценками.
+        """
+        min_score = min(max(int(min_score), 1), 5)
+        with self._lock:
+            key = (skill_id, min_score)
+            bits = self.bitmaps.get(key)
+            if bits is None:
+                size = (len(self.user_ids) + 7) // 8
+                col = self.skill_index.get(skill_id)
+                if col is None:
+                    bits = np.zeros(size, dtype=np.uint8)
+                else:
+                    column = np.zeros(len(self.user_ids), dtype=bool)
+                    column[:self.n_users] = (
+                        (self._scores_at(slice(0, self.n_users), col) >= min_score) & self.active[:self.n_users]
+                    )
+                    bits = np.packbits(column)
+                    self.bitmaps[key] = bits
+            return bits
+
+    def group_bitmap(self, by, value):
+        """Упакованная битовая карта активных пользователей группы (отдел, роль, должность)"""
+        if by not in GROUP_FIELDS:
+            raise ValueError(f'Неизвестное измерение: {by}')
+        with self._lock:
+            bits = self.group_bitmaps.get((by, value))
+            if bits is None:
+                column = np.zeros(len(self.user_ids), dtype=bool)
+                values = self.user_groups[by][:self.n_users]
+                column[:self.n_users] = np.fromiter((v == value for v in values), dtype=bool, count=self.n_users)
+                column[:self.n_users] &= self.active[:self.n_users]
+                bits = self.group_bitmaps[(by, value)] = np.packbits(column)
+            return bits
+
+    def all_bitmap(self):
+        """Упакованная битовая карта всех активных пользователей"""
+        with self._lock:
+            column = np.zeros(len(self.user_ids), dtype=bool)
+            column[:self.n_users] = self.active[:self.n_users]
+            return np.packbits(column)
+
+    def bitmap_rows(self, bits):
+        """Номера строк, отмеченных в битовой карте"""
+        with self._lock:
+            return np.nonzero(np.unpackbits(bits)[:self.n_users])[0]
+
+    #векторные операции
+
+    def scores(self, kind='final'):
+        """Матрица оценок нужного типа (0 - нет оценки); final = оценка руководителя, иначе самооценка"""
+        if kind not in SCORE_KINDS:
+            raise ValueError(f'Неизвестный тип оценки: {kind}')
+        self_scores = self.self_scores[:self.n_users, :self.n_skills]
+        manager_scores = self.manager_scores[:self.n_users, :self.n_skills]
+        if kind == 'self':
+            return self_scores
+        if kind == 'manager':
+            return manager_scores
+        return np.where(manager_scores > 0, manager_scores, self_scores)
+
+    def _scores_at(self, rows, cols, kind='final'):
+        """
+        Оценки по индексу (номер, срез или массив строк и столбцов): итоговая
+        оценка вычисляется только для выбранной части, а не для всей матрицы
+        """
+        if kind not in SCORE_KINDS:
+            raise ValueError(f'Неизвестный тип оценки: {kind}')
+        if kind == 'self':
+            return self.self_scores[rows, cols]
+        manager_scores = self.manager_scores[rows, cols]
+        if kind == 'manager':
+            return manager_scores
+        return np.where(manager_scores > 0, manager_scores, self.self_scores[rows, cols])
+
+    def block(self, rows, cols, kind='final'):
+        """Оценки на пересечении строк и столбцов без вычисления итоговой матрицы целиком"""
+        index = np.ix_(rows, cols)
+        if kind == 'self':
+            return self.self_scores[index]
+        if kind == 'manager':
+            return self.manager_scores[index]
+        manager_scores = self.manager_scores[index]
+        return np.where(manager_scores > 0, manager_scores, self.self_scores[index])
+
+    def group_codes(self, by):
+        """Коды групп для строк матрицы и список меток групп"""
+        if by not in GROUP_FIELDS:
+            raise ValueError(f'Неизвестное измерение: {by}')
+        values = self.user_groups[by][:self.n_users]
+        labels = sorted({value for value in values if value is not None}, key=str)
+        codes_by_label = {label: code for code, label in enumerate(labels)}
+        codes = np.array([codes_by_label.get(value, -1) for value in values], dtype=np.int64)
+        return codes, labels
+
+    def group_stats(self, by='department', kind='final', skill_ids=None):
+        """Количество оценок и средняя оценка по группам пользователей: {группа: {'count', 'mean'}}"""
+        with self._lock:
+            scores = self.scores(kind)
+            if skill_ids is not None:
+                scores = scores[:, self._columns(skill_ids)]
+            codes, labels = self.group_codes(by)
+            active = self.active[:self.n_users] & (codes >= 0)
+
+            row_sums = scores.sum(axis=1, dtype=np.int64)[active]
+            row_counts = (scores > 0).sum(axis=1)[active]
+            group_sums = np.bincount(codes[active], weights=row_sums, minlength=len(labels))
+            group_counts = np.bincount(codes[active], weights=row_counts, minlength=len(labels))
+
+        return {
+            label: {
+                'count': int(group_counts[code]),
+                'mean': float(group_sums[code] / group_counts[code]) if group_counts[code] else None
+            }
+            for code, label in enumerate(labels)
+        }
+
+    def skill_distribution(self, skill_id, kind='final', user_ids=None):
+        """Гистограмма оценок навыка: список из 5 счетчиков для баллов 1..5"""
+        with self._lock:
+            col = self.skill_index.get(skill_id)
+            if col is None:
+                return [0] * 5
+            rows = self._rows(user_ids) if user_ids is not None else slice(0, self.n_users)
+            column = self._scores_at(rows, col, kind)
+            counts = np.bincount(column.astype(np.int64), minlength=6)
+        return [int(count) for count in counts[1:6]]
+
+    def row(self, user_id, kind='final'):
+        """Оценки пользователя: {skill_id: балл}"""
+        with self._lock:
+            row = self.user_index.get(user_id)
+            if row is None:
+                return {}
+            values = self._scores_at(row, slice(0, self.n_skills), kind)
+            cols = np.nonzero(values)[0]
+            return {int(self.skill_ids[col]): int(values[col]) for col in cols}
+
+    def column(self, skill_id, kind='final', min_score=1):
+        """Оценки навыка: {user_id: балл} для баллов не ниже min_score"""
+        with self._lock:
+            col = self.skill_index.get(skill_id)
+            if col is None:
+                return {}
+            values = self._scores_at(slice(0, self.n_users), col, kind)
+            rows = np.nonzero((values >= max(min_score, 1)) & self.active[:self.n_users])[0]
+            return {int(self.user_ids[row]): int(values[row]) for row in rows}
+
+    def submatrix(self, user_ids, kind='final'):
+        """Срез матрицы по списку пользователей: (skill_ids, матрица пользователи×навыки)"""
+        with self._lock:
+            block = self._scores_at(self._rows(user_ids), slice(0, self.n_skills), kind)
+            rated = np.nonzero((block > 0).any(axis=0))[0]
+            return self.skill_ids[rated].copy(), block[:, rated].copy()
+
+    def locked(self):
+        """
+        Блокировка для согласованного чтения нескольких срезов подряд:
+        with matrix.locked(): ... (дельты ждут выхода из блока)
+        """
+        return self._lock
+
+    def columns(self, skill_ids):
+        """Номера столбцов навыков (неизвестные навыки пропускаются)"""
+        return self._columns(skill_ids)
+
+    def known_skills(self, skill_ids):
+        """Навыки из списка, для которых в матрице есть столбец (в том же порядке)"""
+        return [skill_id for skill_id in skill_ids if skill_id in self.skill_index]
+
+    def _rows(self, user_ids):
+        return np.array([self.user_index[u] for u in user_ids if u in self.user_index], dtype=np.int64)
+
+    def _columns(self, skill_ids):
+        return np.array([self.skill_index[s] for s in skill_ids if s in self.skill_index], dtype=np.int64)
+
+    def init_app(self, app):
+        app.config.setdefault('SCORE_MATRIX_ENABLED', False)
+        app.extensions['score_matrix'] = self
+        with self._lock:
+            self.stale = True
+            self._reset(*self._initial_shape)
+        if app.config['SCORE_MATRIX_ENABLED']:
+            change_notifier.add_listener(_on_remote_change)
+
+score_matrix = ScoreMatrix()
+
+def get_score_matrix():
+    """Загруженная матрица, если она включена настройкой SCORE_MATRIX_ENABLED, иначе None"""
+    if not current_app.config.get('SCORE_MATRIX_ENABLED'):
+        return None
+    if score_matrix.stale:
+        #запросы идут без блокировки данных, чтобы не задерживать применение дельт
+        with score_matrix._load_lock:
+            if score_matrix.stale:
+                score_matrix.load()
+    return score_matrix
+
+#дельты записей копятся в сессии и применяются только после commit
+
+def _queue_delta(target, kind, values):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('score_matrix_deltas', []).append((kind, values))
+
+def queue_assessment_deltas(session, rows):
+    """Дельты массовой записи оценок в обход ORM: [(user_id, skill_id, self_score, manager_score)]"""
+    session.info.setdefault('score_matrix_deltas', []).extend(
+        ('assessment', (user_id, skill_id, user_id, skill_id, self_score, manager_score))
+        for user_id, skill_id, self_score, manager_score in rows
+    )
+
+def _previous(target, attr):
+    history = get_history(target, attr)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(target, attr)
+
+@event.listens_for(SkillAssessment, 'after_insert')
+@event.listens_for(SkillAssessment, 'after_update')
+def _matrix_assessment_saved(mapper, connection, target):
+    _queue_delta(target, 'assessment', (
+        _previous(target, 'user_id'), _previous(target, 'skill_id'),
+        target.user_id, target.skill_id, target.self_score, target.manager_score
+    ))
+
+@event.listens_for(SkillAssessment, 'after_delete')
+def _matrix_assessment_deleted(mapper, connection, target):
+    _queue_delta(target, 'assessment_deleted', (_previous(target, 'user_id'), _previous(target, 'skill_id')))
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _matrix_user_saved(mapper, connection, target):
+    _queue_delta(target, 'user', (target.id, target.department_id, target.role, target.position))
+
+@event.listens_for(User, 'after_delete')
+def _matrix_user_deleted(mapper, connection, target):
+    _queue_delta(target, 'user_deleted', (target.id,))
+
+@event.listens_for(Skill, 'after_delete')
+def _matrix_skill_deleted(mapper, connection, target):
+    _queue_delta(target, 'skill_deleted', (target.id,))
+
+@event.listens_for(Session, 'before_commit')
+def _publish_matrix_deltas(session):
+    #последний flush commit выполняет после before_commit, поэтому сбрасываем изменения сами
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    deltas = session.info.get('score_matrix_deltas')
+    if not deltas or not has_app_context() or not current_app.config.get('SCORE_MATRIX_ENABLED'):
+        return
+    #не поместившиеся в уведомление дельты другие процессы заменяют полной перезагрузкой
+    if not change_notifier.publish(session, {'score_matrix': deltas}):
+        change_notifier.publish(session, {'score_matrix': None})
+
+@event.listens_for(Session, 'after_commit')
+def _apply_matrix_deltas(session):
+    deltas = session.info.pop('score_matrix_deltas', None)
+    if deltas:
+        score_matrix.apply_deltas(deltas)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_matrix_deltas(session):
+    session.info.pop('score_matrix_deltas', None)
+
+def _on_remote_change(payload):
+    #дельты из других процессов (None - перечитать матрицу при следующем обращении)
+    if payload.get('pid') == os.getpid() or 'score_matrix' not in payload:
+        return
+    deltas = payload['score_matrix']
+    if deltas is None:
+        deltas = [('reload', ())]
+    score_matrix.apply_deltas([(kind, tuple(values)) for kind, values in deltas])
@@ -0,0 +1,224 @@
+"""
+Нечеткий поиск сотрудников и навыков по триграммам.
+
+На PostgreSQL поиск идет по GIN индексам pg_trgm над нормализованным текстом
+(функция search_normalize): совпадение по подстроке или по word_similarity
+с ранжированием по похожести, поэтому запрос с опечаткой ("Иванв") находит
+нужные записи. Нормализация переводит в нижний регистр
+латиницу и кириллицу независимо от локали БД и заменяет "ё" на "е".
+
+Для SQLite и тестов есть NgramSearch: тот же алгоритм триграмм в памяти
+процесса, индекс перестраивается после изменения users/skills.
+"""
+
+import re
+import threading
+
+from sqlalchemy import text, func, or_, literal
+
+from .. import db
+from ..models import Skill, User
+from .notifications import change_notifier
+
+#пороги как у pg_trgm по умолчанию
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+_LATIN_UPPER = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_CYRILLIC_UPPER = 'АБВГДЕЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯЁ'
+_CYRILLIC_LOWER = 'абвгдежзийклмнопрстуфхцчшщъыьэюяё'
+
+#нормализация в SQL не зависит от LC_CTYPE базы: регистр меняется через translate
+NORMALIZE_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION search_normalize(value text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT translate(
+        value,
+        '{_LATIN_UPPER}{_CYRILLIC_UPPER}ё',
+        '{_LATIN_UPPER.lower()}{_CYRILLIC_LOWER[:-1]}ее'
+    )
+$$
+"""
+
+SEARCH_INDEXES = (
+    ('ix_users_full_name_trgm', 'users', 'full_name'),
+    ('ix_users_login_trgm', 'users', 'login'),
+    ('ix_skills_name_trgm', 'skills', 'name'),
+)
+
+_WORD = re.compile(r'\w+')
+_SPACES = re.compile(r'\s+')
+
+def normalize_text(value):
+    """Нижний регистр, ё -> е, схлопнутые пробелы"""
+    if not value:
+        return ''
+    return _SPACES.sub(' ', value.casefold().replace('ё', 'е')).strip()
+
+def trigrams(value):
+    """Множество триграмм как в pg_trgm: каждое слово дополняется пробелами ('  w', ' wo', ...)"""
+    grams = set()
+    for word in _WORD.findall(normalize_text(value).replace('_', ' ')):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def word_similarity(query_grams, target_grams):
+    """Доля триграмм запроса, найденных в тексте (приближение word_similarity из pg_trgm)"""
+    if not query_grams:
+        return 0.0
+    return len(query_grams & target_grams) / len(query_grams)
+
+def _like_pattern(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+class NgramIndex:
+    """Инвертированный индекс триграмм по набору документов {id: [поля]}"""
+
+    def __init__(self, documents):
+        self.fields = {}
+        self.postings = {}
+        for doc_id, values in documents.items():
+            fields = []
+            for value in values:
+                normalized = normalize_text(value)
+                grams = trigrams(normalized)
+                fields.append((normalized, grams))
+                for gram in grams:
+                    self.postings.setdefault(gram, set()).add(doc_id)
+            self.fields[doc_id] = fields
+
+    def search(self, query, limit=20, threshold=WORD_SIMILARITY_THRESHOLD, allowed=None):
+        """Список (id, похожесть) по убыванию похожести"""
+        normalized = normalize_text(query)
+        if not normalized:
+            return []
+        query_grams = trigrams(normalized)
+
+        candidates = set()
+        for gram in query_grams:
+            candidates |= self.postings.get(gram, set())
+        if len(normalized) < 3:
+            #короткий запрос может не дать общих триграмм с подстрокой внутри слова
+            candidates = set(self.fields)
+        if allowed is not None:
+            candidates &= allowed
+
+        results = []
+        for doc_id in candidates:
+            best = 0.0
+            matched = False
+            for value, grams in self.fields[doc_id]:
+                score = word_similarity(query_grams, grams)
+                best = max(best, score)
+                matched = matched or normalized in value or score >= threshold
+            if matched:
+                results.append((doc_id, best))
+
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:limit]
+
+class NgramSearch:
+    """Поиск по индексу триграмм в памяти процесса (SQLite, тесты)"""
+
+    name = 'ngram'
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        change_notifier.add_listener(self._on_change)
+
+    def _on_change(self, payload):
+        with self._lock:
+            for table in payload.get('tables', ()):
+                self._indexes.pop(table, None)
+
+    def _index(self, table):
+        with self._lock:
+            index = self._indexes.get(table)
+        if index is not None:
+            return index
+
+        if table == 'users':
+            rows = db.session.query(User.id, User.full_name, User.login).all()
+        else:
+            rows = db.session.query(Skill.id, Skill.name).all()
+        index = NgramIndex({row[0]: row[1:] for row in rows})
+
+        with self._lock:
+            self._indexes[table] = index
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def search_users(self, query, limit=20, department_id=None):
+        allowed = None
+        if department_id is not None:
+            allowed = {
+                user_id for (user_id,) in
+                db.session.query(User.id).filter(User.department_id == department_id).all()
+            }
+        return self._index('users').search(query, limit, allowed=allowed)
+
+    def search_skills(self, query, limit=20):
+        return self._index('skills').search(query, limit)
+
+class TrigramSearch:
+    """Поиск через pg_trgm: GIN индексы по search_normalize(поле)"""
+
+    name = 'pg_trgm'
+
+    def _rank(self, model, columns, query, limit, filters=()):
+        normalized_query = func.search_normalize(literal(query))
+        pattern = _like_pattern(normalize_text(query))
+
+        normalized_columns = [func.search_normalize(column) for column in columns]
+        conditions = []
+        for column in normalized_columns:
+            conditions.append(normalized_query.op('<%')(column))
+            conditions.append(column.like(pattern, escape='\\'))
+        scores = [func.word_similarity(normalized_query, column) for column in normalized_columns]
+        score = func.greatest(*scores) if len(scores) > 1 else scores[0]
+
+        rows = db.session.query(model.id, score.label('score')).filter(
+            or_(*conditions), *filters
+        ).order_by(score.desc(), model.id).limit(limit).all()
+        return [(row.id, float(row.score)) for row in rows]
+
+    def search_users(self, query, limit=20, department_id=None):
+        filters = (User.department_id == department_id,) if department_id is not None else ()
+        return self._rank(User, (User.full_name, User.login), query, limit, filters)
+
+    def search_skills(self, query, limit=20):
+        return self._rank(Skill, (Skill.name,), query, limit)
+
+    def clear(self):
+        pass
+
+def get_search_backend():
+    """Backend поиска для текущей БД (SEARCH_BACKEND = 'pg_trgm' | 'ngram' переопределяет выбор)"""
+    from flask import current_app
+    name = current_app.config.get('SEARCH_BACKEND')
+    if name is None:
+        name = 'pg_trgm' if db.session.get_bind().dialect.name == 'postgresql' else 'ngram'
+    backends = current_app.extensions.setdefault('search_backends', {})
+    if name not in backends:
+        backends[name] = TrigramSearch() if name == 'pg_trgm' else NgramSearch()
+    return backends[name]
+
+def ensure_search_indexes(connection=None):
+    """pg_trgm, функция нормализации и GIN индексы (только PostgreSQL, идемпотентно)"""
+    connection = connection or db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return False
+
+    connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    connection.execute(text(NORMALIZE_FUNCTION_SQL))
+    for index_name, table, column in SEARCH_INDEXES:
+        connection.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} '
+            f'USING gin (search_normalize({column}) gin_trgm_ops)'
+        ))
+    return True
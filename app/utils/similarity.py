@@ -0,0 +1,194 @@
+"""
+Поиск сотрудников с похожим профилем навыков.
+
+Индекс хранит L2-нормированные векторы итоговых оценок (float32) для строк
+матрицы оценок ScoreMatrix. Похожесть - косинус, то есть одно матрично-
+векторное произведение по всем пользователям (блоками, чтобы не держать
+большие временные массивы) и argpartition для top-k.
+
+Строки, изменившиеся в матрице (row_versions), пересчитываются перед
+запросом; изменение каталога навыков (новый или удаленный навык) запускает
+полную перестройку в фоне, а запросы до ее окончания обслуживает старый индекс.
+Если матрица выключена, похожесть считается одним SQL запросом.
+"""
+
+import logging
+import threading
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+
+from .. import db
+from ..models import SkillAssessment, User
+from .reports import final_score_expression
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 16384
+
+def _normalized(scores):
+    vectors = scores.astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+class SimilarityIndex:
+    """Нормированные векторы навыков поверх ScoreMatrix"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuilding = None
+        self._reset()
+
+    def _reset(self):
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.row_versions = np.zeros(0, dtype=np.int64)
+        self.generation = None
+        self.catalog_version = None
+
+    def init_app(self, app):
+        app.extensions['similarity_index'] = self
+        with self._lock:
+            self._reset()
+
+    def build(self, matrix):
+        """Полная перестройка индекса по текущей матрице"""
+        with matrix.locked():
+            scores = matrix.scores('final')
+            row_versions = matrix.row_versions[:matrix.n_users].copy()
+            generation, catalog_version = matrix.generation, matrix.catalog_version
+        vectors = _normalized(scores)
+        with self._lock:
+            self.vectors = vectors
+            self.row_versions = row_versions
+            self.generation = generation
+            self.catalog_version = catalog_version
+
+    def _rebuild_in_background(self, matrix):
+        with self._lock:
+            if self._rebuilding is not None and self._rebuilding.is_alive():
+                return
+            self._rebuilding = threading.Thread(target=self._safe_build, args=(matrix,), daemon=True)
+            self._rebuilding.start()
+
+    def _safe_build(self, matrix):
+        try:
+            self.build(matrix)
+        except Exception as e:
+            logger.error(f"Ошибка перестройки индекса похожести: {e}")
+
+    def refresh(self, matrix):
+        """Приводит индекс в соответствие с матрицей: пересчет измененных строк или перестройка"""
+        if self.generation != matrix.generation:
+            #новая загрузка матрицы: без индекса отвечать нечем, строим сразу
+            self.build(matrix)
+            return
+
+        if self.catalog_version != matrix.catalog_version:
+            #по умолчанию в фоне, в тестах синхронно
+            if current_app.config.get('SIMILARITY_INDEX_BACKGROUND', not current_app.testing):
+                self._rebuild_in_background(matrix)
+            else:
+                self.build(matrix)
+                return
+
+        with matrix.locked(), self._lock:
+            n_users, n_skills = matrix.n_users, self.vectors.shape[1]
+            if n_users > len(self.row_versions):
+                grown = np.zeros((n_users, n_skills), dtype=np.float32)
+                grown[:len(self.vectors)] = self.vectors
+                self.vectors = grown
+                self.row_versions = np.concatenate([
+                    self.row_versions, np.full(n_users - len(self.row_versions), -1, dtype=np.int64)
+                ])
+            changed = np.nonzero(matrix.row_versions[:n_users] != self.row_versions)[0]
+            if len(changed):
+                columns = min(n_skills, matrix.n_skills)
+                scores = np.zeros((len(changed), n_skills), dtype=np.int8)
+                scores[:, :columns] = matrix.block(changed, np.arange(columns))
+                self.vectors[changed] = _normalized(scores)
+                self.row_versions[changed] = matrix.row_versions[changed]
+
+    def similar(self, matrix, user_id, k=10, department_id=None):
+        """
+        k самых похожих сотрудников: [(user_id, похожесть, число общих навыков)].
+        None, если пользователя нет в матрице.
+        """
+        self.refresh(matrix)
+        with matrix.locked(), self._lock:
+            row = matrix.user_index.get(user_id)
+            if row is None or row >= len(self.vectors):
+                return None
+            query = self.vectors[row]
+            n_users = len(self.vectors)
+
+            similarities = np.empty(n_users, dtype=np.float32)
+            for start in range(0, n_users, BLOCK_SIZE):
+                block = self.vectors[start:start + BLOCK_SIZE]
+                np.dot(block, query, out=similarities[start:start + len(block)])
+
+            candidates = matrix.active[:n_users].copy()
+            candidates[row] = False
+            if department_id is not None:
+                groups = matrix.user_groups['department'][:n_users]
+                candidates &= np.fromiter((group == department_id for group in groups), dtype=bool, count=n_users)
+            candidates &= similarities > 0
+            similarities[~candidates] = -1
+
+            found = int(candidates.sum())
+            if not found:
+                return []
+            k = min(k, found)
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.lexsort((matrix.user_ids[top], -similarities[top]))]
+
+            own = matrix.block(np.array([row]), np.arange(matrix.n_skills))[0] > 0
+            others = matrix.block(top, np.arange(matrix.n_skills)) > 0
+            common = (others & own).sum(axis=1)
+
+            return [
+                (int(matrix.user_ids[i]), round(float(similarities[i]), 4), int(count))
+                for i, count in zip(top, common)
+            ]
+
+similarity_index = SimilarityIndex()
+
+def similar_users_sql(user_id, k=10, department_id=None):
+    """То же одним SQL запросом (матрица выключена): скалярные произведения по общим навыкам"""
+    final_score = final_score_expression()
+    norms = db.session.query(
+        SkillAssessment.user_id.label('user_id'),
+        func.sum(final_score * final_score).label('norm_sq')
+    ).group_by(SkillAssessment.user_id).subquery()
+
+    own_norm = db.session.query(norms.c.norm_sq).filter(norms.c.user_id == user_id).scalar()
+    if not own_norm:
+        return []
+
+    own = db.session.query(
+        SkillAssessment.skill_id.label('skill_id'), final_score.label('score')
+    ).filter(SkillAssessment.user_id == user_id, final_score.isnot(None)).subquery()
+
+    dot = func.sum(own.c.score * final_score)
+    query = db.session.query(
+        SkillAssessment.user_id, dot.label('dot'), func.count().label('common'), norms.c.norm_sq
+    ).join(
+        own, own.c.skill_id == SkillAssessment.skill_id
+    ).join(
+        norms, norms.c.user_id == SkillAssessment.user_id
+    ).filter(
+        SkillAssessment.user_id != user_id, final_score.isnot(None)
+    )
+    if department_id is not None:
+        query = query.join(User, User.id == SkillAssessment.user_id).filter(User.department_id == department_id)
+
+    #косинус монотонен по dot^2 / |b|^2 (dot > 0), поэтому sqrt в SQL не нужен
+    rows = query.group_by(SkillAssessment.user_id, norms.c.norm_sq).order_by(
+        (dot * dot * 1.0 / norms.c.norm_sq).desc(), SkillAssessment.user_id
+    ).limit(k).all()
+
+    return [
+        (row.user_id, round(float(row.dot) / float(np.sqrt(own_norm * row.norm_sq)), 4), int(row.common))
+        for row in rows if row.dot
+    ]
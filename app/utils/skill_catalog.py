@@ -0,0 +1,154 @@
+"""
+Каталог навыков с числом оценок по каждому навыку.
+
+Каталог загружается одним запросом к навыкам и хранится в памяти процесса
+вместе с версией - data_version таблицы skills на момент загрузки. После
+commit, изменившего навыки (создание, изменение, удаление через skill_routes,
+api_routes и любые другие пути), каталог сбрасывается и перечитывается при
+следующем обращении. Сброс рассылается в другие процессы через шину
+invalidation_bus (тема skill_catalog), запасной срок жизни каталога -
+SKILL_CATALOG_TTL. Запись оценок каталог не сбрасывает.
+
+Число оценок навыков берется отдельно из срезов навыков analytics_rollups
+(одна строка на навык, обновляются в транзакции записи оценок) и
+добавляется к каталогу; каталог с теми же числами переиспользуется.
+
+Версия каталога отдается клиентам (поле version и ETag), в ETag ответа
+с числами оценок добавляется их контрольная сумма, поэтому неизменившийся
+ответ можно не загружать повторно.
+"""
+
+import threading
+import zlib
+
+from .. import db
+from ..models import Skill
+from .changes import subscribe_flush
+from .invalidation import invalidation_bus
+from .rollups import get_skill_counts
+from .versioning import data_version
+
+#таблицы, изменение которых делает каталог устаревшим
+CATALOG_TABLES = frozenset({'skills'})
+
+CATALOG_TOPIC = 'skill_catalog'
+
+class CatalogSnapshot:
+    """Загруженный каталог: версия, навыки по порядку и по категориям"""
+
+    __slots__ = ('version', 'skills', 'by_id', 'categories', 'counts_tag')
+
+    def __init__(self, version, skills, counts_tag=None):
+        self.version = version
+        self.skills = skills
+        self.counts_tag = counts_tag
+        self.by_id = {skill['id']: skill for skill in skills}
+        self.categories = {}
+        for skill in skills:
+            self.categories.setdefault(skill['category'], []).append(skill)
+
+    @property
+    def etag(self):
+        if self.counts_tag is None:
+            return f'skills-{self.version}'
+        return f'skills-{self.version}-{self.counts_tag}'
+
+    def with_counts(self, counts):
+        """Каталог с числом оценок каждого навыка (assessments_count)"""
+        skills = [dict(skill, assessments_count=counts.get(skill['id'], 0)) for skill in self.skills]
+        tag = zlib.crc32(','.join(str(skill['assessments_count']) for skill in skills).encode())
+        return CatalogSnapshot(self.version, skills, f'{tag:08x}')
+
+class SkillCatalog:
+    """Кэш каталога навыков в памяти процесса со сбросом после изменений"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._counted = None
+        self._generation = 0
+        self._stats = {'hits': 0, 'loads': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('SKILL_CATALOG_TTL', self.ttl)
+        app.extensions['skill_catalog'] = self
+        self.invalidate()
+        invalidation_bus.register(CATALOG_TOPIC, _on_invalidate, ttl=self.ttl)
+
+    def load(self):
+        """Навыки одним запросом (версия читается до данных)"""
+        with self._lock:
+            generation = self._generation
+        version = data_version(*sorted(CATALOG_TABLES))
+        rows = db.session.query(
+            Skill.id,
+            Skill.name,
+            Skill.category,
+            Skill.description
+        ).order_by(Skill.category, Skill.name).all()
+
+        snapshot = CatalogSnapshot(version, [{
+            'id': row.id,
+            'name': row.name,
+            'category': row.category,
+            'description': row.description
+        } for row in rows])
+
+        with self._lock:
+            self._stats['loads'] += 1
+            #каталог, сброшенный во время загрузки, не сохраняем: данные могли устареть
+            if generation == self._generation:
+                self._snapshot = snapshot
+        return snapshot
+
+    def get(self, with_counts=True):
+        """
+        Текущий каталог (загружается при первом обращении после сброса).
+        with_counts - добавить число оценок навыков из срезов analytics_rollups.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            with self._lock:
+                self._stats['hits'] += 1
+        else:
+            snapshot = self.load()
+        if not with_counts:
+            return snapshot
+
+        counts = get_skill_counts()
+        counted = self._counted
+        if counted is not None and counted[0] is snapshot and counted[1] == counts:
+            return counted[2]
+        result = snapshot.with_counts(counts)
+        self._counted = (snapshot, counts, result)
+        return result
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self._counted = None
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['loaded'] = self._snapshot is not None
+            stats['version'] = self._snapshot.version if self._snapshot is not None else None
+        return stats
+
+skill_catalog = SkillCatalog()
+
+def get_skill_catalog(with_counts=True):
+    """Каталог навыков (из кэша процесса), по умолчанию с числом оценок"""
+    return skill_catalog.get(with_counts)
+
+@subscribe_flush
+def _invalidate_catalog(session, tables):
+    #рассылка остальным вместе с транзакцией, сброс в этом процессе - после commit
+    if tables & CATALOG_TABLES:
+        invalidation_bus.invalidate(CATALOG_TOPIC, session=session)
+
+def _on_invalidate(key):
+    skill_catalog.invalidate()
@@ -0,0 +1,217 @@
+"""
+Массовый импорт справочника навыков (CSV или JSON).
+
+Строки проверяются за один проход validate_skill_data, затем сравниваются
+с каталогом одним запросом (название и категория - ключ навыка, как при
+создании через API): новые, измененные (другое описание) и без изменений.
+Без apply возвращается только этот разбор (dry-run).
+
+Запись:
+    PostgreSQL - COPY новых и измененных строк во временную таблицу и одна
+                 команда (UPDATE в CTE + INSERT ... WHERE NOT EXISTS);
+    SQLite     - INSERT и UPDATE пачками через executemany.
+
+Запись идет в обход ORM, поэтому измененная таблица помечается через
+mark_changed (версии, кэши, уведомления других процессов), а префиксный
+индекс навыков перечитывается после commit.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, bindparam, text
+
+from ..models import Skill
+from .changes import mark_changed
+from .skill_index import queue_reload
+from .validators import validate_skill_data
+
+MAX_IMPORT_ROWS = 20000
+IMPORT_BATCH_SIZE = 1000
+#сколько строк каждого вида показывать в разборе
+DIFF_PREVIEW_LIMIT = 100
+
+IMPORT_FIELDS = ('name', 'category', 'description')
+
+skills_table = Skill.__table__
+
+def read_import_rows(content, fmt):
+    """
+    Строки импорта из CSV (заголовок name,category,description) или JSON
+    (список объектов или {"skills": [...]}).
+
+    Raises:
+        ValueError: неизвестный формат, неразборчивый файл или слишком много строк
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(content))
+        if not reader.fieldnames or not {'name', 'category'} <= {field.strip() for field in reader.fieldnames}:
+            raise ValueError('CSV должен содержать заголовок с колонками name, category и (необязательно) description')
+        rows = [{(key or '').strip(): value for key, value in row.items()} for row in reader]
+    elif fmt == 'json':
+        try:
+            rows = json.loads(content) if isinstance(content, str) else content
+        except ValueError:
+            raise ValueError('Некорректный JSON')
+        if isinstance(rows, dict):
+            rows = rows.get('skills')
+        if not isinstance(rows, list):
+            raise ValueError('Ожидается список навыков или объект {"skills": [...]}')
+    else:
+        raise ValueError(f'Неизвестный формат импорта: {fmt}')
+
+    if not rows:
+        raise ValueError('Файл импорта не содержит навыков')
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise ValueError(f'Слишком много строк в импорте (больше {MAX_IMPORT_ROWS})')
+    return rows
+
+def validate_import_rows(rows):
+    """
+    Проверяет строки за один проход. Номер строки (row) считается с 1.
+
+    Returns:
+        tuple: ([{'row', 'name', 'category', 'description'}], [{'row', 'message'}])
+    """
+    valid, errors, seen = [], [], {}
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'message': 'Ожидается объект {name, category, description}'})
+            continue
+        name, category, description = (str(row.get(field) or '').strip() for field in IMPORT_FIELDS)
+
+        is_valid, message = validate_skill_data(name, category, description)
+        if not is_valid:
+            errors.append({'row': number, 'message': message})
+            continue
+        key = (name, category)
+        if key in seen:
+            errors.append({'row': number, 'message': f'Навык уже указан в строке {seen[key]}'})
+            continue
+        seen[key] = number
+        valid.append({'row': number, 'name': name, 'category': category, 'description': description})
+    return valid, errors
+
+def diff_catalog(connection, rows):
+    """
+    Разбор строк относительно каталога одним запросом.
+
+    Returns:
+        dict: {'new': [...], 'changed': [... + 'ids', 'old_description'], 'unchanged': [...]}
+    """
+    existing = {}
+    for row in connection.execute(
+        select(skills_table.c.id, skills_table.c.name, skills_table.c.category, skills_table.c.description)
+    ):
+        existing.setdefault((row.name, row.category), []).append((row.id, row.description or ''))
+
+    diff = {'new': [], 'changed': [], 'unchanged': []}
+    for row in rows:
+        matches = existing.get((row['name'], row['category']))
+        if not matches:
+            diff['new'].append(row)
+            continue
+        changed = [(skill_id, old) for skill_id, old in matches if old != row['description']]
+        if changed:
+            diff['changed'].append(dict(
+                row, ids=[skill_id for skill_id, _ in changed], old_description=changed[0][1]
+            ))
+        else:
+            diff['unchanged'].append(row)
+    return diff
+
+def summarize_diff(diff, errors, limit=DIFF_PREVIEW_LIMIT):
+    """Счетчики и первые строки каждого вида для ответа API"""
+    def preview(rows, *fields):
+        return [{field: row[field] for field in fields} for row in rows[:limit]]
+
+    return {
+        'summary': {
+            'new': len(diff['new']),
+            'changed': len(diff['changed']),
+            'unchanged': len(diff['unchanged']),
+            'errors': len(errors)
+        },
+        'new': preview(diff['new'], 'row', 'name', 'category'),
+        'changed': preview(diff['changed'], 'row', 'name', 'category', 'old_description', 'description'),
+        'errors': errors[:limit]
+    }
+
+def _apply_postgres(connection, rows, now):
+    """COPY во временную таблицу и одна команда слияния с каталогом"""
+    connection.execute(text(
+        'CREATE TEMP TABLE skill_import_staging '
+        '(name varchar(100) NOT NULL, category varchar(100) NOT NULL, description text) ON COMMIT DROP'
+    ))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow((row['name'], row['category'], row['description']))
+    buffer.seek(0)
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(
+            'COPY skill_import_staging (name, category, description) FROM STDIN WITH (FORMAT csv)', buffer
+        )
+
+    #UPDATE не меняет ключ (название, категория), поэтому NOT EXISTS видит тот же каталог
+    connection.execute(text("""
+        WITH updated AS (
+            UPDATE skills s
+            SET description = st.description, updated_at = :now
+            FROM skill_import_staging st
+            WHERE s.name = st.name AND s.category = st.category
+              AND COALESCE(s.description, '') <> COALESCE(st.description, '')
+            RETURNING s.id
+        )
+        INSERT INTO skills (name, category, description, created_at, updated_at)
+        SELECT st.name, st.category, st.description, :now, :now
+        FROM skill_import_staging st
+        WHERE NOT EXISTS (
+            SELECT 1 FROM skills s WHERE s.name = st.name AND s.category = st.category
+        )
+    """), {'now': now})
+
+def _apply_batched(connection, diff, now, batch_size=IMPORT_BATCH_SIZE):
+    """INSERT и UPDATE пачками (executemany)"""
+    new = [
+        {'name': row['name'], 'category': row['category'], 'description': row['description'],
+         'created_at': now, 'updated_at': now}
+        for row in diff['new']
+    ]
+    changed = [
+        {'_id': skill_id, '_description': row['description'], '_now': now}
+        for row in diff['changed'] for skill_id in row['ids']
+    ]
+    for start in range(0, len(new), batch_size):
+        connection.execute(insert(skills_table), new[start:start + batch_size])
+    for start in range(0, len(changed), batch_size):
+        connection.execute(
+            update(skills_table)
+            .where(skills_table.c.id == bindparam('_id'))
+            .values(description=bindparam('_description'), updated_at=bindparam('_now')),
+            changed[start:start + batch_size]
+        )
+
+def apply_import(session, diff):
+    """
+    Записывает новые и измененные навыки из разбора. Коммит делает вызывающий код.
+
+    Returns:
+        dict: {'created': ..., 'updated': ...}
+    """
+    rows = diff['new'] + diff['changed']
+    if not rows:
+        return {'created': 0, 'updated': 0}
+
+    connection = session.connection()
+    now = datetime.utcnow()
+    if connection.dialect.name == 'postgresql':
+        _apply_postgres(connection, rows, now)
+    else:
+        _apply_batched(connection, diff, now)
+
+    mark_changed(session, skills_table.name)
+    queue_reload(session)
+    return {'created': len(diff['new']), 'updated': len(diff['changed'])}
@@ -0,0 +1,168 @@
+"""
+Префиксный индекс навыков для автодополнения.
+
+Ключи (название целиком, отдельные слова названия и категория) хранятся
+в отсортированных массивах, поиск по префиксу - два bisect и обход
+найденного диапазона. Индекс загружается один раз, а после commit
+патчится по событиям Skill (создание, изменение, удаление), поэтому
+изменения через skill_routes и api_routes видны сразу.
+Изменения из других процессов помечают индекс устаревшим.
+"""
+
+import bisect
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import Skill
+from .notifications import change_notifier
+from .search import normalize_text
+
+#порядок важности совпадений: начало названия, начало слова названия, категория
+KEY_KINDS = ('name', 'word', 'category')
+
+class SkillPrefixIndex:
+    """Отсортированные ключи -> id навыков с поиском по префиксу"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.stale = True
+        self._reset()
+
+    def _reset(self):
+        self.skills = {}
+        self._keys = {kind: [] for kind in KEY_KINDS}
+
+    @staticmethod
+    def _entries(name, category):
+        normalized_name = normalize_text(name)
+        normalized_category = normalize_text(category)
+        entries = [('name', normalized_name)]
+        entries.extend(('word', word) for word in sorted(set(normalized_name.split()[1:])))
+        entries.append(('category', normalized_category))
+        entries.extend(('category', word) for word in sorted(set(normalized_category.split()[1:])))
+        return entries
+
+    def load(self):
+        """Полная загрузка каталога навыков"""
+        rows = db.session.query(Skill.id, Skill.name, Skill.category).all()
+        with self._lock:
+            self._reset()
+            for skill_id, name, category in rows:
+                self.skills[skill_id] = (name, category)
+                for kind, key in self._entries(name, category):
+                    self._keys[kind].append((key, skill_id))
+            for keys in self._keys.values():
+                keys.sort()
+            self.stale = False
+
+    def add(self, skill_id, name, category):
+        with self._lock:
+            self.remove(skill_id)
+            self.skills[skill_id] = (name, category)
+            for kind, key in self._entries(name, category):
+                bisect.insort(self._keys[kind], (key, skill_id))
+
+    def remove(self, skill_id):
+        with self._lock:
+            previous = self.skills.pop(skill_id, None)
+            if previous is None:
+                return
+            for kind, key in self._entries(*previous):
+                keys = self._keys[kind]
+                position = bisect.bisect_left(keys, (key, skill_id))
+                if position < len(keys) and keys[position] == (key, skill_id):
+                    del keys[position]
+
+    def skills_by_id(self):
+        """Копия каталога индекса: {skill_id: (название, категория)}"""
+        with self._lock:
+            return dict(self.skills)
+
+    def search(self, query, limit=10):
+        """До limit навыков, у которых название, слово названия или категория начинаются с query"""
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+
+        found = []
+        seen = set()
+        with self._lock:
+            for kind in KEY_KINDS:
+                keys = self._keys[kind]
+                position = bisect.bisect_left(keys, (prefix,))
+                while position < len(keys) and len(found) < limit:
+                    key, skill_id = keys[position]
+                    if not key.startswith(prefix):
+                        break
+                    if skill_id not in seen:
+                        seen.add(skill_id)
+                        name, category = self.skills[skill_id]
+                        found.append({'id': skill_id, 'name': name, 'category': category})
+                    position += 1
+                if len(found) >= limit:
+                    break
+        return found
+
+    def init_app(self, app):
+        app.extensions['skill_index'] = self
+        with self._lock:
+            self.stale = True
+            self._reset()
+        change_notifier.add_listener(_on_remote_change)
+
+skill_index = SkillPrefixIndex()
+
+def get_skill_index():
+    """Загруженный индекс навыков"""
+    if skill_index.stale:
+        with skill_index._lock:
+            if skill_index.stale:
+                skill_index.load()
+    return skill_index
+
+#изменения копятся в сессии и применяются только после commit
+
+def _queue_patch(target, patch):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('skill_index_patches', []).append(patch)
+
+def queue_reload(session):
+    """Полная перезагрузка индекса после commit (массовые записи в обход ORM)"""
+    session.info['skill_index_reload'] = True
+
+@event.listens_for(Skill, 'after_insert')
+@event.listens_for(Skill, 'after_update')
+def _index_skill_saved(mapper, connection, target):
+    _queue_patch(target, (target.id, target.name, target.category))
+
+@event.listens_for(Skill, 'after_delete')
+def _index_skill_deleted(mapper, connection, target):
+    _queue_patch(target, (target.id, None, None))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_skill_patches(session):
+    patches = session.info.pop('skill_index_patches', None)
+    if session.info.pop('skill_index_reload', False):
+        skill_index.stale = True
+    if not patches or skill_index.stale:
+        return
+    for skill_id, name, category in patches:
+        if name is None:
+            skill_index.remove(skill_id)
+        else:
+            skill_index.add(skill_id, name, category)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_skill_patches(session):
+    session.info.pop('skill_index_patches', None)
+    session.info.pop('skill_index_reload', None)
+
+def _on_remote_change(payload):
+    #изменения из других процессов: перечитаем индекс при следующем обращении
+    if payload.get('pid') != os.getpid() and 'skills' in payload.get('tables', ()):
+        skill_index.stale = True
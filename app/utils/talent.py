@@ -0,0 +1,203 @@
+"""
+Булевы запросы по навыкам для подбора сотрудников.
+
+Запрос - дерево условий в JSON:
+
+    {"all": [
+        {"skill": "Python", "min_score": 4},
+        {"skill": "PostgreSQL", "min_score": 3},
+        {"any": ["Kafka", "RabbitMQ"], "min_score": 3}
+    ]}
+
+Узлы: {"skill": <название>} или {"skill_id": <id>}, {"all": [...]},
+{"any": [...]}, {"not": <узел>}; строка вместо узла - название навыка.
+min_score у группы наследуется условиями внутри нее (по умолчанию 1).
+
+Если включена матрица оценок (SCORE_MATRIX_ENABLED), запрос считается
+по битовым картам (skill_id, порог) побитовыми AND/OR/NOT над массивами,
+которые обновляются вместе с оценками. Иначе дерево компилируется в один
+SQL запрос с EXISTS на каждое условие.
+"""
+
+import numpy as np
+from sqlalchemy import and_, or_, not_, exists, func, select
+from sqlalchemy.orm import aliased
+
+from .. import db
+from ..models import SkillAssessment, User
+from .reports import final_score_expression
+from .search import normalize_text
+from .skill_index import get_skill_index
+
+MAX_PREDICATES = 50
+MAX_DEPTH = 8
+
+def parse_talent_query(expression):
+    """
+    Проверяет дерево запроса и заменяет названия навыков на id.
+
+    Returns:
+        tuple: ('skill', id, порог) | ('all', [узлы]) | ('any', [узлы]) | ('not', узел)
+
+    Raises:
+        ValueError: некорректный запрос или неизвестный навык
+    """
+    skills = get_skill_index().skills_by_id()
+    ids_by_name = {normalize_text(name): skill_id for skill_id, (name, _) in skills.items()}
+    predicates = []
+
+    def min_score_of(node, inherited):
+        value = node.get('min_score', inherited) if isinstance(node, dict) else inherited
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError('min_score должен быть числом от 1 до 5')
+        if not 1 <= value <= 5:
+            raise ValueError('min_score должен быть числом от 1 до 5')
+        return value
+
+    def resolve(node):
+        if node.get('skill_id') is not None:
+            skill_id = node['skill_id']
+            if isinstance(skill_id, bool) or not isinstance(skill_id, int):
+                raise ValueError('skill_id должен быть целым числом')
+            if skill_id not in skills:
+                raise ValueError(f'Навык {skill_id} не найден')
+            return skill_id
+        name = node.get('skill')
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError('Название навыка должно быть непустой строкой')
+        skill_id = ids_by_name.get(normalize_text(name))
+        if skill_id is None:
+            raise ValueError(f'Навык "{name}" не найден')
+        return skill_id
+
+    def parse(node, inherited, depth):
+        if depth > MAX_DEPTH:
+            raise ValueError(f'Слишком глубокая вложенность (больше {MAX_DEPTH})')
+
+        if isinstance(node, str):
+            node = {'skill': node}
+        if not isinstance(node, dict):
+            raise ValueError('Узел запроса должен быть объектом или названием навыка')
+
+        min_score = min_score_of(node, inherited)
+        if 'skill' in node or 'skill_id' in node:
+            predicates.append(node)
+            if len(predicates) > MAX_PREDICATES:
+                raise ValueError(f'Слишком много условий (больше {MAX_PREDICATES})')
+            return ('skill', resolve(node), min_score)
+
+        for operator in ('all', 'any'):
+            if operator in node:
+                children = node[operator]
+                if not isinstance(children, list) or not children:
+                    raise ValueError(f'"{operator}" должен быть непустым списком')
+                return (operator, [parse(child, min_score, depth + 1) for child in children])
+
+        if 'not' in node:
+            return ('not', parse(node['not'], min_score, depth + 1))
+
+        raise ValueError('Узел должен содержать skill, skill_id, all, any или not')
+
+    return parse(expression, 1, 0)
+
+def query_skills(node):
+    """id навыков, упомянутых в запросе, в порядке появления"""
+    if node[0] == 'skill':
+        return [node[1]]
+    children = node[1] if node[0] in ('all', 'any') else [node[1]]
+    result = []
+    for child in children:
+        for skill_id in query_skills(child):
+            if skill_id not in result:
+                result.append(skill_id)
+    return result
+
+def _bits(matrix, node):
+    kind = node[0]
+    if kind == 'skill':
+        return matrix.bitmap(node[1], node[2])
+    if kind == 'not':
+        return np.bitwise_and(np.invert(_bits(matrix, node[1])), matrix.all_bitmap())
+    parts = [_bits(matrix, child) for child in node[1]]
+    combine = np.bitwise_and if kind == 'all' else np.bitwise_or
+    return combine.reduce(parts)
+
+def evaluate_with_matrix(matrix, node, department_id=None, role=None, limit=50):
+    """Вычисление по битовым картам матрицы: (всего найдено, [(user_id, сумма, {skill_id: балл})])"""
+    skill_ids = query_skills(node)
+    with matrix.locked():
+        bits = np.bitwise_and(_bits(matrix, node), matrix.all_bitmap())
+        if department_id is not None:
+            bits &= matrix.group_bitmap('department', department_id)
+        if role is not None:
+            bits &= matrix.group_bitmap('role', role)
+
+        rows = matrix.bitmap_rows(bits)
+        cols = matrix.columns(skill_ids)
+        known_skills = matrix.known_skills(skill_ids)
+        block = matrix.block(rows, cols).astype(np.int64)
+        totals = block.sum(axis=1)
+        user_ids = matrix.user_ids[rows]
+
+        order = np.lexsort((user_ids, -totals))[:limit]
+        results = [
+            (
+                int(user_ids[i]),
+                int(totals[i]),
+                {skill_id: int(score) for skill_id, score in zip(known_skills, block[i]) if score}
+            )
+            for i in order
+        ]
+    return len(rows), results
+
+def _condition(node, user_id):
+    kind = node[0]
+    if kind == 'skill':
+        assessment = aliased(SkillAssessment)
+        final_score = func.coalesce(assessment.manager_score, assessment.self_score)
+        return exists().where(
+            assessment.user_id == user_id,
+            assessment.skill_id == node[1],
+            final_score >= node[2]
+        )
+    if kind == 'not':
+        return not_(_condition(node[1], user_id))
+    parts = [_condition(child, user_id) for child in node[1]]
+    return and_(*parts) if kind == 'all' else or_(*parts)
+
+def evaluate_with_sql(node, department_id=None, role=None, limit=50):
+    """Вычисление одним SQL запросом: (всего найдено, [(user_id, сумма, {skill_id: балл})])"""
+    skill_ids = query_skills(node)
+    final_score = final_score_expression()
+
+    totals = select(
+        SkillAssessment.user_id.label('user_id'),
+        func.sum(final_score).label('total')
+    ).where(SkillAssessment.skill_id.in_(skill_ids)).group_by(SkillAssessment.user_id).subquery()
+
+    total_score = func.coalesce(totals.c.total, 0)
+    query = db.session.query(
+        User.id, total_score.label('total'), func.count().over().label('found')
+    ).outerjoin(totals, totals.c.user_id == User.id).filter(_condition(node, User.id))
+    if department_id is not None:
+        query = query.filter(User.department_id == department_id)
+    if role is not None:
+        query = query.filter(User.role == role)
+
+    rows = query.order_by(total_score.desc(), User.id).limit(limit).all()
+    if not rows:
+        return 0, []
+
+    scores = {}
+    for user_id, skill_id, score in db.session.query(
+        SkillAssessment.user_id, SkillAssessment.skill_id, final_score
+    ).filter(
+        SkillAssessment.user_id.in_([row.id for row in rows]),
+        SkillAssessment.skill_id.in_(skill_ids),
+        final_score.isnot(None)
+    ).all():
+        scores.setdefault(user_id, {})[skill_id] = score
+
+    return rows[0].found, [(row.id, int(row.total), scores.get(row.id, {})) for row in rows]
@@ -0,0 +1,216 @@
+"""
+Динамика оценок по времени.
+
+Каждая запись AssessmentHistory при вставке добавляется в недельный и месячный
+агрегат (score_trend_buckets) в той же транзакции: сумма и количество новых
+значений и сумма изменений (новое - старое). Срез по отделу - отдел
+сотрудника на момент изменения (assessment_history.department_id), и при
+инкрементальном обновлении, и при полном пересчете. Отчет /hr/api/trends читает
+только агрегаты за нужный период, без просмотра всей истории.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, update, func
+
+from .. import db
+from ..models import AssessmentHistory, ScoreTrendBucket, SkillAssessment, User
+from .history import history_trigger_enabled
+from .rollups import _insert, department_key
+from .schema import add_missing_columns
+
+TREND_BUCKETS = ('week', 'month')
+TREND_FIELDS = ('self_score', 'manager_score')
+
+TREND_KEY = ('bucket', 'bucket_start', 'skill_id', 'department_key', 'field_changed')
+TREND_COLUMNS = ('change_count', 'value_sum', 'value_count', 'delta_sum', 'delta_count')
+
+trend_table = ScoreTrendBucket.__table__
+
+def bucket_start(moment, bucket):
+    """Начало интервала: понедельник недели или первое число месяца"""
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    raise ValueError(f'Неизвестный интервал: {bucket}')
+
+def history_vector(old_value, new_value):
+    """Вклад одной записи истории в агрегат"""
+    changed = old_value is not None and new_value is not None
+    return {
+        'change_count': 1,
+        'value_sum': new_value or 0,
+        'value_count': 1 if new_value is not None else 0,
+        'delta_sum': (new_value - old_value) if changed else 0,
+        'delta_count': 1 if changed else 0,
+    }
+
+def apply_trend_delta(connection, keys, delta):
+    """Добавляет вклад в агрегаты через текущее соединение (в той же транзакции)"""
+    apply_trend_deltas(connection, {key: delta for key in keys})
+
+def apply_trend_deltas(connection, deltas):
+    """
+    Разные вклады для разных агрегатов {ключ: вектор} одной командой
+    INSERT ... ON CONFLICT DO UPDATE по unique_trend_bucket: первая запись в
+    новый интервал из нескольких транзакций не падает на уникальном ключе.
+    Строки блокируются в порядке ключей, одинаковом для всех транзакций.
+    """
+    deltas = {
+        key: {column: value for column, value in vector.items() if value}
+        for key, vector in deltas.items()
+    }
+    deltas = {key: vector for key, vector in deltas.items() if vector}
+    if not deltas:
+        return
+
+    statement = _insert(connection.dialect.name)(trend_table).values([
+        dict(
+            {column: 0 for column in TREND_COLUMNS}, **deltas[key],
+            bucket=key[0], bucket_start=key[1], skill_id=key[2],
+            department_key=key[3], field_changed=key[4]
+        )
+        for key in sorted(deltas)
+    ])
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[trend_table.c[column] for column in TREND_KEY],
+        set_={column: trend_table.c[column] + statement.excluded[column] for column in TREND_COLUMNS}
+    ))
+
+def trend_keys(changed_at, skill_id, department_id, field):
+    """Ключи агрегатов (неделя и месяц), в которые попадает запись истории"""
+    return [
+        (bucket, bucket_start(changed_at, bucket), skill_id, department_key(department_id), field)
+        for bucket in TREND_BUCKETS
+    ]
+
+@event.listens_for(AssessmentHistory, 'before_insert')
+def history_department(mapper, connection, target):
+    #отдел сотрудника на момент изменения, если его не передали явно
+    if target.department_id is None:
+        target.department_id = connection.execute(
+            select(User.department_id)
+            .join(SkillAssessment, SkillAssessment.user_id == User.id)
+            .where(SkillAssessment.id == target.assessment_id)
+        ).scalar()
+
+@event.listens_for(AssessmentHistory, 'after_insert')
+def trend_history_insert(mapper, connection, target):
+    #в режиме триггеров агрегаты обновляет триггер на assessment_history
+    if history_trigger_enabled():
+        return
+    skill_id = connection.execute(
+        select(SkillAssessment.skill_id).where(SkillAssessment.id == target.assessment_id)
+    ).scalar()
+    if skill_id is None:
+        return
+
+    apply_trend_delta(
+        connection,
+        trend_keys(target.changed_at or datetime.utcnow(), skill_id, target.department_id, target.field_changed),
+        history_vector(target.old_value, target.new_value)
+    )
+
+def rebuild_trends(batch_size=1000):
+    """
+    Полный пересчет агрегатов динамики из assessment_history. Отдел берется
+    из записи истории (на момент изменения), как и при инкрементальном обновлении.
+    """
+    rows = {}
+    query = db.session.query(
+        AssessmentHistory.changed_at,
+        AssessmentHistory.field_changed,
+        AssessmentHistory.old_value,
+        AssessmentHistory.new_value,
+        SkillAssessment.skill_id,
+        AssessmentHistory.department_id
+    ).join(
+        SkillAssessment, SkillAssessment.id == AssessmentHistory.assessment_id
+    ).filter(
+        AssessmentHistory.changed_at.isnot(None)
+    ).execution_options(yield_per=batch_size)
+
+    for changed_at, field, old_value, new_value, skill_id, department_id in query:
+        vector = history_vector(old_value, new_value)
+        for key in trend_keys(changed_at, skill_id, department_id, field):
+            row = rows.setdefault(key, {column: 0 for column in TREND_COLUMNS})
+            for column, value in vector.items():
+                row[column] += value
+
+    ScoreTrendBucket.query.delete()
+    db.session.add_all([
+        ScoreTrendBucket(
+            bucket=bucket, bucket_start=start, skill_id=skill_id,
+            department_key=dep_key, field_changed=field, **values
+        )
+        for (bucket, start, skill_id, dep_key, field), values in rows.items()
+    ])
+    db.session.commit()
+    return len(rows)
+
+def ensure_history_department():
+    """
+    Добавляет колонку assessment_history.department_id в таблицу, созданную
+    до ее появления. Старым записям проставляется текущий отдел сотрудника
+    (отдел на момент изменения для них неизвестен).
+    """
+    history_table = AssessmentHistory.__table__
+    connection = db.session.connection()
+    if add_missing_columns(connection, history_table, [history_table.c.department_id]):
+        connection.execute(
+            update(history_table)
+            .where(history_table.c.department_id.is_(None))
+            .values(department_id=select(User.department_id)
+                    .join(SkillAssessment, SkillAssessment.user_id == User.id)
+                    .where(SkillAssessment.id == history_table.c.assessment_id)
+                    .scalar_subquery())
+        )
+    db.session.commit()
+
+def get_trends(bucket='month', skill_id=None, department_id=None, since=None):
+    """
+    Ряд по интервалам: средняя новая оценка и среднее изменение
+    для самооценки и оценки руководителя.
+    """
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f'Неизвестный интервал: {bucket}')
+
+    query = db.session.query(
+        ScoreTrendBucket.bucket_start,
+        ScoreTrendBucket.field_changed,
+        *(func.sum(getattr(ScoreTrendBucket, column)).label(column) for column in TREND_COLUMNS)
+    ).filter(
+        ScoreTrendBucket.bucket == bucket,
+        ScoreTrendBucket.field_changed.in_(TREND_FIELDS)
+    )
+
+    if skill_id is not None:
+        query = query.filter(ScoreTrendBucket.skill_id == skill_id)
+    if department_id is not None:
+        query = query.filter(ScoreTrendBucket.department_key == department_key(department_id))
+    if since is not None:
+        query = query.filter(ScoreTrendBucket.bucket_start >= bucket_start(since, bucket))
+
+    rows = query.group_by(
+        ScoreTrendBucket.bucket_start, ScoreTrendBucket.field_changed
+    ).order_by(ScoreTrendBucket.bucket_start).all()
+
+    series = {}
+    for row in rows:
+        point = series.setdefault(row.bucket_start, {
+            'period': row.bucket_start.isoformat(),
+            'changes': 0
+        })
+        prefix = 'self' if row.field_changed == 'self_score' else 'manager'
+        point['changes'] += int(row.change_count)
+        point[f'{prefix}_avg'] = round(row.value_sum / row.value_count, 2) if row.value_count else None
+        point[f'{prefix}_delta'] = round(row.delta_sum / row.delta_count, 2) if row.delta_count else None
+
+    for point in series.values():
+        for prefix in ('self', 'manager'):
+            point.setdefault(f'{prefix}_avg', None)
+            point.setdefault(f'{prefix}_delta', None)
+
+    return list(series.values())
@@ -0,0 +1,139 @@
+"""
+Версии данных и условные HTTP ответы (ETag / Last-Modified).
+
+Для каждой таблицы в data_versions хранится счетчик, который увеличивается
+один раз за транзакцию, изменившую эту таблицу (перед commit, одной командой
+INSERT ... ON CONFLICT DO UPDATE). Счетчик живет в БД, поэтому
+все воркеры видят одну и ту же версию. Декоратор conditional_response
+по версиям нужных таблиц отвечает 304 без обращения к таблицам с оценками.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, make_response
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from ..models import DataVersion
+from .changes import subscribe_flush
+
+versions_table = DataVersion.__table__
+
+#служебные таблицы, изменения которых не влияют на ответы API
+IGNORED_TABLES = frozenset({'data_versions', 'analytics_rollups', 'score_trend_buckets'})
+
+@subscribe_flush
+def collect_versions(session, tables):
+    """Запоминает измененные таблицы; версии увеличиваются перед commit"""
+    pending = set(tables) - IGNORED_TABLES
+    if pending:
+        session.info.setdefault('pending_versions', set()).update(pending)
+
+def _upsert_statement(dialect_name, entity, now):
+    """INSERT ... ON CONFLICT (entity) DO UPDATE version = version + 1 для диалекта соединения"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f'Версии данных не поддерживаются для {dialect_name}')
+
+    statement = dialect_insert(versions_table).values(entity=entity, version=1, updated_at=now)
+    return statement.on_conflict_do_update(
+        index_elements=[versions_table.c.entity],
+        set_={'version': versions_table.c.version + 1, 'updated_at': statement.excluded.updated_at}
+    )
+
+@event.listens_for(Session, 'before_commit')
+def bump_versions(session):
+    """
+    Увеличивает версии измененных таблиц один раз за транзакцию. Строки
+    data_versions блокируются только на время commit, а не всего запроса,
+    и версия фиксируется вместе с данными.
+    """
+    #commit сбрасывает оставшиеся изменения после before_commit, поэтому сбрасываем их сами
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.pop('pending_versions', None)
+    if not pending:
+        return
+
+    connection = session.connection()
+    now = datetime.utcnow()
+    for entity in sorted(pending):
+        connection.execute(_upsert_statement(connection.dialect.name, entity, now))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_versions(session):
+    session.info.pop('pending_versions', None)
+
+def get_versions(*entities, session=None):
+    """Текущие версии таблиц одним запросом: {таблица: (версия, время изменения)}"""
+    from .. import db
+    session = session or db.session
+    rows = session.execute(
+        select(versions_table.c.entity, versions_table.c.version, versions_table.c.updated_at)
+        .where(versions_table.c.entity.in_(entities))
+    ).all()
+    versions = {entity: (0, None) for entity in entities}
+    for row in rows:
+        versions[row.entity] = (row.version, row.updated_at)
+    return versions
+
+def data_version(*entities):
+    """Строковая версия набора таблиц, например для ключей кэша или поля version в JSON"""
+    versions = get_versions(*entities)
+    return '.'.join(str(versions[entity][0]) for entity in entities)
+
+def conditional_response(*entities):
+    """
+    Декоратор для GET endpoint'ов: добавляет ETag и Last-Modified и отвечает
+    304 Not Modified, если клиент прислал актуальные If-None-Match / If-Modified-Since.
+
+    ETag учитывает версии указанных таблиц, URL с параметрами и текущего
+    пользователя (ответы зависят от роли и отдела).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_versions(*entities)
+
+            user_scope = ''
+            if current_user.is_authenticated:
+                user_scope = f'{current_user.id}:{current_user.role}:{current_user.department_id}'
+            raw = '|'.join([
+                view.__name__,
+                request.full_path,
+                user_scope,
+                ','.join(f'{entity}={versions[entity][0]}' for entity in entities)
+            ])
+            etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+            timestamps = [updated_at for _, updated_at in versions.values() if updated_at]
+            last_modified = None
+            if timestamps:
+                last_modified = max(timestamps).replace(tzinfo=timezone.utc, microsecond=0)
+
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif request.if_modified_since and last_modified:
+                not_modified = last_modified <= request.if_modified_since
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -7,11 +7,17 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 #импортируем все тестовые модули для удобного импорта
 from tests.test_auth import AuthTestCase
 from tests.test_skills import SkillsTestCase
+from tests.test_analytics import AnalyticsTestCase
+from tests.test_score_matrix import ScoreMatrixTestCase
+from tests.test_search import SearchTestCase
 # надо добавить потом другие тестовые классы по мере их создания
 
 __all__ = [
     'AuthTestCase',
     'SkillsTestCase',
+    'AnalyticsTestCase',
+    'ScoreMatrixTestCase',
+    'SearchTestCase',
     #надо еще имена
 ]
 
@@ -0,0 +1,787 @@
+import json
+import os
+import time
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.models import User, Department, Skill, SkillAssessment, AnalyticsRollup, AssessmentHistory, ScoreTrendBucket
+from app.utils.rollups import rebuild_rollups, ensure_rollups, get_hr_summary, get_global_rollup
+from app.utils.schema import add_missing_columns
+from app.utils.cache import analytics_cache
+from app.utils.live_stats import snapshot_delta
+from app.utils.trends import (
+    rebuild_trends, bucket_start, trend_keys, history_vector, apply_trend_delta, apply_trend_deltas
+)
+from app.utils.dashboard_stats import dashboard_stats
+from app.utils.history import history_capture
+from app.utils.assessments import upsert_assessments
+from app.utils.journal import history_journal
+from app.utils.invalidation import InvalidationBus, NotifierBusTransport, SocketBusTransport, invalidation_bus
+from app.utils.skill_catalog import skill_catalog
+from werkzeug.security import generate_password_hash
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+            #тестовые данные
+            backend = Department(name='Backend')
+            frontend = Department(name='Frontend')
+            db.session.add_all([backend, frontend])
+            db.session.commit()
+
+            hr = User(
+                login='hr1',
+                password_hash=generate_password_hash('password123'),
+                role='hr',
+                full_name='HR One',
+                department_id=frontend.id
+            )
+            employee = User(
+                login='employee1',
+                password_hash=generate_password_hash('password123'),
+                role='employee',
+                full_name='Employee One',
+                department_id=backend.id
+            )
+            db.session.add_all([hr, employee])
+
+            python = Skill(name='Python', category='Programming Languages')
+            sql = Skill(name='SQL', category='Databases')
+            db.session.add_all([python, sql])
+            db.session.commit()
+
+            db.session.add_all([
+                SkillAssessment(user_id=employee.id, skill_id=python.id, self_score=4, manager_score=5),
+                SkillAssessment(user_id=employee.id, skill_id=sql.id, self_score=3),
+                SkillAssessment(user_id=hr.id, skill_id=sql.id, self_score=2),
+            ])
+            db.session.commit()
+
+            self.hr_id = hr.id
+            self.employee_id = employee.id
+            self.backend_id = backend.id
+            self.frontend_id = frontend.id
+            self.python_id = python.id
+            self.sql_id = sql.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self, login):
+        return self.client.post('/login', json={'login': login, 'password': 'password123'})
+
+    def rollup_rows(self):
+        #строки глобального среза складываются в одну
+        rows = [r for r in AnalyticsRollup.query.all() if r.scope != 'global']
+        return rows + [get_global_rollup()]
+
+    def rollup_snapshot(self):
+        return sorted(
+            (r.scope, r.scope_key, r.user_count, r.assessment_count, r.self_sum,
+             r.self_count, r.manager_sum, r.manager_count, r.final_sum, r.final_count)
+            for r in self.rollup_rows()
+            if r.user_count or r.assessment_count
+        )
+
+    def pending_counts(self):
+        return {(r.scope, r.scope_key): r.pending_count for r in self.rollup_rows()}
+
+    def test_rollups_follow_writes(self):
+        with self.app.app_context():
+            stats, roles, departments = get_hr_summary()
+            self.assertEqual(stats['total_users'], 2)
+            self.assertEqual(stats['assessed_skills'], 3)
+
+            backend = next(d for d in departments if d['department'] == 'Backend')
+            self.assertEqual(backend['count'], 1)
+            self.assertEqual(backend['avg_score'], 5.0)
+
+            #обновление, перевод в другой отдел и удаление оценки
+            assessment = SkillAssessment.query.filter_by(user_id=self.hr_id).first()
+            assessment.self_score = 5
+            employee = db.session.get(User, self.employee_id)
+            employee.department_id = self.frontend_id
+            db.session.commit()
+
+            db.session.delete(SkillAssessment.query.filter_by(skill_id=self.python_id).first())
+            db.session.commit()
+
+            incremental = self.rollup_snapshot()
+            rebuild_rollups()
+            self.assertEqual(incremental, self.rollup_snapshot())
+
+    def test_ensure_rollups_adds_missing_columns(self):
+        with self.app.app_context():
+            expected = self.pending_counts()
+            db.session.execute(db.text('ALTER TABLE analytics_rollups DROP COLUMN pending_count'))
+            db.session.commit()
+
+            ensure_rollups()
+            self.assertEqual(self.pending_counts(), expected)
+            #повторный запуск (например, другим воркером) ничего не меняет
+            self.assertEqual(add_missing_columns(db.session.connection(), AnalyticsRollup.__table__), [])
+            ensure_rollups()
+            self.assertEqual(self.pending_counts(), expected)
+
+    def test_user_delete_updates_rollups(self):
+        with self.app.app_context():
+            db.session.delete(db.session.get(User, self.employee_id))
+            db.session.commit()
+
+            stats, roles, departments = get_hr_summary()
+            self.assertEqual(stats['total_users'], 1)
+            self.assertEqual(stats['assessed_skills'], 1)
+            self.assertEqual([r['role'] for r in roles], ['hr'])
+
+    def test_hr_stats_api(self):
+        self.login('hr1')
+        response = self.client.get('/hr/api/hr/stats')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['stats']['total_users'], 2)
+        self.assertEqual(len(data['departments']), 2)
+
+    def test_analytics_cache_invalidated_by_writes(self):
+        self.login('hr1')
+        self.client.get('/hr/api/hr/stats')
+        self.client.get('/hr/api/hr/stats')
+        self.assertGreaterEqual(analytics_cache.stats()['hits'], 1)
+
+        with self.app.app_context():
+            db.session.add(SkillAssessment(user_id=self.hr_id, skill_id=self.python_id, self_score=5))
+            db.session.commit()
+
+        #в тестах пересчет синхронный, поэтому сразу видим новое значение
+        data = self.client.get('/hr/api/hr/stats').get_json()
+        self.assertEqual(data['stats']['assessed_skills'], 4)
+        self.assertGreaterEqual(analytics_cache.stats()['refreshes'], 1)
+
+    def test_analytics_cache_discards_value_invalidated_during_compute(self):
+        with self.app.app_context():
+            def compute():
+                #запись данных во время пересчета
+                analytics_cache.invalidate(report='report')
+                return 'old'
+
+            self.assertEqual(analytics_cache.get_or_compute('report', 'all', compute), 'old')
+            self.assertEqual(analytics_cache.get_or_compute('report', 'all', lambda: 'new'), 'new')
+            self.assertEqual(analytics_cache.get_or_compute('report', 'all', lambda: 'newer'), 'new')
+            self.assertEqual(analytics_cache.stats()['discarded'], 1)
+
+    def test_hr_stats_conditional_requests(self):
+        self.login('hr1')
+        response = self.client.get('/hr/api/hr/stats')
+        etag = response.headers['ETag']
+        self.assertIsNotNone(response.headers.get('Last-Modified'))
+
+        response = self.client.get('/hr/api/hr/stats', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        #запись оценки меняет версию данных и ETag
+        with self.app.app_context():
+            assessment = SkillAssessment.query.filter_by(user_id=self.hr_id).first()
+            assessment.self_score = 4
+            db.session.commit()
+
+        response = self.client.get('/hr/api/hr/stats', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_hr_stats_stream_starts_with_snapshot(self):
+        self.login('hr1')
+        response = self.client.get('/hr/api/hr/stats/stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        events = iter(response.response)
+        first_event = next(events).decode('utf-8')
+        self.assertTrue(first_event.startswith('event: snapshot'))
+        self.assertIn('"total_users": 2', first_event)
+
+        #изменение оценки приходит в поток как дельта
+        with self.app.app_context():
+            db.session.add(SkillAssessment(user_id=self.hr_id, skill_id=self.python_id, self_score=5))
+            db.session.commit()
+
+        delta_event = next(events).decode('utf-8')
+        self.assertTrue(delta_event.startswith('event: delta'))
+        self.assertIn('"assessed_skills": 4', delta_event)
+
+        #отделы ключуются по id: одинаковые названия не склеиваются
+        with self.app.app_context():
+            db.session.add(Department(name='Backend'))
+            db.session.commit()
+        delta = json.loads(next(events).decode('utf-8').split('data: ', 1)[1])
+        self.assertEqual(list(delta['departments'].values()), [{'name': 'Backend', 'count': 0, 'avg_score': 0}])
+        self.assertNotIn(str(self.backend_id), delta['departments'])
+        response.close()
+
+    def test_snapshot_delta(self):
+        old = {'stats': {'total_users': 2, 'avg_score': 3.5}, 'roles': {'hr': 1, 'employee': 1}}
+        new = {'stats': {'total_users': 3, 'avg_score': 3.5}, 'roles': {'employee': 2}}
+        self.assertEqual(snapshot_delta(old, new), {
+            'stats': {'total_users': 3},
+            'roles': {'employee': 2, 'hr': None}
+        })
+        self.assertEqual(snapshot_delta(new, new), {})
+
+    def test_heatmap(self):
+        with self.app.app_context():
+            #отдел с id 10: строки упорядочены по названию, а не по строке id (1, 10, 2)
+            departments = [Department(name=f'Department {i}') for i in range(3, 11)]
+            db.session.add_all(departments)
+            db.session.commit()
+            departments[-1].name = 'Analytics'
+            db.session.add(User(
+                login='analyst1', password_hash=generate_password_hash('password123'),
+                role='employee', full_name='Analyst One', department_id=departments[-1].id
+            ))
+            db.session.commit()
+            self.assertEqual(departments[-1].id, 10)
+
+        self.login('hr1')
+        response = self.client.get('/hr/api/heatmap?dimension=department&by=category')
+        self.assertEqual(response.status_code, 200)
+
+        heatmap = response.get_json()['heatmap']
+        self.assertEqual(heatmap['rows'], ['Analytics', 'Backend', 'Frontend'])
+        self.assertEqual(heatmap['columns'], ['Databases', 'Programming Languages'])
+        self.assertEqual(heatmap['avg_score'][0], [None, None])
+        #Backend: Python (итог 5) и SQL (итог 3)
+        self.assertEqual(heatmap['avg_score'][1], [3.0, 5.0])
+        self.assertEqual(heatmap['share_high'][1], [0.0, 1.0])
+        self.assertEqual(heatmap['avg_score'][2], [2.0, None])
+
+        response = self.client.get('/hr/api/heatmap?dimension=unknown')
+        self.assertEqual(response.status_code, 400)
+
+    def test_distribution(self):
+        self.login('hr1')
+        response = self.client.get(f'/hr/api/distribution?skill_id={self.sql_id}')
+        self.assertEqual(response.status_code, 200)
+
+        distribution = response.get_json()['distribution']
+        #SQL: самооценки 3 и 2, оценок руководителя нет
+        self.assertEqual(distribution['self']['histogram'], {'1': 0, '2': 1, '3': 1, '4': 0, '5': 0})
+        self.assertEqual(distribution['self']['median'], 2.5)
+        self.assertEqual(distribution['self']['stddev'], 0.5)
+        self.assertEqual(distribution['manager']['count'], 0)
+        self.assertIsNone(distribution['manager']['median'])
+        self.assertEqual(distribution['final']['count'], 2)
+
+        response = self.client.get(f'/hr/api/distribution?department_id={self.backend_id}')
+        distribution = response.get_json()['distribution']
+        self.assertEqual(distribution['final']['histogram']['5'], 1)
+        self.assertEqual(distribution['final']['p90'], 4.8)
+
+    def test_trends_follow_history(self):
+        with self.app.app_context():
+            assessment = SkillAssessment.query.filter_by(user_id=self.employee_id, skill_id=self.sql_id).first()
+            assessment.self_score = 4
+            db.session.commit()
+            assessment.manager_score = 3
+            db.session.commit()
+
+            def bucket_rows():
+                return sorted(
+                    (b.bucket, b.bucket_start, b.skill_id, b.department_key, b.field_changed,
+                     b.change_count, b.value_sum, b.value_count, b.delta_sum, b.delta_count)
+                    for b in ScoreTrendBucket.query.all()
+                )
+
+            incremental = bucket_rows()
+            self.assertEqual(AssessmentHistory.query.count(), 2)
+            self.assertEqual(len(incremental), 4)
+
+            #backfill по истории дает те же агрегаты, в том числе после перевода в другой отдел
+            self.assertEqual({h.department_id for h in AssessmentHistory.query.all()}, {self.backend_id})
+            db.session.get(User, self.employee_id).department_id = self.frontend_id
+            db.session.commit()
+            rebuild_trends()
+            self.assertEqual(bucket_rows(), incremental)
+
+        self.login('hr1')
+        response = self.client.get(f'/hr/api/trends?bucket=week&skill_id={self.sql_id}')
+        self.assertEqual(response.status_code, 200)
+        series = response.get_json()['series']
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]['period'], bucket_start(datetime.utcnow(), 'week').isoformat())
+        self.assertEqual(series[0]['changes'], 2)
+        self.assertEqual(series[0]['self_avg'], 4)
+        self.assertEqual(series[0]['self_delta'], 1)
+        self.assertEqual(series[0]['manager_avg'], 3)
+        self.assertIsNone(series[0]['manager_delta'])
+
+        response = self.client.get(f'/hr/api/trends?department_id={self.frontend_id}')
+        self.assertEqual(response.get_json()['series'], [])
+        self.assertEqual(self.client.get('/hr/api/trends?bucket=day').status_code, 400)
+
+    def test_trend_deltas_create_bucket(self):
+        with self.app.app_context():
+            #два вклада в интервал, которого еще нет: второй прибавляется, а не падает на unique_trend_bucket
+            keys = trend_keys(datetime(2020, 1, 15), self.sql_id, self.backend_id, 'self_score')
+            connection = db.session.connection()
+            apply_trend_delta(connection, keys, history_vector(None, 3))
+            apply_trend_deltas(connection, {key: history_vector(3, 5) for key in keys})
+            db.session.commit()
+
+            buckets = ScoreTrendBucket.query.filter(ScoreTrendBucket.bucket_start < datetime(2021, 1, 1).date()).all()
+            self.assertEqual(len(buckets), 2)
+            for bucket in buckets:
+                self.assertEqual(bucket.change_count, 2)
+                self.assertEqual(bucket.value_sum, 8)
+                self.assertEqual(bucket.value_count, 2)
+                self.assertEqual(bucket.delta_sum, 2)
+                self.assertEqual(bucket.delta_count, 1)
+
+    def test_cohort_comparison(self):
+        self.login('hr1')
+        response = self.client.get(f'/hr/api/compare?user_ids={self.employee_id},{self.hr_id}')
+        self.assertEqual(response.status_code, 200)
+        comparison = response.get_json()['comparison']
+
+        self.assertEqual(comparison['users']['ids'], [self.employee_id, self.hr_id])
+        self.assertEqual(comparison['skills']['names'], ['SQL', 'Python'])
+        self.assertEqual(comparison['scores'], [[3, 2], [5, None]])
+        self.assertEqual(comparison['stats']['min'], [2, 5])
+        self.assertEqual(comparison['stats']['mean'], [2.5, 5])
+        self.assertEqual(comparison['stats']['rated'], [2, 1])
+        self.assertEqual(comparison['pairwise']['mean_abs_diff'], [[0, 1], [1, 0]])
+        self.assertEqual(comparison['pairwise']['common_skills'], [[2, 1], [1, 1]])
+
+        response = self.client.get(f'/hr/api/compare?department_id={self.backend_id}')
+        self.assertEqual(response.get_json()['comparison']['users']['ids'], [self.employee_id])
+
+        #старый формат для двух сотрудников
+        data = self.client.get(f'/hr/compare-users?user1={self.employee_id}&user2={self.hr_id}').get_json()
+        self.assertEqual(data['comparison'][0], {
+            'skill_name': 'SQL', 'category': 'Databases',
+            'user1_score': 3, 'user2_score': 2, 'difference': -1
+        })
+
+        too_many = ','.join(str(i) for i in range(1, 60))
+        self.assertEqual(self.client.get(f'/hr/api/compare?user_ids={too_many}').status_code, 400)
+        self.assertEqual(self.client.get(f'/hr/api/compare?user_ids={self.hr_id},9999').status_code, 404)
+
+    def test_cohort_comparison_manager_scope(self):
+        with self.app.app_context():
+            db.session.add(User(
+                login='manager1', password_hash=generate_password_hash('password123'),
+                role='manager', full_name='Manager One', department_id=self.backend_id
+            ))
+            db.session.commit()
+        self.login('manager1')
+
+        response = self.client.get(f'/hr/api/compare?user_ids={self.employee_id},{self.hr_id}')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/hr/api/compare?department_id={self.frontend_id}')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/hr/compare-users?user1={self.employee_id}&user2={self.hr_id}')
+        self.assertEqual(response.status_code, 403)
+
+    def test_team_coverage(self):
+        with self.app.app_context():
+            manager = User(login='manager1', password_hash=generate_password_hash('password123'),
+                           role='manager', full_name='Manager One', department_id=self.backend_id)
+            db.session.add(manager)
+            db.session.commit()
+            db.session.add(SkillAssessment(user_id=manager.id, skill_id=self.sql_id, self_score=4))
+            db.session.commit()
+
+        self.login('hr1')
+        departments = self.client.get('/hr/api/team-coverage').get_json()['departments']
+        self.assertEqual([d['department'] for d in departments], ['Backend', 'Frontend'])
+        backend = departments[0]
+        self.assertEqual(backend['team_size'], 2)
+        self.assertEqual(backend['skills']['names'], ['SQL', 'Python'])
+        self.assertEqual(backend['skills']['rated'], [2, 1])
+        self.assertEqual(backend['skills']['level_3'], [2, 1])
+        self.assertEqual(backend['skills']['level_4'], [1, 1])
+        self.assertEqual(backend['bus_factor_1'], [
+            {'skill_id': self.python_id, 'skill': 'Python', 'user_id': self.employee_id, 'full_name': 'Employee One'}
+        ])
+        self.assertEqual(departments[1]['skills']['level_3'], [0])
+        self.assertEqual(departments[1]['bus_factor_1'], [])
+
+        self.client.get('/logout')
+        self.login('manager1')
+        coverage = self.client.get('/user/api/my-team/coverage').get_json()['coverage']
+        self.assertEqual(coverage['department_id'], self.backend_id)
+        self.assertEqual(len(coverage['bus_factor_1']), 1)
+
+        #кэш пересчитывается после изменения оценки в команде
+        with self.app.app_context():
+            db.session.add(SkillAssessment(user_id=User.query.filter_by(login='manager1').first().id,
+                                           skill_id=self.python_id, self_score=3))
+            db.session.commit()
+        coverage = self.client.get('/user/api/my-team/coverage').get_json()['coverage']
+        self.assertEqual(coverage['bus_factor_1'], [])
+        self.assertEqual(self.client.get('/hr/api/team-coverage').status_code, 403)
+
+    def test_dashboard_stats_cache(self):
+        with self.app.app_context():
+            manager = User(login='manager1', password_hash=generate_password_hash('password123'),
+                           role='manager', full_name='Manager One', department_id=self.backend_id)
+            db.session.add(manager)
+            db.session.commit()
+            manager_id = manager.id
+
+        self.login('manager1')
+        stats = self.client.get('/user/api/dashboard/stats').get_json()['data']
+        self.assertEqual(stats, {'team_count': 1, 'pending_reviews': 1})
+
+        #повторный запрос и страница берут значение из кэша
+        hits = dashboard_stats.stats()['hits']
+        self.client.get('/user/api/dashboard/stats')
+        page = self.client.get('/user/dashboard').get_data(as_text=True)
+        self.assertIn('id="dashboardStatsData"', page)
+        self.assertEqual(dashboard_stats.stats()['hits'], hits + 2)
+
+        with self.app.app_context():
+            #самооценка руководителя не считается ожидающей проверки
+            db.session.add(SkillAssessment(user_id=manager_id, skill_id=self.python_id, self_score=3))
+            db.session.commit()
+            self.assertEqual(self.client.get('/user/api/dashboard/stats').get_json()['data']['pending_reviews'], 1)
+
+            assessment = SkillAssessment.query.filter_by(user_id=self.employee_id, skill_id=self.sql_id).first()
+            assessment.manager_score = 4
+            db.session.commit()
+        self.assertEqual(self.client.get('/user/api/dashboard/stats').get_json()['data']['pending_reviews'], 0)
+
+        self.client.get('/logout')
+        self.login('employee1')
+        stats = self.client.get('/user/api/dashboard/stats').get_json()['data']
+        self.assertEqual(stats, {'assessed_skills': 2, 'total_skills': 2, 'avg_score': 3.5})
+
+        #счетчик ожидающих проверки совпадает с полным пересчетом
+        with self.app.app_context():
+            before = self.pending_counts()
+            rebuild_rollups()
+            after = self.pending_counts()
+            self.assertEqual(before, after)
+
+    def test_assessment_batch(self):
+        with self.app.app_context():
+            docker = Skill(name='Docker', category='DevOps')
+            db.session.add(docker)
+            db.session.commit()
+            docker_id = docker.id
+            history_before = AssessmentHistory.query.count()
+
+        self.login('employee1')
+        self.client.get('/user/api/dashboard/stats')
+
+        #ошибка в одном элементе - пакет не записывается
+        response = self.client.post('/user/api/assessments/batch', json={'assessments': [
+            {'skill_id': self.python_id, 'score': 5},
+            {'skill_id': docker_id, 'score': 7},
+            {'skill_id': 9999, 'score': 3},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.get_json()['errors']], [1, 2])
+        self.assertEqual(self.client.post('/user/api/assessments/batch', json={'assessments': []}).status_code, 400)
+
+        response = self.client.post('/user/api/assessments/batch', json={'assessments': [
+            {'skill_id': self.python_id, 'score': 5},
+            {'skill_id': self.sql_id, 'score': 3},
+            {'skill_id': docker_id, 'score': 2},
+        ]})
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['saved'], data['unchanged']), (2, 1))
+
+        #кэш дашборда сброшен после commit
+        stats = self.client.get('/user/api/dashboard/stats').get_json()['data']
+        self.assertEqual(stats, {'assessed_skills': 3, 'total_skills': 3, 'avg_score': 3.3})
+
+        #руководителю нужен доступ к отделу сотрудника
+        self.assertEqual(self.client.post(
+            f'/user/api/employee/{self.employee_id}/assessments/batch',
+            json={'assessments': [{'skill_id': docker_id, 'score': 3}]}
+        ).status_code, 403)
+        self.client.get('/logout')
+        self.login('hr1')
+        response = self.client.post(f'/user/api/employee/{self.employee_id}/assessments/batch', json={
+            'assessments': [{'skill_id': docker_id, 'score': 3}, {'skill_id': self.sql_id, 'score': 4}]
+        })
+        self.assertEqual(response.get_json()['saved'], 2)
+
+        with self.app.app_context():
+            scores = {
+                a.skill_id: (a.self_score, a.manager_score)
+                for a in SkillAssessment.query.filter_by(user_id=self.employee_id)
+            }
+            self.assertEqual(scores, {self.python_id: (5, 5), self.sql_id: (3, 4), docker_id: (2, 3)})
+
+            history = AssessmentHistory.query.order_by(AssessmentHistory.id).all()[history_before:]
+            self.assertEqual(
+                [(h.field_changed, h.old_value, h.new_value, h.changed_by) for h in history],
+                [('self_score', 4, 5, self.employee_id), ('self_score', None, 2, self.employee_id),
+                 ('manager_score', None, 4, self.hr_id), ('manager_score', None, 3, self.hr_id)]
+            )
+
+            #агрегаты и динамика совпадают с полным пересчетом
+            incremental = self.rollup_snapshot()
+            pending = self.pending_counts()
+            rebuild_rollups()
+            self.assertEqual(incremental, self.rollup_snapshot())
+            self.assertEqual(pending, self.pending_counts())
+
+            def bucket_rows():
+                return sorted(
+                    (b.bucket, b.bucket_start, b.skill_id, b.department_key, b.field_changed,
+                     b.change_count, b.value_sum, b.value_count, b.delta_sum, b.delta_count)
+                    for b in ScoreTrendBucket.query.all()
+                )
+            incremental = bucket_rows()
+            rebuild_trends()
+            self.assertEqual(bucket_rows(), incremental)
+
+    def test_history_capture_mode(self):
+        with self.app.app_context():
+            #режим определяется по триггерам в БД: на SQLite их нет, остается слушатель ORM
+            self.app.config['HISTORY_CAPTURE'] = 'trigger'
+            self.assertEqual(history_capture.detect(), 'orm')
+            self.assertFalse(history_capture.trigger_enabled)
+            with self.assertRaises(ValueError):
+                history_capture.switch('trigger')
+            db.session.rollback()
+
+            assessment = SkillAssessment.query.filter_by(user_id=self.employee_id, skill_id=self.sql_id).first()
+            assessment.self_score = 4
+            db.session.commit()
+            self.assertEqual(AssessmentHistory.query.count(), 1)
+            self.assertEqual(ScoreTrendBucket.query.count(), 2)
+
+            #в режиме триггеров слушатели истории и динамики ничего не пишут,
+            #а записи, которые код пишет сам, сохраняются как в режиме orm
+            history_capture.mode = 'trigger'
+            try:
+                assessment.self_score = 5
+                db.session.commit()
+                self.assertEqual(AssessmentHistory.query.count(), 1)
+
+                upsert_assessments(db.session, self.employee_id, 'manager_score', {self.sql_id: 5},
+                                   changed_by=self.hr_id, notes='batch')
+                db.session.commit()
+            finally:
+                history_capture.mode = 'orm'
+            history = AssessmentHistory.query.order_by(AssessmentHistory.id.desc()).first()
+            self.assertEqual((history.field_changed, history.new_value, history.changed_by, history.notes),
+                             ('manager_score', 5, self.hr_id, 'batch'))
+            self.assertEqual(AssessmentHistory.query.count(), 2)
+            self.assertEqual(ScoreTrendBucket.query.count(), 2)
+
+    def test_history_journal_async(self):
+        def restore():
+            self.app.config['HISTORY_JOURNAL'] = 'sync'
+            history_journal.init_app(self.app)
+        self.app.config['HISTORY_JOURNAL'] = 'async'
+        self.app.config['HISTORY_JOURNAL_MAXSIZE'] = 3
+        history_journal.init_app(self.app)
+        self.addCleanup(restore)
+
+        with self.app.app_context():
+            assessments = SkillAssessment.query.order_by(SkillAssessment.id).all()
+            for assessment in assessments[:2]:
+                assessment.self_score = 5
+            db.session.commit()
+
+            #после commit записи ждут в очереди, транзакция оценки их не пишет
+            self.assertEqual(AssessmentHistory.query.count(), 0)
+            self.assertEqual(history_journal.pending(), 2)
+
+            #откат транзакции отбрасывает ее записи
+            assessments[2].self_score = 1
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(history_journal.pending(), 2)
+
+            #очередь заполнена: вызывающий поток дописывает накопленное вместе со своими записями
+            assessments = SkillAssessment.query.order_by(SkillAssessment.id).all()
+            for assessment in assessments:
+                assessment.manager_score = 2
+            db.session.commit()
+            self.assertEqual(history_journal.stats()['backpressure'], 1)
+            self.assertEqual(AssessmentHistory.query.count(), 5)
+            self.assertEqual(history_journal.pending(), 0)
+
+            #при остановке очередь дописывается до конца
+            assessments[0].self_score = 3
+            db.session.commit()
+            self.assertEqual(history_journal.pending(), 1)
+            history_journal.shutdown()
+            self.assertEqual(history_journal.pending(), 0)
+            self.assertEqual(AssessmentHistory.query.count(), 6)
+
+            def bucket_rows():
+                return sorted(
+                    (b.bucket, b.bucket_start, b.skill_id, b.department_key, b.field_changed,
+                     b.change_count, b.value_sum, b.value_count, b.delta_sum, b.delta_count)
+                    for b in ScoreTrendBucket.query.all()
+                )
+            incremental = bucket_rows()
+            rebuild_trends()
+            self.assertEqual(bucket_rows(), incremental)
+
+    def test_history_journal_failed_batches(self):
+        import tempfile
+        from unittest import mock
+
+        def restore():
+            self.app.config['HISTORY_JOURNAL'] = 'sync'
+            history_journal.init_app(self.app)
+        directory = tempfile.mkdtemp()
+        self.app.config['HISTORY_JOURNAL'] = 'async'
+        self.app.config['HISTORY_JOURNAL_INTERVAL'] = 0
+        self.app.config['HISTORY_JOURNAL_FAILED_PATH'] = os.path.join(directory, 'failed.jsonl')
+        history_journal.init_app(self.app)
+        self.addCleanup(restore)
+
+        with self.app.app_context():
+            assessment = SkillAssessment.query.order_by(SkillAssessment.id).first()
+            assessment.self_score = 1
+            db.session.commit()
+
+            #пачка, которую не удалось записать, сохраняется в файл, а не теряется
+            with mock.patch('app.utils.journal.write_history', side_effect=RuntimeError('db is down')):
+                history_journal.flush()
+            self.assertEqual(history_journal.stats()['failed'], 1)
+            self.assertEqual(AssessmentHistory.query.count(), 0)
+            with open(self.app.config['HISTORY_JOURNAL_FAILED_PATH'], encoding='utf-8') as file:
+                self.assertEqual(json.loads(file.read())['new_value'], 1)
+
+            self.assertEqual(history_journal.replay_failed(), 1)
+            self.assertEqual(
+                [(h.field_changed, h.new_value) for h in AssessmentHistory.query.all()], [('self_score', 1)]
+            )
+            self.assertFalse(os.path.exists(self.app.config['HISTORY_JOURNAL_FAILED_PATH']))
+            self.assertEqual(history_journal.replay_failed(), 0)
+
+    def test_invalidation_bus_socket_transport(self):
+        import tempfile
+        import threading
+        directory = tempfile.mkdtemp()
+
+        buses, received = [], {}
+        for name in ('a', 'b'):
+            bus = InvalidationBus()
+            bus.origin = name
+            bus.transport = SocketBusTransport(bus, directory)
+            self.addCleanup(bus.stop)
+            done = threading.Event()
+            received[name] = (done, [])
+
+            def handler(key, name=name):
+                received[name][1].append(key)
+                received[name][0].set()
+            bus.register('skill_catalog', handler)
+            buses.append(bus)
+
+        #обработчик вызывается сразу в своем процессе и через сокет в другом
+        buses[0].invalidate('skill_catalog', 42)
+        self.assertEqual(received['a'][1], [42])
+        self.assertTrue(received['b'][0].wait(5))
+        self.assertEqual(received['b'][1], [42])
+        self.assertEqual(buses[0].stats()['sent'], 1)
+        self.assertEqual(buses[1].stats()['received'], 1)
+        self.assertEqual(buses[1].stats()['topics']['skill_catalog']['received'], 1)
+
+        #сокет завершившегося процесса удаляется при следующей отправке
+        import socket
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead.bind(os.path.join(directory, 'dead.sock'))
+        dead.close()
+        buses[0].invalidate('skill_catalog')
+        self.assertFalse(os.path.exists(os.path.join(directory, 'dead.sock')))
+        self.assertEqual(buses[0].stats()['send_errors'], 0)
+
+    def test_invalidation_bus_ttl_and_transactions(self):
+        calls = []
+        bus = InvalidationBus()
+        bus.register('departments', calls.append, ttl=0.05)
+
+        #пропущенное сообщение: тема сбрасывается целиком по запасному сроку
+        bus.expire_due()
+        self.assertEqual(calls, [])
+        time.sleep(0.1)
+        bus.expire_due()
+        self.assertEqual(calls, [None])
+        self.assertEqual(bus.stats()['expired'], 1)
+
+        with self.app.app_context():
+            User.query.first()
+            bus.invalidate('departments', 'Backend', session=db.session)
+            db.session.rollback()
+            self.assertEqual(calls, [None])
+
+            user = User.query.first()
+            bus.invalidate('departments', 'Backend', session=db.session)
+            user.full_name = 'Renamed'
+            self.assertEqual(calls, [None])
+
+        #отложенный сброс уходит общей шиной только после commit
+        with self.app.app_context():
+            skill_catalog.get()
+            User.query.first()
+            invalidation_bus.invalidate('skill_catalog', session=db.session)
+            self.assertTrue(skill_catalog.stats()['loaded'])
+            db.session.commit()
+            self.assertFalse(skill_catalog.stats()['loaded'])
+
+    def test_invalidation_bus_notifier_transport(self):
+        #шина поверх ChangeNotifier: тот же канал и транспорт, сообщение уходит с транзакцией
+        buses, received = [], {}
+        for name in ('worker-a', 'worker-b'):
+            bus = InvalidationBus()
+            bus.origin = name
+            bus.transport = NotifierBusTransport(bus)
+            self.addCleanup(bus.stop)
+            bus.register('departments', lambda key, name=name: received.setdefault(name, []).append(key))
+            buses.append(bus)
+
+        with self.app.app_context():
+            User.query.first()
+            buses[0].invalidate('departments', 'Backend', session=db.session)
+            self.assertEqual(received, {})
+            db.session.rollback()
+            self.assertEqual(received, {})
+
+            User.query.first()
+            buses[0].invalidate('departments', 'Backend', session=db.session)
+            self.assertEqual(len(db.session.info['notifier_messages']), 1)
+            db.session.commit()
+        self.assertEqual(received, {'worker-a': ['Backend'], 'worker-b': ['Backend']})
+        self.assertEqual(buses[0].stats()['sent'], 1)
+        self.assertEqual(buses[1].stats()['received'], 1)
+
+    def test_skill_catalog_remote_invalidation(self):
+        with self.app.app_context():
+            self.assertEqual(len(skill_catalog.get().skills), 2)
+            before = invalidation_bus.stats()['received']
+
+            #сообщение от другого процесса сбрасывает каталог, свое - пропускается
+            invalidation_bus.dispatch({'topic': 'skill_catalog', 'key': None, 'origin': invalidation_bus.origin})
+            self.assertTrue(skill_catalog.stats()['loaded'])
+            invalidation_bus.dispatch({'topic': 'skill_catalog', 'key': None, 'origin': 'other-worker'})
+            self.assertFalse(skill_catalog.stats()['loaded'])
+            self.assertEqual(invalidation_bus.stats()['received'], before + 1)
+
+        self.client.post('/login', json={'login': 'hr1', 'password': 'password123'})
+        data = self.client.get('/hr/api/hr/cache-stats').get_json()
+        self.assertEqual(data['invalidation']['transport'], 'local')
+
+if __name__ == '__main__':
+    unittest.main()
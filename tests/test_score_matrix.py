@@ -0,0 +1,328 @@
+import json
+import unittest
+from app import create_app, db
+from app.models import User, Department, Skill, SkillAssessment
+from app.utils.score_matrix import ScoreMatrix, get_score_matrix, score_matrix, _on_remote_change
+from app.utils.notifications import change_notifier
+from app.utils.talent import parse_talent_query, evaluate_with_matrix, evaluate_with_sql
+from app.utils.similarity import similarity_index, similar_users_sql
+from app.utils.reports import build_team_coverage
+from app.utils.assessments import upsert_assessments
+import random
+from werkzeug.security import generate_password_hash
+
+class ScoreMatrixTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SCORE_MATRIX_ENABLED'] = True
+
+        with self.app.app_context():
+            db.create_all()
+
+            #тестовые данные
+            backend = Department(name='Backend')
+            frontend = Department(name='Frontend')
+            db.session.add_all([backend, frontend])
+            db.session.commit()
+
+            users = [
+                User(login=f'user{i}', password_hash=generate_password_hash('password123'),
+                     role='employee', full_name=f'User {i}',
+                     department_id=backend.id if i < 2 else frontend.id)
+                for i in range(3)
+            ]
+            skills = [Skill(name='Python', category='Languages'), Skill(name='SQL', category='Databases')]
+            db.session.add_all(users + skills)
+            db.session.commit()
+
+            db.session.add_all([
+                SkillAssessment(user_id=users[0].id, skill_id=skills[0].id, self_score=4, manager_score=5),
+                SkillAssessment(user_id=users[1].id, skill_id=skills[0].id, self_score=3),
+                SkillAssessment(user_id=users[2].id, skill_id=skills[1].id, self_score=2, manager_score=1),
+            ])
+            db.session.commit()
+
+            self.user_ids = [u.id for u in users]
+            self.skill_ids = [s.id for s in skills]
+            self.backend_id = backend.id
+            self.frontend_id = frontend.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_load_and_group_stats(self):
+        with self.app.app_context():
+            matrix = get_score_matrix()
+            stats = matrix.group_stats(by='department', kind='final')
+            self.assertEqual(stats[self.backend_id], {'count': 2, 'mean': 4.0})
+            self.assertEqual(stats[self.frontend_id], {'count': 1, 'mean': 1.0})
+
+            self.assertEqual(matrix.skill_distribution(self.skill_ids[0]), [0, 0, 1, 0, 1])
+            self.assertEqual(matrix.row(self.user_ids[0], kind='self'), {self.skill_ids[0]: 4})
+            self.assertEqual(matrix.column(self.skill_ids[0], min_score=4), {self.user_ids[0]: 5})
+
+            #срезы считают итоговую оценку только для своей части и совпадают с полной матрицей
+            for kind in ('self', 'manager', 'final'):
+                full = matrix.scores(kind)
+                skill_ids, block = matrix.submatrix(self.user_ids[:2], kind)
+                rows = [matrix.user_index[user_id] for user_id in self.user_ids[:2]]
+                cols = [matrix.skill_index[skill_id] for skill_id in skill_ids]
+                self.assertEqual(block.tolist(), full[rows][:, cols].tolist())
+                for user_id in self.user_ids:
+                    values = full[matrix.user_index[user_id]]
+                    self.assertEqual(matrix.row(user_id, kind), {
+                        int(matrix.skill_ids[col]): int(values[col]) for col in values.nonzero()[0]
+                    })
+            col = matrix.skill_index[self.skill_ids[0]]
+            expected = (matrix.scores('final')[:, col] >= 4) & matrix.active[:matrix.n_users]
+            self.assertEqual(
+                matrix.bitmap_rows(matrix.bitmap(self.skill_ids[0], 4)).tolist(), expected.nonzero()[0].tolist()
+            )
+
+    def test_deltas_applied_after_commit(self):
+        with self.app.app_context():
+            matrix = get_score_matrix()
+
+            assessment = SkillAssessment.query.filter_by(user_id=self.user_ids[1]).first()
+            assessment.manager_score = 5
+            db.session.add(SkillAssessment(user_id=self.user_ids[2], skill_id=self.skill_ids[0], self_score=2))
+            db.session.flush()
+            #до commit матрица не меняется
+            self.assertEqual(matrix.row(self.user_ids[1]), {self.skill_ids[0]: 3})
+            db.session.commit()
+
+            self.assertEqual(matrix.row(self.user_ids[1]), {self.skill_ids[0]: 5})
+            self.assertEqual(matrix.skill_distribution(self.skill_ids[0]), [0, 1, 0, 0, 2])
+
+            #новый навык и пользователь расширяют матрицу
+            skill = Skill(name='Go', category='Languages')
+            db.session.add(skill)
+            db.session.commit()
+            db.session.add(SkillAssessment(user_id=self.user_ids[0], skill_id=skill.id, self_score=3))
+            db.session.commit()
+            self.assertEqual(matrix.row(self.user_ids[0])[skill.id], 3)
+
+            fresh = ScoreMatrix().load()
+            for user_id in self.user_ids:
+                self.assertEqual(fresh.row(user_id), matrix.row(user_id))
+
+    def test_remote_deltas_and_deltas_during_load(self):
+        published = []
+
+        def collect(payload):
+            published.append(payload.get('score_matrix'))
+        change_notifier.add_listener(collect)
+        try:
+            with self.app.app_context():
+                matrix = get_score_matrix()
+                assessment = SkillAssessment.query.filter_by(user_id=self.user_ids[1]).first()
+                assessment.manager_score = 4
+                db.session.commit()
+                self.assertIn([['assessment', [self.user_ids[1], self.skill_ids[0], self.user_ids[1],
+                                               self.skill_ids[0], 3, 4]]],
+                              [json.loads(json.dumps(p)) for p in published if p])
+
+                #дельта из другого процесса применяется без перезагрузки
+                _on_remote_change({'pid': -1, 'score_matrix': [
+                    ['assessment', [self.user_ids[2], self.skill_ids[0], self.user_ids[2], self.skill_ids[0], 1, 2]]
+                ]})
+                self.assertFalse(matrix.stale)
+                self.assertEqual(matrix.row(self.user_ids[2])[self.skill_ids[0]], 2)
+
+                _on_remote_change({'pid': -1, 'score_matrix': None})
+                self.assertTrue(matrix.stale)
+
+                #дельта, пришедшая во время чтения, не теряется
+                def load_with_concurrent_commit():
+                    matrix.apply_deltas([('assessment', (self.user_ids[0], self.skill_ids[1],
+                                                         self.user_ids[0], self.skill_ids[1], 3, None))])
+                    ScoreMatrix._load(matrix)
+                matrix._load = load_with_concurrent_commit
+                try:
+                    matrix = get_score_matrix()
+                finally:
+                    del matrix._load
+                self.assertEqual(matrix.row(self.user_ids[0])[self.skill_ids[1]], 3)
+                self.assertNotIn(self.skill_ids[0], matrix.row(self.user_ids[2]))
+        finally:
+            change_notifier.remove_listener(collect)
+
+    def test_talent_query_bitmaps_match_sql(self):
+        with self.app.app_context():
+            extra_skills = [Skill(name=name, category='Messaging') for name in ('Kafka', 'RabbitMQ')]
+            db.session.add_all(extra_skills)
+            db.session.commit()
+            skill_ids = self.skill_ids + [skill.id for skill in extra_skills]
+
+            rng = random.Random(7)
+            for i in range(40):
+                user = User(login=f'talent{i}', password_hash='x', role=rng.choice(['employee', 'manager']),
+                            full_name=f'Talent {i}', department_id=rng.choice([self.backend_id, self.frontend_id]))
+                db.session.add(user)
+                db.session.flush()
+                for skill_id in skill_ids:
+                    if rng.random() < 0.7:
+                        db.session.add(SkillAssessment(
+                            user_id=user.id, skill_id=skill_id,
+                            self_score=rng.randint(1, 5),
+                            manager_score=rng.choice([None, rng.randint(1, 5)])
+                        ))
+            db.session.commit()
+
+            queries = [
+                {'all': [{'skill': 'Python', 'min_score': 4}, {'skill': 'sql', 'min_score': 3},
+                         {'any': ['Kafka', 'RabbitMQ'], 'min_score': 3}]},
+                {'any': [{'skill_id': skill_ids[0], 'min_score': 5}, {'not': {'skill': 'Kafka'}}]},
+                'RabbitMQ',
+            ]
+            filters = [{}, {'department_id': self.backend_id}, {'role': 'manager'}]
+
+            def check():
+                matrix = get_score_matrix()
+                for query in queries:
+                    expression = parse_talent_query(query)
+                    for extra in filters:
+                        self.assertEqual(
+                            evaluate_with_matrix(matrix, expression, limit=500, **extra),
+                            evaluate_with_sql(expression, limit=500, **extra)
+                        )
+
+            check()
+
+            #карты обновляются вместе с оценками
+            for assessment in SkillAssessment.query.filter(SkillAssessment.skill_id.in_(skill_ids[:2])).limit(15):
+                assessment.manager_score = rng.randint(1, 5)
+            db.session.delete(SkillAssessment.query.filter_by(skill_id=skill_ids[2]).first())
+            newcomer = User(login='newcomer', password_hash='x', role='employee', full_name='Newcomer',
+                            department_id=self.backend_id)
+            db.session.add(newcomer)
+            db.session.flush()
+            db.session.add_all([
+                SkillAssessment(user_id=newcomer.id, skill_id=skill_id, self_score=5) for skill_id in skill_ids
+            ])
+            db.session.commit()
+            self.assertFalse(score_matrix.stale)
+            check()
+
+            with self.assertRaises(ValueError):
+                parse_talent_query({'all': [{'skill': 'COBOL'}]})
+            with self.assertRaises(ValueError):
+                parse_talent_query({'skill': 'Python', 'min_score': 9})
+
+        client = self.app.test_client()
+        client.post('/login', json={'login': 'user0', 'password': 'password123'})
+        with self.app.app_context():
+            User.query.get(self.user_ids[0]).role = 'hr'
+            db.session.commit()
+        response = client.post('/hr/api/talent-query', json={'query': queries[0], 'limit': 5})
+        data = response.get_json()
+        self.assertEqual(data['engine'], 'bitmap')
+        totals = [user['total_score'] for user in data['users']]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+        self.assertLessEqual(len(data['users']), 5)
+        self.assertEqual(client.post('/hr/api/talent-query', json={'query': {'foo': 1}}).status_code, 400)
+        for query in ({'skill_id': ['1']}, {'skill_id': '1'}, {'skill': 5}, {'all': [{'skill_id': {}}]}):
+            self.assertEqual(client.post('/hr/api/talent-query', json={'query': query}).status_code, 400)
+
+    def test_similar_users_match_sql(self):
+        with self.app.app_context():
+            rng = random.Random(11)
+            for i in range(30):
+                user = User(login=f'similar{i}', password_hash='x', role='employee', full_name=f'Similar {i}',
+                            department_id=rng.choice([self.backend_id, self.frontend_id]))
+                db.session.add(user)
+                db.session.flush()
+                for skill_id in self.skill_ids:
+                    if rng.random() < 0.8:
+                        db.session.add(SkillAssessment(
+                            user_id=user.id, skill_id=skill_id,
+                            self_score=rng.randint(1, 5), manager_score=rng.choice([None, rng.randint(1, 5)])
+                        ))
+            db.session.commit()
+
+            def check(user_id, department_id=None):
+                matrix = get_score_matrix()
+                expected = similar_users_sql(user_id, 100, department_id)
+                found = similarity_index.similar(matrix, user_id, 100, department_id)
+                self.assertEqual(
+                    {similar_id: (round(value, 3), common) for similar_id, value, common in found},
+                    {similar_id: (round(value, 3), common) for similar_id, value, common in expected}
+                )
+                values = [value for _, value, _ in found]
+                self.assertEqual(values, sorted(values, reverse=True))
+                self.assertNotIn(user_id, [similar_id for similar_id, _, _ in found])
+                return found
+
+            check(self.user_ids[0])
+            check(self.user_ids[2], self.frontend_id)
+
+            #измененные строки пересчитываются, новый навык перестраивает индекс
+            assessment = SkillAssessment.query.filter_by(user_id=self.user_ids[2]).first()
+            assessment.manager_score = 5
+            go = Skill(name='Go', category='Languages')
+            db.session.add(go)
+            db.session.commit()
+            db.session.add(SkillAssessment(user_id=self.user_ids[0], skill_id=go.id, self_score=4))
+            db.session.commit()
+            check(self.user_ids[0])
+            found = check(self.user_ids[2])
+            self.assertEqual(found[0][1], 1.0)
+
+        client = self.app.test_client()
+        client.post('/login', json={'login': 'user0', 'password': 'password123'})
+        self.assertEqual(client.get(f'/hr/api/users/{self.user_ids[1]}/similar').status_code, 403)
+        with self.app.app_context():
+            User.query.get(self.user_ids[0]).role = 'hr'
+            db.session.commit()
+        data = client.get(f'/hr/api/users/{self.user_ids[1]}/similar?k=3').get_json()
+        self.assertEqual(data['engine'], 'matrix')
+        self.assertEqual(len(data['similar']), 3)
+        self.assertEqual(data['similar'][0]['similarity'], 1.0)
+        self.assertEqual(data['similar'][0]['common_skills'], 1)
+        self.assertEqual(client.get('/hr/api/users/999999/similar').status_code, 404)
+
+    def test_team_coverage_matrix_matches_sql(self):
+        with self.app.app_context():
+            rng = random.Random(5)
+            for i in range(25):
+                user = User(login=f'coverage{i}', password_hash='x', role='employee', full_name=f'Coverage {i}',
+                            department_id=rng.choice([self.backend_id, self.frontend_id, None]))
+                db.session.add(user)
+                db.session.flush()
+                for skill_id in self.skill_ids:
+                    if rng.random() < 0.5:
+                        db.session.add(SkillAssessment(
+                            user_id=user.id, skill_id=skill_id,
+                            self_score=rng.randint(1, 5), manager_score=rng.choice([None, rng.randint(1, 5)])
+                        ))
+            db.session.commit()
+
+            matrix = get_score_matrix()
+            self.assertEqual(build_team_coverage(matrix=matrix), build_team_coverage())
+            self.assertEqual(
+                build_team_coverage(self.frontend_id, matrix), build_team_coverage(self.frontend_id)
+            )
+
+    def test_batch_upsert_updates_matrix(self):
+        with self.app.app_context():
+            matrix = get_score_matrix()
+            saved = upsert_assessments(db.session, self.user_ids[1], 'manager_score', {
+                self.skill_ids[0]: 4, self.skill_ids[1]: 2
+            })
+            self.assertEqual(len(saved), 2)
+            #до commit матрица не меняется
+            self.assertEqual(matrix.row(self.user_ids[1]), {self.skill_ids[0]: 3})
+            db.session.commit()
+
+            self.assertEqual(matrix.row(self.user_ids[1]), {self.skill_ids[0]: 4, self.skill_ids[1]: 2})
+            fresh = ScoreMatrix().load()
+            for user_id in self.user_ids:
+                for kind in ('self', 'manager', 'final'):
+                    self.assertEqual(fresh.row(user_id, kind=kind), matrix.row(user_id, kind=kind))
+
+if __name__ == '__main__':
+    unittest.main()
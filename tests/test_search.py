@@ -0,0 +1,444 @@
+import unittest
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Department, Skill, SkillAssessment
+from werkzeug.security import generate_password_hash
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+            backend = Department(name='Backend')
+            frontend = Department(name='Frontend')
+            db.session.add_all([backend, frontend])
+            db.session.commit()
+
+            hr = User(
+                login='hr1',
+                password_hash=generate_password_hash('password123'),
+                role='hr',
+                full_name='HR One',
+                department_id=frontend.id
+            )
+            manager = User(
+                login='manager1',
+                password_hash=generate_password_hash('password123'),
+                role='manager',
+                full_name='Manager One',
+                department_id=backend.id
+            )
+            db.session.add_all([hr, manager])
+
+            python = Skill(name='Python', category='Programming Languages')
+            db.session.add(python)
+            db.session.commit()
+
+            self.hr_id = hr.id
+            self.manager_id = manager.id
+            self.backend_id = backend.id
+            self.frontend_id = frontend.id
+            self.python_id = python.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self, login):
+        return self.client.post('/login', json={'login': login, 'password': 'password123'})
+
+    def add_employees(self, count, start=0):
+        """Сотрудники с оценками Python: оценки 1..5 по кругу, отделы через одного"""
+        with self.app.app_context():
+            for i in range(start, start + count):
+                user = User(
+                    login=f'employee{i}',
+                    password_hash='x',
+                    role='employee',
+                    full_name=f'Employee {i}',
+                    department_id=self.backend_id if i % 2 == 0 else self.frontend_id
+                )
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(SkillAssessment(
+                    user_id=user.id,
+                    skill_id=self.python_id,
+                    self_score=i % 5 + 1,
+                    manager_score=(i % 5 + 1) if i % 3 == 0 else None
+                ))
+            db.session.commit()
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    def test_search_by_skills_pagination(self):
+        self.add_employees(12)
+        self.login('hr1')
+
+        response = self.client.get('/hr/search-by-skills?skill=pyth&min_score=2&limit=5&include_total=1')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['total_found'], 9)
+        self.assertEqual(len(data['users']), 5)
+
+        users = data['users']
+        while data['next_cursor']:
+            data = self.client.get(
+                f'/hr/search-by-skills?skill=pyth&min_score=2&limit=5&cursor={data["next_cursor"]}'
+            ).get_json()
+            self.assertIsNone(data['total_found'])
+            users.extend(data['users'])
+
+        self.assertEqual(len(users), 9)
+        self.assertEqual(len({user['id'] for user in users}), 9)
+        keys = [(-user['final_score'], user['id']) for user in users]
+        self.assertEqual(keys, sorted(keys))
+        self.assertTrue(all(user['final_score'] >= 2 for user in users))
+        self.assertTrue(all(user['department'] in ('Backend', 'Frontend') for user in users))
+
+        self.assertEqual(self.client.get('/hr/search-by-skills?skill=pyth&cursor=broken').status_code, 400)
+
+    def test_search_by_skills_manager_scope(self):
+        self.add_employees(6)
+        self.login('manager1')
+
+        data = self.client.get('/hr/search-by-skills?skill=Python&include_total=1').get_json()
+        self.assertEqual(data['total_found'], 3)
+        self.assertTrue(all(user['department'] == 'Backend' for user in data['users']))
+
+    def test_search_by_skills_query_count(self):
+        self.add_employees(3)
+        self.login('hr1')
+
+        url = '/hr/search-by-skills?skill=Python&include_total=1'
+        #прогрев индекса поиска навыков
+        self.client.get(url)
+        with self.count_queries() as few:
+            self.assertEqual(len(self.client.get(url).get_json()['users']), 3)
+
+        self.add_employees(40, start=3)
+        with self.count_queries() as many:
+            self.assertEqual(len(self.client.get(url).get_json()['users']), 43)
+
+        #число запросов не зависит от количества найденных сотрудников
+        self.assertEqual(len(few), len(many))
+
+    def test_search_users_fuzzy(self):
+        with self.app.app_context():
+            db.session.add_all([
+                User(login='ivanov', password_hash='x', role='employee',
+                     full_name='Иванов Иван Петрович', department_id=self.backend_id),
+                User(login='fedorov', password_hash='x', role='employee',
+                     full_name='Фёдоров Семён', department_id=self.frontend_id),
+                User(login='smith', password_hash='x', role='employee',
+                     full_name='John Smith', department_id=self.frontend_id),
+            ])
+            db.session.commit()
+        self.login('hr1')
+
+        #опечатка
+        users = self.client.get('/hr/api/search-users?q=Иванв').get_json()['users']
+        self.assertEqual([user['login'] for user in users], ['ivanov'])
+
+        #регистр и ё/е
+        users = self.client.get('/hr/api/search-users?q=ФЕДОРОВ').get_json()['users']
+        self.assertEqual([user['login'] for user in users], ['fedorov'])
+        users = self.client.get('/hr/api/search-users?q=семен').get_json()['users']
+        self.assertEqual([user['login'] for user in users], ['fedorov'])
+
+        #подстрока в логине и фильтр по отделу
+        users = self.client.get('/hr/api/search-users?q=mit').get_json()['users']
+        self.assertEqual([user['login'] for user in users], ['smith'])
+        users = self.client.get('/hr/api/search-users?q=ov&department=Backend').get_json()['users']
+        self.assertEqual([user['login'] for user in users], ['ivanov'])
+
+        #новый пользователь попадает в индекс после commit
+        with self.app.app_context():
+            db.session.add(User(login='smirnova', password_hash='x', role='employee', full_name='Смирнова Анна'))
+            db.session.commit()
+        users = self.client.get('/hr/api/search-users?q=смирнва').get_json()['users']
+        self.assertEqual([user['login'] for user in users], ['smirnova'])
+
+    def test_search_by_skills_typo(self):
+        self.add_employees(2)
+        self.login('hr1')
+
+        data = self.client.get('/hr/search-by-skills?skill=Pythn&include_total=1').get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['skill']['category'], 'Programming Languages')
+        self.assertEqual(data['total_found'], 2)
+
+        self.assertEqual(self.client.get('/hr/search-by-skills?skill=Haskell').status_code, 404)
+
+    def test_skill_autocomplete(self):
+        self.login('hr1')
+
+        def names(query):
+            return [skill['name'] for skill in self.client.get(f'/api/skills/search?q={query}').get_json()]
+
+        self.assertEqual(names('PYT'), ['Python'])
+        self.assertEqual(names('program'), ['Python'])
+        self.assertEqual(names('lang'), ['Python'])
+        self.assertEqual(names(''), [])
+
+        #создание, изменение и удаление сразу видны в индексе
+        response = self.client.post('/skill/api/skills', json={'name': 'Ёмкостное планирование', 'category': 'Управление'})
+        skill_id = response.get_json()['skill']['id']
+        self.assertEqual(names('емк'), ['Ёмкостное планирование'])
+        self.assertEqual(names('план'), ['Ёмкостное планирование'])
+
+        self.client.put(f'/api/skills/{skill_id}', json={'name': 'Capacity planning'})
+        self.assertEqual(names('емк'), [])
+        self.assertEqual(names('cap'), ['Capacity planning'])
+
+        self.client.delete(f'/skill/api/skills/{skill_id}')
+        self.assertEqual(names('cap'), [])
+
+    def test_my_team_pagination(self):
+        self.add_employees(12)
+        self.login('manager1')
+
+        self.assertEqual(self.client.get('/user/my-team').status_code, 200)
+
+        data = self.client.get('/user/api/my-team?sort=-avg_self_score&limit=4').get_json()
+        members = data['members']
+        while data['next_cursor']:
+            data = self.client.get(
+                f'/user/api/my-team?sort=-avg_self_score&limit=4&cursor={data["next_cursor"]}'
+            ).get_json()
+            members.extend(data['members'])
+
+        #только отдел руководителя, без него самого
+        self.assertEqual(len(members), 6)
+        self.assertNotIn(self.manager_id, [member['id'] for member in members])
+        self.assertTrue(all(member['assessments_count'] == 1 for member in members))
+        keys = [(-member['avg_self_score'], member['id']) for member in members]
+        self.assertEqual(keys, sorted(keys))
+
+        names = [member['full_name'] for member in self.client.get('/user/api/my-team').get_json()['members']]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(self.client.get('/user/api/my-team?sort=password_hash').status_code, 400)
+
+        #число запросов не зависит от размера команды
+        with self.count_queries() as few:
+            self.client.get('/user/my-team')
+        self.add_employees(40, start=12)
+        with self.count_queries() as many:
+            self.client.get('/user/my-team')
+        self.assertEqual(len(few), len(many))
+
+    def test_profile_lazy_categories(self):
+        self.add_employees(2)
+        with self.app.app_context():
+            backend_employee = User.query.filter_by(login='employee0').first().id
+            frontend_employee = User.query.filter_by(login='employee1').first().id
+            db.session.add(Skill(name='Teamwork', category='Soft Skills'))
+            db.session.commit()
+        self.login('manager1')
+
+        #страница отдает только сводку по категориям, без навыков
+        page = self.client.get(f'/user/employee/{backend_employee}').get_data(as_text=True)
+        self.assertIn('data-category="Programming Languages"', page)
+        self.assertIn('Оценено 1 из 1', page)
+        self.assertNotIn('data-skill-id', page)
+
+        data = self.client.get(
+            f'/user/api/profile/{backend_employee}/category/Programming Languages'
+        ).get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual([skill['name'] for skill in data['skills']], ['Python'])
+        self.assertEqual(data['skills'][0]['self_score'], 1)
+        self.assertIn(f'data-skill-id="{self.python_id}"', data['html'])
+
+        self.assertEqual(self.client.get(f'/user/api/profile/{backend_employee}/category/Unknown').status_code, 404)
+        self.assertEqual(self.client.get(f'/user/api/profile/{frontend_employee}/category/Soft Skills').status_code, 403)
+
+        #график берет только оцененные навыки
+        chart = self.client.get(f'/user/api/employee/{backend_employee}/skills-data').get_json()
+        self.assertEqual(chart['skill_ids'], [self.python_id])
+
+        own = self.client.get('/user/profile').get_data(as_text=True)
+        self.assertIn('data-category="Soft Skills"', own)
+        data = self.client.get(f'/user/api/profile/{self.manager_id}/category/Soft Skills').get_json()
+        self.assertIn('Не оценено', data['html'])
+
+        #число запросов страницы не зависит от размера каталога
+        with self.count_queries() as few:
+            self.client.get('/user/profile')
+        with self.app.app_context():
+            db.session.add_all([Skill(name=f'Skill {i}', category=f'Category {i % 5}') for i in range(50)])
+            db.session.commit()
+        with self.count_queries() as many:
+            self.client.get('/user/profile')
+        self.assertEqual(len(few), len(many))
+
+    def test_chart_data_compact(self):
+        self.add_employees(1)
+        with self.app.app_context():
+            employee_id = User.query.filter_by(login='employee0').first().id
+        self.login('manager1')
+        url = f'/user/api/employee/{employee_id}/skills-data'
+
+        small = self.client.get(url).get_data()
+
+        #каталог в 2000 навыков: ряд по-прежнему содержит только оцененные навыки
+        with self.app.app_context():
+            db.session.add_all([Skill(name=f'Skill {i}', category=f'Category {i % 20}') for i in range(2000)])
+            db.session.commit()
+        response = self.client.get(url)
+        data = response.get_json()
+        self.assertEqual(data['skill_ids'], [self.python_id])
+        self.assertEqual(data['self_scores'], [1])
+        self.assertEqual(data['manager_scores'], [1])
+        self.assertLessEqual(len(response.get_data()), len(small) + 5)
+
+        #словарь названий отдается отдельно и проверяется по ETag
+        labels = self.client.get('/skill/api/skills/labels')
+        self.assertEqual(labels.get_json()['version'], data['labels_version'])
+        self.assertEqual(labels.get_json()['skills'][str(self.python_id)], ['Python', 'Programming Languages'])
+        self.assertEqual(len(labels.get_json()['skills']), 2001)
+        cached = self.client.get('/skill/api/skills/labels', headers={'If-None-Match': labels.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+        #ряд кэшируется по версии оценок: новая оценка видна сразу
+        hits = self.app.extensions['chart_cache'].stats()['hits']
+        self.client.get(url)
+        self.assertEqual(self.app.extensions['chart_cache'].stats()['hits'], hits + 1)
+        self.client.post(f'/user/api/employee/{employee_id}/assessments/batch',
+                         json={'assessments': [{'skill_id': self.python_id, 'score': 4}]})
+        self.assertEqual(self.client.get(url).get_json()['manager_scores'], [4])
+
+        #оценки других сотрудников ключ ряда не меняют
+        hits = self.app.extensions['chart_cache'].stats()['hits']
+        with self.app.app_context():
+            manager_id = User.query.filter_by(login='manager1').first().id
+            db.session.add(SkillAssessment(user_id=manager_id, skill_id=self.python_id, self_score=3))
+            db.session.commit()
+        self.assertEqual(self.client.get(url).get_json()['manager_scores'], [4])
+        self.assertEqual(self.app.extensions['chart_cache'].stats()['hits'], hits + 1)
+
+        self.assertEqual(self.client.get(f'{url}?format=xml').status_code, 406)
+        try:
+            import msgpack
+        except ImportError:
+            return
+        packed = self.client.get(f'{url}?format=msgpack')
+        self.assertEqual(packed.mimetype, 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(packed.get_data())['skill_ids'], [self.python_id])
+
+    def test_skill_catalog_cache(self):
+        self.add_employees(3)
+        self.login('hr1')
+
+        response = self.client.get('/skill/api/skills')
+        data = response.get_json()
+        self.assertEqual([(skill['name'], skill['assessments_count']) for skill in data['skills']], [('Python', 3)])
+        version = data['version']
+
+        #повторные запросы берут каталог из памяти, без запросов к навыкам и оценкам
+        with self.count_queries() as statements:
+            self.client.get('/skill/api/skills')
+            self.client.get('/api/skills')
+            self.client.get('/skill/skills')
+        self.assertFalse([statement for statement in statements if 'skill_assessments' in statement])
+        cached = self.client.get('/skill/api/skills', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+        #создание, изменение и удаление через оба API сбрасывают каталог
+        skill_id = self.client.post('/skill/api/skills', json={'name': 'Go', 'category': 'Programming Languages'}).get_json()['skill']['id']
+        data = self.client.get('/skill/api/skills').get_json()
+        self.assertNotEqual(data['version'], version)
+        self.assertEqual([skill['name'] for skill in data['skills']], ['Go', 'Python'])
+
+        self.client.put(f'/api/skills/{skill_id}', json={'name': 'Golang'})
+        response = self.client.get('/api/skills')
+        self.assertEqual(sorted(skill['name'] for skill in response.get_json()), ['Golang', 'Python'])
+        self.assertEqual(response.headers['X-Catalog-Version'], self.client.get('/skill/api/skills').get_json()['version'])
+
+        self.client.delete(f'/api/skills/{skill_id}')
+        self.assertEqual([skill['name'] for skill in self.client.get('/api/skills').get_json()], ['Python'])
+
+        #новая оценка меняет число оценок и ETag, но не версию каталога и не перечитывает навыки
+        response = self.client.get('/skill/api/skills')
+        version = response.get_json()['version']
+        loads = self.app.extensions['skill_catalog'].stats()['loads']
+        with self.app.app_context():
+            db.session.add(SkillAssessment(user_id=self.manager_id, skill_id=self.python_id, self_score=3))
+            db.session.commit()
+        changed = self.client.get('/skill/api/skills', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json()['skills'][0]['assessments_count'], 4)
+        self.assertEqual(changed.get_json()['version'], version)
+        self.assertEqual(self.app.extensions['skill_catalog'].stats()['loads'], loads)
+        self.assertIn('4 оценок', self.client.get('/skill/skills').get_data(as_text=True))
+
+    def test_skill_import(self):
+        self.login('hr1')
+        csv_data = (
+            'name,category,description\n'
+            'Python,Programming Languages,Язык общего назначения\n'
+            'Go,Programming Languages,\n'
+            'X,Programming Languages,\n'
+            'Go,Programming Languages,Повтор\n'
+        )
+
+        #разбор без записи
+        data = self.client.post('/skill/api/skills/import', data=csv_data, content_type='text/csv').get_json()
+        self.assertTrue(data['dry_run'])
+        self.assertEqual(data['summary'], {'new': 1, 'changed': 1, 'unchanged': 0, 'errors': 2})
+        self.assertEqual(data['changed'][0]['old_description'], '')
+        self.assertEqual([error['row'] for error in data['errors']], [3, 4])
+
+        #с ошибками импорт не выполняется целиком
+        response = self.client.post('/skill/api/skills/import?apply=1', data=csv_data, content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        with self.app.app_context():
+            self.assertEqual(Skill.query.count(), 1)
+
+        #10 тысяч навыков одним запросом
+        skills = [{'name': f'Skill {i}', 'category': f'Framework {i % 50}', 'description': ''} for i in range(10000)]
+        skills.append({'name': 'Python', 'category': 'Programming Languages', 'description': 'Язык'})
+        with self.count_queries() as statements:
+            data = self.client.post('/skill/api/skills/import?apply=1', json={'skills': skills}).get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['created'], data['updated']), (10000, 1))
+        self.assertLess(len(statements), 30)
+
+        with self.app.app_context():
+            self.assertEqual(Skill.query.count(), 10001)
+            self.assertEqual(Skill.query.get(self.python_id).description, 'Язык')
+
+        #каталог и автодополнение видят импорт сразу
+        self.assertEqual(self.client.get('/skill/api/skills').get_json()['total'], 10001)
+        names = [skill['name'] for skill in self.client.get('/api/skills/search?q=skill 9999').get_json()]
+        self.assertEqual(names, ['Skill 9999'])
+
+        data = self.client.post('/skill/api/skills/import', json=skills).get_json()
+        self.assertEqual(data['summary'], {'new': 0, 'changed': 0, 'unchanged': 10001, 'errors': 0})
+
+        self.client = self.app.test_client()
+        self.login('manager1')
+        self.assertEqual(self.client.post('/skill/api/skills/import', json=skills).status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()